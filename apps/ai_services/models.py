@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from apps.expenses.models import Expense
 
 
@@ -16,6 +17,8 @@ class AIExtraction(models.Model):
     confidence_score = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
     extraction_method = models.CharField(max_length=50, choices=EXTRACTION_METHODS)
     processed_at = models.DateTimeField(auto_now_add=True)
+    # Extraction decisions, kept for sampled requests (see apps/expenses/extraction_trace.py)
+    trace = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
     
     class Meta:
         db_table = 'AI_EXTRACTION'
@@ -1,8 +1,11 @@
 import json
 from datetime import timedelta
-from django.db.models import Sum
 from django.utils import timezone
+from apps.core.currency_rates import rate_snapshot
+from apps.core.money import from_minor, to_minor
+from apps.core.templatetags.user_formatting import format_currency_string
 from apps.expenses.models import Expense
+from apps.expenses.totals import converted_totals
 from apps.budgets.models import Budget
 from .models import AIInsight
 
@@ -13,11 +16,14 @@ def generate_weekly_summary(user):
     today = timezone.now().date()
     start_week = today - timedelta(days=7)
     
+    preferences = getattr(user, 'preferences', None)
+    currency = preferences.currency if preferences else 'USD'
+
+    # In the user's currency, summed in SQL
     expenses = Expense.objects.filter(user=user, expense_date__gte=start_week)
-    total_spent = expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    cat_stats = expenses.values('category__category_name').annotate(total=Sum('amount'))
+    cat_stats = converted_totals(expenses, currency, group_by=['category__category_name'])
     breakdown = {item['category__category_name']: float(item['total']) for item in cat_stats}
+    total_spent = from_minor(sum(item['total_minor'] for item in cat_stats), currency)
     
     insight_data = {
         "total_spent": float(total_spent),
@@ -30,7 +36,7 @@ def generate_weekly_summary(user):
         user=user,
         insight_type='weekly_summary',
         insight_data=json.dumps(insight_data), # Store as JSON string
-        message=f"You spent ${total_spent} this week. Check your breakdown!",
+        message=f"You spent {format_currency_string(total_spent, currency)} this week. Check your breakdown!",
         period_start=start_week,
         period_end=today
     )
@@ -43,16 +49,21 @@ def check_budget_alerts(user):
     active_budgets = Budget.objects.filter(user=user, start_date__lte=today, end_date__gte=today)
     
     generated_alerts = [] # Store messages here
+    rates = rate_snapshot()
     
     for budget in active_budgets:
-        spent = Expense.objects.filter(
+        # In the budget's currency, summed in SQL
+        spent = converted_totals(Expense.objects.filter(
             user=user, 
             category=budget.category,
             expense_date__gte=budget.start_date,
             expense_date__lte=budget.end_date
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        ), budget.currency, snapshot=rates)[0]
+        limit_minor = to_minor(budget.budget_limit, budget.currency)
+        if limit_minor <= 0:
+            continue
         
-        percentage = (spent / budget.budget_limit) * 100
+        percentage = spent['total_minor'] * 100 / limit_minor
         
         if percentage >= budget.alert_threshold:
             message = f"⚠️ Budget Alert: You've used {int(percentage)}% of your {budget.category.category_name} budget!"
@@ -60,7 +71,7 @@ def check_budget_alerts(user):
             data = {
                 "category": budget.category.category_name,
                 "budget_limit": float(budget.budget_limit),
-                "current_spent": float(spent),
+                "current_spent": float(spent['total']),
                 "percentage_used": round(float(percentage), 1)
             }
             
@@ -1,11 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum
 from django.utils import timezone
 from .models import Budget
 from .forms import BudgetForm
 from apps.expenses.models import Expense
+from apps.expenses.totals import converted_totals
+from apps.core.currency_rates import rate_snapshot
+from apps.core.money import from_minor, to_minor
 
 @login_required
 def budget_list(request):
@@ -19,12 +21,13 @@ def budget_list(request):
     budget_data = []
     for budget in budgets:
         # 2. CALCULATE SPENDING
-        spent = Expense.objects.filter(
+        spent = converted_totals(Expense.objects.filter(
             user=request.user,
             category=budget.category,
             expense_date__gte=budget.start_date,
             expense_date__lte=budget.end_date
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        ), budget.currency, snapshot=rate_snapshot(request))[0]
+        limit_minor = to_minor(budget.budget_limit, budget.currency)
         
         # 3. CALCULATE STATUS
         if budget.end_date < today:
@@ -37,12 +40,12 @@ def budget_list(request):
             status = 'Active'
             status_color = 'success'
 
-        percentage = (spent / budget.budget_limit) * 100 if budget.budget_limit > 0 else 0
-        remaining = budget.budget_limit - spent
+        percentage = spent['total_minor'] * 100 / limit_minor if limit_minor > 0 else 0
+        remaining = from_minor(limit_minor - spent['total_minor'], budget.currency)
         
         budget_data.append({
             'budget': budget,
-            'spent': spent,
+            'spent': spent['total'],
             'remaining': remaining,
             'percentage': round(percentage, 1),
             'is_alert': percentage >= budget.alert_threshold,
@@ -0,0 +1,123 @@
+# apps/categories/index.py
+#
+# In-memory index of a user's categories, so smart input can resolve
+# category names without a query per keyword family. Each user has a
+# version token in the cache; Category save/delete signals replace it
+# (see signals.py) and indexes built for an older token are rebuilt.
+# A process reads the token at most once per CATEGORY_INDEX_VERSION_TTL
+# seconds per user, so a change made in another process shows up within
+# that time; one made in this process shows up at once.
+
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+FALLBACK_CATEGORY_NAME = 'Uncategorized'
+
+_TOKEN = re.compile(r'\w+')
+
+_local = OrderedDict()  # user_id -> [version, checked_at, index]
+_local_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f"category_index_version:{user_id}"
+
+
+class CategoryIndex:
+    """
+    Snapshot of one user's categories.
+
+    ``find(word)`` answers what
+    ``Category.objects.filter(user=user, category_name__icontains=word).first()``
+    would: the oldest category whose name contains ``word``, ignoring case.
+    Answers for every normalised name token are worked out when the index
+    is built; other words fall back to a scan of the (few) names.
+    """
+
+    def __init__(self, categories):
+        self.categories = sorted(categories, key=lambda c: c.pk)
+        self._by_pk = {c.pk: c for c in self.categories}
+        self._names = [(c.category_name.lower(), c) for c in self.categories]
+        self.fallback = next(
+            (c for c in self.categories if c.category_name == FALLBACK_CATEGORY_NAME), None
+        )
+
+        self._by_word = {}
+        for name, _category in self._names:
+            for token in _TOKEN.findall(name):
+                if token not in self._by_word:
+                    self._by_word[token] = self._scan(token)
+
+    def _scan(self, word):
+        for name, category in self._names:
+            if word in name:
+                return category
+        return None
+
+    def get(self, pk):
+        return self._by_pk.get(pk)
+
+    def find(self, word):
+        word = word.lower()
+        try:
+            return self._by_word[word]
+        except KeyError:
+            return self._scan(word)
+
+
+def category_index_version(user_id):
+    """The user's current version token; it changes whenever a category does."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = invalidate_category_index(user_id)
+    return version
+
+
+def get_category_index(user):
+    """The user's CategoryIndex, built from the database when out of date."""
+    return category_index_for(user.pk)
+
+
+def category_index_for(user_id):
+    """get_category_index by user id, for callers without the User loaded."""
+    ttl = getattr(settings, 'CATEGORY_INDEX_VERSION_TTL', 5)
+
+    with _local_lock:
+        entry = _local.get(user_id)
+        if entry is not None and time.monotonic() - entry[1] < ttl:
+            _local.move_to_end(user_id)
+            return entry[2]
+
+    version = category_index_version(user_id)
+    with _local_lock:
+        entry = _local.get(user_id)
+        if entry is not None and entry[0] == version:
+            entry[1] = time.monotonic()
+            _local.move_to_end(user_id)
+            return entry[2]
+
+    from .models import Category
+    index = CategoryIndex(Category.objects.filter(user_id=user_id))
+
+    size = getattr(settings, 'CATEGORY_INDEX_LOCAL_SIZE', 256)
+    with _local_lock:
+        _local[user_id] = [version, time.monotonic(), index]
+        _local.move_to_end(user_id)
+        while len(_local) > size:
+            _local.popitem(last=False)
+    return index
+
+
+def invalidate_category_index(user_id):
+    """Give the user a new version token; returns it."""
+    version = uuid.uuid4().hex
+    cache.set(_version_key(user_id), version, None)
+    with _local_lock:
+        _local.pop(user_id, None)
+    return version
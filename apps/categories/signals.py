@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .index import invalidate_category_index
+from .models import Category
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_user_category_index(sender, instance, **kwargs):
+    """Drop the owner's category index now and again once the change is committed."""
+    user_id = instance.user_id
+    invalidate_category_index(user_id)
+    # Another process may rebuild from the pre-commit rows in between
+    transaction.on_commit(lambda: invalidate_category_index(user_id))
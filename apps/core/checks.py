@@ -0,0 +1,61 @@
+# apps/core/checks.py
+
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+# Backends whose entries are only visible to the process that wrote them
+PER_PROCESS_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+# Shared, but every read is a query
+DATABASE_CACHES = {
+    'django.core.cache.backends.db.DatabaseCache',
+}
+
+
+def _cache_backend():
+    return settings.CACHES.get('default', {}).get('BACKEND')
+
+
+def _per_process_cache(level, check_id):
+    return level(
+        f"The default cache ({_cache_backend()}) isn't shared between processes.",
+        hint=(
+            "Cached category indexes, merchant dictionaries, categorizers, quick-add "
+            "parses and exchange rates won't be invalidated across web and OCR worker "
+            "processes. Set REDIS_URL to use Redis, or configure Memcached (see CACHES "
+            "in settings)."
+        ),
+        id=check_id,
+    )
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Cache invalidation between processes needs a shared default cache, and
+    the version tokens read on every parse should be cheap to read.
+    """
+    backend = _cache_backend()
+    if backend in PER_PROCESS_CACHES:
+        # Fine for one development server; `check --deploy` fails on it
+        return [_per_process_cache(Warning, 'core.W001')]
+    if backend in DATABASE_CACHES:
+        return [Warning(
+            f"The default cache ({backend}) runs a query for every read.",
+            hint=(
+                "Smart input reads cached version tokens on every parse. Set REDIS_URL "
+                "to use Redis, or configure Memcached (see CACHES in settings)."
+            ),
+            id='core.W002',
+        )]
+    return []
+
+
+@register(deploy=True)
+def check_deployed_cache(app_configs, **kwargs):
+    """A deployment runs several processes, so it must have a shared cache."""
+    if _cache_backend() in PER_PROCESS_CACHES:
+        return [_per_process_cache(Error, 'core.E001')]
+    return []
@@ -1,7 +1,17 @@
+import logging
 import requests
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from itertools import repeat
+from django.conf import settings
 from django.core.cache import cache
+from django.utils.module_loading import import_string
 from decimal import Decimal, InvalidOperation
 
+logger = logging.getLogger(__name__)
+
 FALLBACK_RATES = {
     'USD': 1.0,
     'KHR': 4000.0,
@@ -16,58 +26,286 @@ FALLBACK_RATES = {
 API_URL = "https://api.exchangerate-api.com/v4/latest/USD"
 CACHE_KEY = "currency_exchange_rates"
 CACHE_TIMEOUT = 86400  
+REFRESH_LOCK_KEY = "currency_exchange_rates:refreshing"
+HISTORY_VERSION_KEY = "currency_rate_history_version"
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def fetch_api_rates():
+    """Default CURRENCY_RATES_SOURCE: today's rates per USD from the exchange rate API."""
+    response = requests.get(API_URL, timeout=getattr(settings, 'CURRENCY_RATES_FETCH_TIMEOUT', 5))
+    response.raise_for_status()
+    rates = response.json().get('rates')
+    if not rates:
+        raise ValueError("Response has no rates")
+    return rates
+
+
+def static_rates():
+    """A CURRENCY_RATES_SOURCE that never goes online, for development and tests."""
+    return dict(FALLBACK_RATES)
+
+
+def _cached_rates():
+    """``(rates, fetched_at)`` from the cache, or ``(None, 0)``."""
+    entry = cache.get(CACHE_KEY)
+    if not entry:
+        return None, 0
+    if 'fetched_at' not in entry:
+        # Stored as a bare rates dict: usable, but due for a refresh
+        return entry, 0
+    return entry['rates'], entry['fetched_at']
+
+
+def refresh_rates():
+    """
+    Fetches rates from CURRENCY_RATES_SOURCE and caches them. Returns the
+    rates, or None (logged) when the source failed; the cached rates are
+    left as they were.
+    """
+    source = getattr(settings, 'CURRENCY_RATES_SOURCE', 'apps.core.currency_rates.fetch_api_rates')
+    try:
+        rates = import_string(source)()
+    except Exception:
+        logger.warning("Exchange rate refresh from %s failed", source, exc_info=True)
+        return None
+
+    # Kept well past CURRENCY_RATES_MAX_AGE, to serve while a refresh runs or fails
+    cache.set(
+        CACHE_KEY,
+        {'rates': rates, 'fetched_at': time.time()},
+        getattr(settings, 'CURRENCY_RATES_STALE_TTL', 7 * 86400),
+    )
+    cache.delete(REFRESH_LOCK_KEY)
+    logger.info("Updated %d exchange rates from %s", len(rates), source)
+    return rates
+
+
+def rates_age():
+    """Seconds since the cached rates were fetched, or None when there are none."""
+    rates, fetched_at = _cached_rates()
+    return None if rates is None else time.time() - fetched_at
+
 
 def get_live_rates():
     """
-    Fetches rates from Cache first. 
-    If missing, fetches from API and saves to Cache.
-    If API fails, returns Fallback.
+    Fetches rates from Cache first (stale-while-revalidate).
+
+    Rates older than CURRENCY_RATES_MAX_AGE are still returned, and one
+    process (whichever takes the refresh lock) fetches new ones in a
+    background thread; with CURRENCY_RATES_BACKGROUND_REFRESH off, that is
+    left to `manage.py refresh_currency_rates`. Only when nothing is cached
+    does the lock holder fetch while the request waits; everyone else, and
+    the lock holder if the source fails, gets FALLBACK_RATES. A failed
+    refresh holds the lock for CURRENCY_RATES_RETRY_AFTER seconds, so the
+    source isn't retried on every request.
     """
-    rates = cache.get(CACHE_KEY)
+    rates, fetched_at = _cached_rates()
+    retry_after = getattr(settings, 'CURRENCY_RATES_RETRY_AFTER', 300)
+
     if rates:
+        is_stale = time.time() - fetched_at >= getattr(settings, 'CURRENCY_RATES_MAX_AGE', CACHE_TIMEOUT)
+        if (
+            is_stale
+            and getattr(settings, 'CURRENCY_RATES_BACKGROUND_REFRESH', True)
+            and cache.add(REFRESH_LOCK_KEY, True, retry_after)
+        ):
+            threading.Thread(target=refresh_rates, name='currency-rates-refresh', daemon=True).start()
         return rates
 
-    try:
-        response = requests.get(API_URL, timeout=5)
-        response.raise_for_status() # Check for errors
-        data = response.json()
-        
-        rates = data.get('rates', {})
-        
-        cache.set(CACHE_KEY, rates, CACHE_TIMEOUT)
-        print("✅  Updated Exchange Rates from API")
-        return rates
+    if not cache.add(REFRESH_LOCK_KEY, True, retry_after):
+        # Another process is fetching (or the last attempt failed recently)
+        return FALLBACK_RATES
 
-    except Exception as e:
-        print(f"⚠️  Currency API Failed: {e}")
-        print("Using Fallback Rates instead.")
+    rates = refresh_rates()
+    if rates is None:
+        logger.warning("No exchange rates cached; using the fallback rates")
         return FALLBACK_RATES
+    return rates
+
 
-def convert_amount(amount, source_currency, target_currency):
+class RateHistory:
     """
-    Converts amount using Live Rates.
+    Daily rates from the CurrencyRate table, for converting an amount at
+    the rate of its date. Each currency's series is read the first time it
+    is needed and kept as sorted dates (searched with bisect) and rates.
+
+    The history ends at the latest date loaded for any currency; later
+    dates (e.g. today, until today's rates are loaded) have no rate here,
+    so they are converted at the live rates.
     """
-    if amount is None or amount == '':
-        return Decimal('0.00')
-    
+
+    _NOT_LOADED = object()
+
+    def __init__(self, version):
+        self.version = version
+        self._series = {}
+        self._end = self._NOT_LOADED
+
+    @property
+    def end(self):
+        """Last date in the table, or None when it is empty."""
+        if self._end is self._NOT_LOADED:
+            from django.db.models import Max
+            from .models import CurrencyRate
+
+            self._end = CurrencyRate.objects.aggregate(end=Max('date'))['end']
+        return self._end
+
+    def _load(self, currency):
+        from .models import CurrencyRate
+
+        rows = list(
+            CurrencyRate.objects.filter(currency=currency).order_by('date').values_list('date', 'rate')
+        )
+        series = ([day for day, _ in rows], [rate for _, rate in rows])
+        return self._series.setdefault(currency, series)
+
+    def rate_on(self, currency, day):
+        """
+        Units of ``currency`` per USD on ``day``: the latest rate on or
+        before it (the earliest one for days before the history starts).
+        None when the currency has no history, or ``day`` is past its end.
+        """
+        end = self.end
+        if end is None or day > end:
+            return None
+        dates, rates = self._series.get(currency) or self._load(currency)
+        if not dates:
+            return None
+        return rates[max(bisect_right(dates, day) - 1, 0)]
+
+
+def invalidate_rate_history():
+    """Make every process reload the rate history; returns the new version."""
+    version = uuid.uuid4().hex
+    cache.set(HISTORY_VERSION_KEY, version, None)
+    return version
+
+
+def get_rate_history():
+    """This process's RateHistory, replaced when the table has been reloaded."""
+    global _history
+    version = cache.get(HISTORY_VERSION_KEY)
+    if version is None:
+        version = invalidate_rate_history()
+    with _history_lock:
+        if _history is None or _history.version != version:
+            _history = RateHistory(version)
+        return _history
+
+
+ZERO = Decimal('0.00')
+ONE = Decimal('1')
+
+
+def _to_decimal(amount):
+    """Amount as a Decimal ('1,234.50', 12, 3.5 ...), or None when unreadable."""
+    if isinstance(amount, Decimal):
+        return amount
+    if isinstance(amount, int):
+        return Decimal(amount)
     try:
-        amount_str = str(amount).replace(',', '').replace(' ', '')
-        amount_dec = Decimal(amount_str)
+        return Decimal(str(amount).replace(',', '').replace(' ', ''))
     except (InvalidOperation, ValueError):
-        return Decimal('0.00')
+        return None
 
-    rates = get_live_rates()
 
-    try:
-        source_rate = Decimal(str(rates.get(source_currency, 1.0)))
-        target_rate = Decimal(str(rates.get(target_currency, 1.0)))
-    except:
-        source_rate = Decimal('1.0')
-        target_rate = Decimal('1.0')
-
-    if source_rate == 0: source_rate = Decimal('1.0')
-    
-    amount_in_usd = amount_dec / source_rate
-    final_amount = amount_in_usd * target_rate
-
-    return final_amount
\ No newline at end of file
+class RateSnapshot:
+    """
+    Exchange rates (per USD) as of one moment, as Decimals. Take one per
+    request with rate_snapshot() and convert everything with it: the rates
+    are read and parsed once, and each (source, target, date) cross-rate is
+    worked out the first time it is needed.
+
+    Conversions given a date use the rate history for that day; currencies
+    without history, dates past its end, and conversions without a date use
+    the live rates.
+    """
+
+    __slots__ = ('_rates', '_cross', '_history')
+
+    def __init__(self, rates, history=None):
+        parsed = {}
+        for code, rate in rates.items():
+            try:
+                rate = Decimal(str(rate))
+            except (InvalidOperation, ValueError, TypeError):
+                continue
+            if rate.is_finite():
+                parsed[code] = rate
+        self._rates = parsed
+        self._cross = {}
+        self._history = history
+
+    def rate(self, currency, on=None):
+        """Units of ``currency`` per USD (on the date ``on``); 1 for unknown currencies."""
+        if on is not None and self._history is not None:
+            rate = self._history.rate_on(currency, on)
+            if rate is not None:
+                return rate
+        return self._rates.get(currency, ONE)
+
+    def cross_rate(self, source_currency, target_currency, on=None):
+        """Multiplier from ``source_currency`` to ``target_currency`` (on the date ``on``)."""
+        key = (source_currency, target_currency, on)
+        cross = self._cross.get(key)
+        if cross is None:
+            if source_currency == target_currency:
+                cross = ONE
+            else:
+                source_rate = self.rate(source_currency, on) or ONE
+                cross = self.rate(target_currency, on) / source_rate
+            self._cross[key] = cross
+        return cross
+
+    def convert(self, amount, source_currency, target_currency, on=None):
+        if amount is None or amount == '':
+            return ZERO
+        amount = _to_decimal(amount)
+        if amount is None:
+            return ZERO
+        return amount * self.cross_rate(source_currency, target_currency, on)
+
+    def convert_many(self, amounts, currencies, target_currency, dates=None):
+        """
+        convert() over a column of amounts. ``currencies`` is the matching
+        column of source currencies, or one currency for all of them;
+        ``dates``, if given, the column of dates to convert at.
+        """
+        if currencies is None or isinstance(currencies, str):
+            currencies = repeat(currencies)
+        if dates is None:
+            dates = repeat(None)
+        converted = []
+        for amount, source_currency, on in zip(amounts, currencies, dates):
+            converted.append(self.convert(amount, source_currency, target_currency, on))
+        return converted
+
+
+def rate_snapshot(request=None):
+    """
+    A RateSnapshot of the current rates. With a request, the same snapshot
+    is returned for the rest of that request.
+    """
+    if request is None:
+        return RateSnapshot(get_live_rates(), get_rate_history())
+    snapshot = getattr(request, '_rate_snapshot', None)
+    if snapshot is None:
+        snapshot = request._rate_snapshot = RateSnapshot(get_live_rates(), get_rate_history())
+    return snapshot
+
+
+def convert_amount(amount, source_currency, target_currency, snapshot=None, on=None):
+    """
+    Converts amount using Live Rates, or the rates of the date ``on``.
+    Pass a snapshot (see rate_snapshot) when converting more than one amount.
+    """
+    return (snapshot or rate_snapshot()).convert(amount, source_currency, target_currency, on)
+
+
+def convert_many(amounts, currencies, target_currency, snapshot=None, dates=None):
+    """Converts a column of amounts in one call; see RateSnapshot.convert_many."""
+    return (snapshot or rate_snapshot()).convert_many(amounts, currencies, target_currency, dates)
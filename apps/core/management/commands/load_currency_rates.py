@@ -0,0 +1,135 @@
+import csv
+import json
+import os
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.core.currency_rates import invalidate_rate_history
+from apps.core.models import CurrencyRate
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load daily exchange rates (units per USD) into CurrencyRate from "
+        "a CSV or JSON file. CSV: columns date,currency,rate, or a date column "
+        "followed by one column per currency. JSON: a list of "
+        '{"date", "currency", "rate"} objects, or {"YYYY-MM-DD": {"EUR": 0.92, ...}}.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file of rates.')
+        parser.add_argument('--format', choices=['csv', 'json'], default=None,
+                            help='File format (default: from the file extension).')
+        parser.add_argument('--replace', action='store_true',
+                            help='Overwrite rates already stored for the same date and currency.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Read and check the file without saving.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'json'):
+            raise CommandError(f"Can't tell the format of {path}; pass --format csv or --format json.")
+
+        try:
+            with open(path, newline='', encoding='utf-8') as fh:
+                rows = list(self._read_csv(fh) if fmt == 'csv' else self._read_json(fh))
+        except OSError as e:
+            raise CommandError(f"Can't read {path}: {e}")
+
+        # A later row for the same day and currency wins
+        rates = {}
+        for where, day, currency, rate in rows:
+            day, currency, rate = self._parse(where, day, currency, rate)
+            rates[(day, currency)] = rate
+        objs = [CurrencyRate(date=day, currency=currency, rate=rate) for (day, currency), rate in rates.items()]
+
+        currencies = sorted({currency for _, currency in rates})
+        days = [day for day, _ in rates]
+        summary = (
+            f"{len(objs)} rates for {len(currencies)} currencies"
+            + (f" ({min(days)} to {max(days)})" if days else "")
+        )
+        if options['dry_run']:
+            self.stdout.write(f"[dry run] Read {summary}.")
+            return
+
+        with transaction.atomic():
+            if options['replace']:
+                kwargs = {'update_conflicts': True, 'update_fields': ['rate']}
+                if connection.features.supports_update_conflicts_with_target:
+                    kwargs['unique_fields'] = ['currency', 'date']
+            else:
+                kwargs = {'ignore_conflicts': True}
+            CurrencyRate.objects.bulk_create(objs, batch_size=options['batch_size'], **kwargs)
+            transaction.on_commit(invalidate_rate_history)
+
+        self.stdout.write(self.style.SUCCESS(f"Loaded {summary}."))
+
+    def _read_csv(self, fh):
+        reader = csv.reader(fh)
+        header = [name.strip().lower() for name in next(reader, [])]
+        if not header:
+            return
+        if {'date', 'currency', 'rate'} <= set(header):
+            d, c, r = header.index('date'), header.index('currency'), header.index('rate')
+            for line, row in enumerate(reader, 2):
+                if any(cell.strip() for cell in row):
+                    yield f"line {line}", *self._cells(line, row, (d, c, r))
+        else:
+            # date, EUR, JPY, ...
+            currencies = header[1:]
+            for line, row in enumerate(reader, 2):
+                if not any(cell.strip() for cell in row):
+                    continue
+                for i, currency in enumerate(currencies, 1):
+                    if i < len(row) and row[i].strip():
+                        yield f"line {line}", row[0], currency, row[i]
+
+    def _cells(self, line, row, columns):
+        try:
+            return [row[i] for i in columns]
+        except IndexError:
+            raise CommandError(f"line {line}: expected date, currency and rate, got {row!r}")
+
+    def _read_json(self, fh):
+        try:
+            data = json.load(fh)
+        except ValueError as e:
+            raise CommandError(f"Invalid JSON: {e}")
+
+        if isinstance(data, list):
+            for i, item in enumerate(data):
+                if not isinstance(item, dict):
+                    raise CommandError(f"item {i}: expected an object, got {item!r}")
+                yield f"item {i}", item.get('date'), item.get('currency'), item.get('rate')
+        elif isinstance(data, dict):
+            for day, day_rates in data.items():
+                if not isinstance(day_rates, dict):
+                    raise CommandError(f"{day}: expected an object of currency rates")
+                for currency, rate in day_rates.items():
+                    yield day, day, currency, rate
+        else:
+            raise CommandError("Expected a list of rates or an object keyed by date.")
+
+    def _parse(self, where, day, currency, rate):
+        try:
+            day = date.fromisoformat(str(day).strip())
+        except ValueError:
+            raise CommandError(f"{where}: invalid date {day!r} (expected YYYY-MM-DD)")
+
+        currency = str(currency or '').strip().upper()
+        if len(currency) != 3 or not currency.isalpha():
+            raise CommandError(f"{where}: invalid currency code {currency!r}")
+
+        try:
+            rate = Decimal(str(rate).strip())
+        except (InvalidOperation, ValueError):
+            raise CommandError(f"{where}: invalid rate {rate!r}")
+        # CurrencyRate.rate holds 12 digits before the point and 8 after
+        if not rate.is_finite() or not Decimal('0.00000001') <= rate < Decimal(10) ** 12:
+            raise CommandError(f"{where}: rate must be between 0.00000001 and 10^12, got {rate}")
+        return day, currency, rate.quantize(Decimal('0.00000001'))
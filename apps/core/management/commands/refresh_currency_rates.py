@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.currency_rates import CACHE_TIMEOUT, rates_age, refresh_rates
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch exchange rates from CURRENCY_RATES_SOURCE into the cache, so "
+        "requests never wait on the rate API. Meant to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-stale', action='store_true',
+                            help='Only fetch when the cached rates are older than CURRENCY_RATES_MAX_AGE.')
+
+    def handle(self, *args, **options):
+        age = rates_age()
+        if options['if_stale'] and age is not None and age < getattr(settings, 'CURRENCY_RATES_MAX_AGE', CACHE_TIMEOUT):
+            self.stdout.write(f"Cached rates are {age / 3600:.1f} hours old; not refreshing.")
+            return
+
+        rates = refresh_rates()
+        if rates is None:
+            raise CommandError("Refreshing the exchange rates failed; see the log. The cached rates were kept.")
+        self.stdout.write(self.style.SUCCESS(f"Cached {len(rates)} exchange rates."))
@@ -1,3 +1,21 @@
 from django.db import models
 
-# Create your models here.
+
+class CurrencyRate(models.Model):
+    """
+    Exchange rate of one currency on one day, in units per USD (as the
+    live rates are). Loaded with `manage.py load_currency_rates`; expenses
+    are converted at the rate of their expense_date, see currency_rates.py.
+    """
+    date = models.DateField()
+    currency = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=20, decimal_places=8)
+
+    class Meta:
+        db_table = 'CURRENCY_RATE'
+        ordering = ['currency', 'date']
+        # Also the index the per-currency history is read through
+        unique_together = ['currency', 'date']
+
+    def __str__(self):
+        return f"{self.currency} {self.rate} on {self.date}"
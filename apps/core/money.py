@@ -0,0 +1,44 @@
+# apps/core/money.py
+#
+# Amounts as integers in a currency's minor unit (cents for USD, whole
+# riel for KHR), for exact sums in SQL. Decimals are only made again to
+# display or convert an amount.
+
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+DEFAULT_MINOR_DIGITS = 2
+
+# Currencies whose amounts have no minor unit in practice
+MINOR_DIGITS = {
+    'JPY': 0,
+    'KHR': 0,
+    'VND': 0,
+}
+
+
+def minor_digits(currency):
+    """Decimal places of ``currency`` (2 unless listed in MINOR_DIGITS)."""
+    return MINOR_DIGITS.get(currency, DEFAULT_MINOR_DIGITS)
+
+
+def quantize(amount, currency):
+    """Decimal ``amount`` rounded (half up) to the minor unit of ``currency``."""
+    return Decimal(amount).quantize(Decimal(1).scaleb(-minor_digits(currency)), rounding=ROUND_HALF_UP)
+
+
+def to_minor(amount, currency):
+    """
+    ``amount`` (Decimal, int or numeric string) as an int of ``currency``'s
+    minor unit, rounded half up: to_minor(Decimal('12.345'), 'USD') == 1235.
+    """
+    if not isinstance(amount, Decimal):
+        try:
+            amount = Decimal(str(amount))
+        except (InvalidOperation, ValueError):
+            raise ValueError(f"Not an amount: {amount!r}")
+    return int(amount.scaleb(minor_digits(currency)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(units, currency):
+    """Decimal amount of ``units`` of ``currency``'s minor unit: from_minor(1235, 'USD') == Decimal('12.35')."""
+    return Decimal(int(units)).scaleb(-minor_digits(currency))
@@ -1,14 +1,17 @@
 from django import template
 from decimal import Decimal
-from ..currency_rates import convert_amount
+from ..currency_rates import rate_snapshot
+from ..money import quantize
 
 register = template.Library()
 
-@register.simple_tag
-def smart_convert(amount, source_currency, user):
+@register.simple_tag(takes_context=True)
+def smart_convert(context, amount, source_currency, user, on=None):
     """
-    Converts an amount from Source -> User Preference.
-    Usage: {% smart_convert expense.amount expense.currency request.user %}
+    Converts an amount from Source -> User Preference, with the request's
+    rate snapshot (rates are read once per page, not once per row). Pass a
+    date to convert at that day's rate instead of today's.
+    Usage: {% smart_convert expense.amount expense.currency request.user expense.expense_date %}
     """
     if amount is None:
         return ""
@@ -19,7 +22,7 @@ def smart_convert(amount, source_currency, user):
         
         source = source_currency if source_currency else 'USD'
 
-        converted_val = convert_amount(amount, source, target_currency)
+        converted_val = rate_snapshot(context.get('request')).convert(amount, source, target_currency, on)
 
         return format_currency_string(converted_val, target_currency)
 
@@ -70,11 +73,8 @@ def format_currency_string(amount, code):
             'JPY': '¥', 'CNY': '¥', 'KHR': '៛',
         }
         symbol = symbols.get(code, code)
-        val = float(amount)
-
-        if code == 'KHR':
-            return f"{symbol}{int(val):,}"
-        else:
-            return f"{symbol}{val:,.2f}"
+        # Exact: rounded to the currency's minor unit (none for KHR), not through float
+        val = quantize(Decimal(str(amount)), code)
+        return f"{symbol}{val:,f}"
     except:
         return str(amount)
\ No newline at end of file
@@ -1,3 +1,40 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .money import from_minor, quantize, to_minor
+
+
+class MoneyTests(SimpleTestCase):
+
+    def test_to_minor(self):
+        self.assertEqual(to_minor(Decimal('12.34'), 'USD'), 1234)
+        self.assertEqual(to_minor(Decimal('12.345'), 'USD'), 1235)
+        self.assertEqual(to_minor(Decimal('-12.345'), 'USD'), -1235)
+        self.assertEqual(to_minor('0.005', 'EUR'), 1)
+        self.assertEqual(to_minor(7, 'USD'), 700)
+        self.assertEqual(to_minor(1.1, 'USD'), 110)
+        self.assertEqual(to_minor(Decimal('1500'), 'JPY'), 1500)
+        self.assertEqual(to_minor(Decimal('1500.5'), 'JPY'), 1501)
+        self.assertEqual(to_minor(Decimal('4000.49'), 'KHR'), 4000)
+
+    def test_to_minor_rejects_non_amounts(self):
+        for value in ('12,50 EUR', '', None):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                to_minor(value, 'USD')
+
+    def test_from_minor(self):
+        self.assertEqual(from_minor(1235, 'USD'), Decimal('12.35'))
+        self.assertEqual(from_minor(-5, 'USD'), Decimal('-0.05'))
+        self.assertEqual(from_minor(1500, 'JPY'), Decimal('1500'))
+
+    def test_round_trip(self):
+        for currency in ('USD', 'EUR', 'JPY', 'VND'):
+            for amount in ('0', '0.01', '19.99', '123456.78', '-3.50'):
+                with self.subTest(currency=currency, amount=amount):
+                    amount = quantize(Decimal(amount), currency)
+                    self.assertEqual(from_minor(to_minor(amount, currency), currency), amount)
+
+    def test_quantize(self):
+        self.assertEqual(quantize(Decimal('2.675'), 'USD'), Decimal('2.68'))
+        self.assertEqual(quantize(Decimal('2.5'), 'JPY'), Decimal('3'))
@@ -13,7 +13,9 @@ from apps.ai_services.models import AIInsight
 
 from apps.ai_services.utils import generate_weekly_summary
 
-from apps.core.currency_rates import convert_amount 
+from apps.expenses.totals import converted_totals
+from apps.core.currency_rates import rate_snapshot
+from apps.core.money import from_minor, quantize, to_minor
 
 def home(request):
     """Homepage / Landing page"""
@@ -57,31 +59,32 @@ def dashboard(request):
             user=request.user,
             expense_date__gte=first_day.date(),
             expense_date__lte=now.date()
-        ).select_related('category')
-
-        total_spent = 0.0
-        category_totals = {}
-
-        for exp in expenses:
-            src_curr = exp.currency if hasattr(exp, 'currency') and exp.currency else 'USD'
-            
-            converted_val = float(convert_amount(exp.amount, src_curr, target_curr))
-            total_spent += converted_val
-            
-            cat_name = exp.category.category_name
-            if cat_name not in category_totals:
-                category_totals[cat_name] = {
-                    'name': cat_name,
-                    'icon': exp.category.icon,
-                    'color': exp.category.color,
-                    'total': 0.0,
-                    'count': 0
-                }
-            category_totals[cat_name]['total'] += converted_val
-            category_totals[cat_name]['count'] += 1
-
-        spending_by_category = sorted(category_totals.values(), key=lambda x: x['total'], reverse=True)[:5]
-        expense_count = expenses.count()
+        )
+
+        # Summed in SQL per category (see apps/expenses/totals.py)
+        rates = rate_snapshot(request)
+        category_rows = converted_totals(
+            expenses, target_curr,
+            group_by=['category__category_name', 'category__icon', 'category__color'],
+            snapshot=rates,
+        )
+
+        category_totals = [
+            {
+                'name': row['category__category_name'],
+                'icon': row['category__icon'],
+                'color': row['category__color'],
+                'total_minor': row['total_minor'],
+                'total': row['total'],
+                'count': row['count'],
+            }
+            for row in category_rows
+        ]
+        # Exact integer sums; Decimals only for display
+        total_spent = from_minor(sum(row['total_minor'] for row in category_totals), target_curr)
+
+        spending_by_category = sorted(category_totals, key=lambda x: x['total_minor'], reverse=True)[:5]
+        expense_count = sum(row['count'] for row in category_totals)
 
         recent_expenses = Expense.objects.filter(
             user=request.user
@@ -103,25 +106,24 @@ def dashboard(request):
             )
             
             budget_original_curr = getattr(budget, 'currency', 'USD')
-            limit_original = float(budget.budget_limit)
-
-            spent_original = 0.0
-            for be in b_expenses:
-                src = be.currency if hasattr(be, 'currency') and be.currency else 'USD'
-                val = convert_amount(be.amount, src, budget_original_curr)
-                spent_original += float(val)
+            limit_minor = to_minor(budget.budget_limit, budget_original_curr)
+            spent_minor = converted_totals(b_expenses, budget_original_curr, snapshot=rates)[0]['total_minor']
             
-            percentage = (spent_original / limit_original * 100) if limit_original > 0 else 0
+            percentage = (spent_minor * 100 / limit_minor) if limit_minor > 0 else 0
             
-            spent_display = convert_amount(spent_original, budget_original_curr, target_curr)
-            limit_display = convert_amount(limit_original, budget_original_curr, target_curr)
-            remaining_display = float(limit_display) - float(spent_display)
+            spent_display, limit_display = (
+                quantize(amount, target_curr)
+                for amount in rates.convert_many(
+                    [from_minor(spent_minor, budget_original_curr), from_minor(limit_minor, budget_original_curr)],
+                    budget_original_curr, target_curr,
+                )
+            )
 
             budget_status.append({
                 'budget': budget,
-                'spent': float(spent_display),         # Now in Target Currency
-                'limit_display': float(limit_display), # Now in Target Currency
-                'remaining': remaining_display,
+                'spent': spent_display,             # Now in Target Currency
+                'limit_display': limit_display,     # Now in Target Currency
+                'remaining': limit_display - spent_display,
                 'percentage': round(percentage, 1),
                 'status': 'danger' if percentage >= 100 else 'warning' if percentage >= 80 else 'success'
             })
@@ -0,0 +1,296 @@
+# apps/expenses/categorizer.py
+#
+# Learned category guesses for smart input: a per-user multinomial naive
+# Bayes over hashed bag-of-words features of an expense's merchant name and
+# description, in NumPy. It is trained from the user's categorized expenses
+# ('Uncategorized' ones don't count), takes new expenses into account as
+# they are created, and is only used when no keyword family matched.
+#
+# The word counts a model was trained with are stored in the cache once per
+# training (a generation). New expenses are appended to the generation as
+# small deltas, under positions handed out by cache.incr, so concurrent saves
+# don't overwrite each other. Each process keeps the prepared models of
+# recently used users and applies the deltas it hasn't seen yet; a lookup
+# only reads the generation and delta count while nothing has changed.
+
+import re
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.categories.index import FALLBACK_CATEGORY_NAME
+
+N_FEATURES = 1 << 12
+ALPHA = 0.5  # Additive smoothing
+
+_TOKEN = re.compile(r'\w+')
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _generation_key(user_id):
+    return f"categorizer_generation:{user_id}"
+
+
+def _state_key(user_id, generation):
+    return f"categorizer_state:{user_id}:{generation}"
+
+
+def _length_key(user_id, generation):
+    return f"categorizer_deltas:{user_id}:{generation}"
+
+
+def _delta_key(user_id, generation, n):
+    return f"categorizer_delta:{user_id}:{generation}:{n}"
+
+
+def _hash(token):
+    # crc32 rather than hash(): str hashes differ between processes
+    return zlib.crc32(token.encode('utf-8')) & (N_FEATURES - 1)
+
+
+def features(merchant, description):
+    """Hashed feature indexes of an expense (repeats count)."""
+    merchant = (merchant or '').strip().lower()
+    tokens = _TOKEN.findall(f"{merchant} {(description or '').lower()}")
+    if merchant:
+        tokens.append('merchant=' + merchant)
+    return np.fromiter((_hash(t) for t in tokens), dtype=np.intp, count=len(tokens))
+
+
+class NaiveBayes:
+    """Word counts per category, plus the log-probabilities derived from them."""
+
+    def __init__(self, classes=(), counts=None, docs=None):
+        self.classes = list(classes)  # Category pks, one row each
+        self.counts = counts if counts is not None else np.zeros((0, N_FEATURES), dtype=np.int32)
+        self.docs = docs if docs is not None else np.zeros(0, dtype=np.int32)
+        self._log_prior = None
+        self._log_likelihood = None
+
+    @classmethod
+    def train(cls, rows):
+        """``rows``: iterable of ``(category_id, merchant, description)``."""
+        model = cls()
+        for category_id, merchant, description in rows:
+            model.add(category_id, features(merchant, description))
+        return model
+
+    @property
+    def n_docs(self):
+        return int(self.docs.sum())
+
+    def _row(self, category_id):
+        try:
+            return self.classes.index(category_id)
+        except ValueError:
+            self.classes.append(category_id)
+            self.counts = np.vstack([self.counts, np.zeros((1, N_FEATURES), dtype=np.int32)])
+            self.docs = np.append(self.docs, np.int32(0))
+            return len(self.classes) - 1
+
+    def add(self, category_id, idx):
+        row = self._row(category_id)
+        np.add.at(self.counts[row], idx, 1)
+        self.docs[row] += 1
+        self._log_prior = self._log_likelihood = None
+
+    def prepare(self):
+        if self._log_likelihood is None:
+            smoothed = self.counts.astype(np.float64) + ALPHA
+            self._log_likelihood = np.log(smoothed / smoothed.sum(axis=1, keepdims=True))
+            self._log_prior = np.log(self.docs / self.docs.sum())
+        return self
+
+    def _probabilities(self, scores):
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        p = np.exp(scores)
+        return p / p.sum(axis=-1, keepdims=True)
+
+    def predict(self, idx):
+        """``(category_id, probability)`` of the most likely category."""
+        self.prepare()
+        scores = self._log_prior + self._log_likelihood[:, idx].sum(axis=1)
+        p = self._probabilities(scores)
+        best = int(p.argmax())
+        return self.classes[best], float(p[best])
+
+    def predict_many(self, docs):
+        """Vectorized predict over a list of feature index arrays."""
+        self.prepare()
+        lengths = np.fromiter((len(d) for d in docs), dtype=np.intp, count=len(docs))
+        if not len(docs):
+            return [], np.zeros(0)
+        flat = np.concatenate(docs) if lengths.sum() else np.zeros(0, dtype=np.intp)
+        rows = np.repeat(np.arange(len(docs)), lengths)
+
+        scores = np.tile(self._log_prior, (len(docs), 1))
+        np.add.at(scores, rows, self._log_likelihood[:, flat].T)
+        p = self._probabilities(scores)
+        best = p.argmax(axis=1)
+        return [self.classes[i] for i in best], p[np.arange(len(docs)), best]
+
+    def state(self):
+        return {'classes': self.classes, 'counts': self.counts, 'docs': self.docs}
+
+    def copy(self):
+        return NaiveBayes(list(self.classes), self.counts.copy(), self.docs.copy())
+
+
+def _train_from_db(user_id):
+    from .models import Expense
+
+    rows = (
+        Expense.objects
+        .filter(user_id=user_id)
+        .exclude(category__category_name=FALLBACK_CATEGORY_NAME)
+        .order_by()
+        .values_list('category_id', 'merchant_name', 'description')
+    )
+    return NaiveBayes.train(rows.iterator())
+
+
+def _train(user_id):
+    """Train from the database under a new generation; returns ``(generation, model)``."""
+    model = _train_from_db(user_id)
+    generation = uuid.uuid4().hex
+    ttl = getattr(settings, 'CATEGORIZER_TTL', 7 * 86400)
+    # The state and delta count first: the generation key publishes them
+    cache.set_many({_state_key(user_id, generation): model.state(), _length_key(user_id, generation): 0}, ttl)
+    cache.set(_generation_key(user_id), generation, ttl)
+    return generation, model
+
+
+def _read_deltas(user_id, generation, start, stop):
+    """Deltas ``start + 1`` to ``stop``, or None when one of them is missing."""
+    keys = [_delta_key(user_id, generation, n) for n in range(start + 1, stop + 1)]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return None
+    return [found[k] for k in keys]
+
+
+def _load(user_id, local):
+    """
+    ``(generation, applied, model)`` for the user: ``local`` (the process's
+    entry, or None) brought up to date, or a model loaded or trained anew.
+    """
+    keys = [_generation_key(user_id)]
+    if local is not None:
+        keys.append(_length_key(user_id, local[0]))
+    found = cache.get_many(keys)
+    generation = found.get(keys[0])
+
+    if local is not None and generation == local[0] and keys[1] in found:
+        _, applied, model = local
+        length = found[keys[1]]
+    else:
+        state = length = None
+        if generation is not None:
+            found = cache.get_many([_state_key(user_id, generation), _length_key(user_id, generation)])
+            state = found.get(_state_key(user_id, generation))
+            length = found.get(_length_key(user_id, generation))
+        if state is None or length is None:
+            generation, model = _train(user_id)
+            return generation, 0, model
+        applied, model = 0, NaiveBayes(state['classes'], state['counts'], state['docs'])
+
+    if applied < length:
+        deltas = _read_deltas(user_id, generation, applied, length)
+        if deltas is None:
+            generation, model = _train(user_id)
+            return generation, 0, model
+        # Other threads may be predicting with the current model
+        model = model.copy()
+        for category_id, idx in deltas:
+            model.add(category_id, np.asarray(idx, dtype=np.intp))
+        applied = length
+    return generation, applied, model
+
+
+def get_categorizer(user_id):
+    """The user's prepared NaiveBayes, trained from the database when needed."""
+    with _local_lock:
+        local = _local.get(user_id)
+
+    generation, applied, model = _load(user_id, local)
+    if local is not None and local[0] == generation and local[2] is model:
+        with _local_lock:
+            if user_id in _local:
+                _local.move_to_end(user_id)
+        return model
+
+    if model.classes:
+        model.prepare()
+
+    size = getattr(settings, 'CATEGORIZER_LOCAL_SIZE', 256)
+    with _local_lock:
+        _local[user_id] = (generation, applied, model)
+        _local.move_to_end(user_id)
+        while len(_local) > size:
+            _local.popitem(last=False)
+    return model
+
+
+def predict_category(user_id, merchant, description):
+    """
+    ``(category_id, probability)`` for a new expense, or None when the user
+    has too little history or the best guess is below
+    CATEGORIZER_MIN_PROBABILITY.
+    """
+    model = get_categorizer(user_id)
+    if not model.classes or model.n_docs < getattr(settings, 'CATEGORIZER_MIN_EXAMPLES', 10):
+        return None
+    category_id, probability = model.predict(features(merchant, description))
+    if probability < getattr(settings, 'CATEGORIZER_MIN_PROBABILITY', 0.6):
+        return None
+    return category_id, probability
+
+
+def predict_categories(user_id, expenses):
+    """
+    predict_category over a list of ``(merchant, description)`` pairs in one
+    vectorized pass; None for each expense without a confident guess.
+    """
+    model = get_categorizer(user_id)
+    if not expenses or not model.classes or model.n_docs < getattr(settings, 'CATEGORIZER_MIN_EXAMPLES', 10):
+        return [None] * len(expenses)
+    threshold = getattr(settings, 'CATEGORIZER_MIN_PROBABILITY', 0.6)
+    predicted, probability = model.predict_many([features(m, d) for m, d in expenses])
+    return [
+        (category_id, float(p)) if p >= threshold else None
+        for category_id, p in zip(predicted, probability)
+    ]
+
+
+def learn_expense(user_id, category_id, merchant, description):
+    """Append a new categorized expense to the user's model, if one is cached."""
+    generation = cache.get(_generation_key(user_id))
+    if generation is None:
+        # Trained from the database (which has this row) on next use
+        return
+    try:
+        n = cache.incr(_length_key(user_id, generation))
+    except ValueError:
+        # Expired; retrained on next use
+        forget_categorizer(user_id)
+        return
+    if n > getattr(settings, 'CATEGORIZER_MAX_DELTAS', 1000):
+        forget_categorizer(user_id)
+        return
+    cache.set(
+        _delta_key(user_id, generation, n),
+        (category_id, features(merchant, description).tolist()),
+        getattr(settings, 'CATEGORIZER_TTL', 7 * 86400),
+    )
+
+
+def forget_categorizer(user_id):
+    """Drop the user's model; it is retrained from the database on next use."""
+    cache.delete(_generation_key(user_id))
@@ -0,0 +1,128 @@
+# apps/expenses/date_parsing.py
+#
+# Date parsing for smart input. A date pattern's layout says what each of
+# its regex groups holds (day, month number, month name, year), so a match
+# is turned into a date directly rather than formatted back into a string
+# and tried against a list of strptime formats.
+#
+# Numeric dates such as 03/04/2024 can be read either way round; they are
+# tried in the user's preferred order (UserPreference.date_format), then
+# the other. Results are memoized, since receipts and pasted notes repeat
+# the same few date strings.
+
+import calendar
+from datetime import date, timedelta
+from functools import lru_cache
+
+# Order tried first for ambiguous numeric dates
+ORDER_MDY = 'MDY'
+ORDER_DMY = 'DMY'
+DEFAULT_ORDER = ORDER_MDY
+
+_ORDER_BY_DATE_FORMAT = {
+    'MM/DD/YYYY': ORDER_MDY,
+    'DD/MM/YYYY': ORDER_DMY,
+}
+
+# What a regex group holds
+DAY = 'day'
+MONTH = 'month'
+MONTH_NAME = 'month_name'
+YEAR = 'year'              # 4 digits, or 2 meaning 20xx
+SHORT_YEAR = 'short_year'  # 2 digits, 69-99 meaning 19xx (as strptime's %y)
+FIRST = 'first'            # Month or day, depending on the order
+SECOND = 'second'
+
+# Layouts: the roles of a pattern's groups, in group order
+DAY_MONTH_NAME_YEAR = (DAY, MONTH_NAME, YEAR)
+MONTH_NAME_DAY_YEAR = (MONTH_NAME, DAY, YEAR)
+MONTH_NAME_YEAR = (MONTH_NAME, YEAR)
+YEAR_MONTH_DAY = (YEAR, MONTH, DAY)
+NUMERIC = (FIRST, SECOND, YEAR)
+NUMERIC_SHORT_YEAR = (FIRST, SECOND, SHORT_YEAR)
+
+MEMO_SIZE = 4096
+
+# Every month name the patterns accept starts with its abbreviation
+_MONTH_NUMBERS = {
+    name: number
+    for number, name in enumerate(
+        ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1
+    )
+}
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def date_order_for(user):
+    """Order to try first for the user's ambiguous numeric dates."""
+    preferences = getattr(user, 'preferences', None) if user is not None else None
+    if preferences is None:
+        return DEFAULT_ORDER
+    return _ORDER_BY_DATE_FORMAT.get(preferences.date_format, DEFAULT_ORDER)
+
+
+def _year(value):
+    if len(value) == 4:
+        return int(value)
+    if len(value) == 2:
+        return 2000 + int(value)
+    return None
+
+
+def _short_year(value):
+    year = int(value)
+    return year + (2000 if year < 69 else 1900)
+
+
+def _is_valid(year, month, day):
+    if not 1 <= month <= 12 or day < 1 or year < 1:
+        return False
+    if month == 2 and calendar.isleap(year):
+        return day <= 29
+    return day <= _DAYS_IN_MONTH[month - 1]
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _resolve(layout, groups, order, today, max_age_days):
+    year = month = day = first = second = None
+    for role, value in zip(layout, groups):
+        if role == DAY:
+            day = int(value)
+        elif role == MONTH:
+            month = int(value)
+        elif role == MONTH_NAME:
+            month = _MONTH_NUMBERS.get(value[:3].lower())
+        elif role == YEAR:
+            year = _year(value)
+        elif role == SHORT_YEAR:
+            year = _short_year(value)
+        elif role == FIRST:
+            first = int(value)
+        elif role == SECOND:
+            second = int(value)
+
+    if first is not None:
+        month_days = ((first, second), (second, first))
+        if order == ORDER_DMY:
+            month_days = month_days[::-1]
+    else:
+        month_days = ((month, day if day is not None else 1),)
+
+    if year is None:
+        return None
+    for month, day in month_days:
+        if month is None or not _is_valid(year, month, day):
+            continue
+        parsed = date(year, month, day)
+        if max_age_days is None or today - timedelta(days=max_age_days) <= parsed <= today:
+            return parsed
+    return None
+
+
+def parse_date_match(match, layout, today, order=DEFAULT_ORDER, max_age_days=1095):
+    """
+    Date from a regex match whose groups follow ``layout``, or None.
+    Dates in the future or more than ``max_age_days`` back are rejected;
+    pass None to accept any date.
+    """
+    return _resolve(layout, match.groups(), order, today, max_age_days)
@@ -0,0 +1,453 @@
+# apps/expenses/extraction_rules.py
+#
+# Keyword lists, regexes and keyword automata used by _smart_extract, built
+# once at import. Everything here is immutable and shared between requests.
+
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import NamedTuple, Pattern, Tuple
+
+from . import date_parsing
+
+
+class KeywordAutomaton:
+    """
+    Multi-keyword matcher that reports every occurrence of every keyword,
+    overlapping ones included (what an Aho-Corasick automaton gives you).
+
+    The scan itself runs in the regex engine: a zero-width lookahead over
+    the keywords, longest first, yields the longest keyword starting at each
+    position, and every other keyword starting there is a prefix of it, so
+    those come from a table built here. A hand-written goto/failure automaton
+    in Python was measured at about half the speed of this on receipt lines.
+    """
+    __slots__ = ('keywords', '_regex', '_prefixes')
+
+    def __init__(self, keywords):
+        self.keywords = frozenset(keywords)
+        ordered = sorted(self.keywords, key=lambda w: (-len(w), w))
+        self._regex = re.compile('(?=(' + '|'.join(re.escape(w) for w in ordered) + '))')
+        self._prefixes = {
+            word: tuple(other for other in ordered if word.startswith(other))
+            for word in ordered
+        }
+
+    def scan(self, text):
+        """``(start_index, keyword)`` for every occurrence, in text order."""
+        prefixes = self._prefixes
+        return [
+            (m.start(), word)
+            for m in self._regex.finditer(text)
+            for word in prefixes[m.group(1)]
+        ]
+
+    def find(self, text):
+        """The set of keywords that occur in ``text``."""
+        found = set()
+        prefixes = self._prefixes
+        for longest in set(self._regex.findall(text)):
+            found.update(prefixes[longest])
+        return found
+
+
+@dataclass(frozen=True)
+class AmountFamily:
+    name: str
+    score: int
+    # (keyword as written, keyword with spaces and dashes removed)
+    variations: Tuple[Tuple[str, str], ...]
+    is_total: bool = False
+
+
+@dataclass(frozen=True)
+class DateKeyword:
+    keyword: str
+    regex: Pattern
+    literal: str  # Leading letters; the regex can't match ASCII text without them
+
+
+@dataclass(frozen=True)
+class DatePattern:
+    regex: Pattern
+    layout: Tuple[str, ...]  # What each group holds; see date_parsing.py
+    name: str
+    needs_month: bool  # Only matches text that contains a month name
+
+
+@dataclass(frozen=True)
+class ExtractionRules:
+    amount_families: Tuple[AmountFamily, ...]
+    exclusion_keywords: frozenset
+    separators: Pattern
+    subtotal: Pattern
+    dollar_amount: Pattern
+    standalone_amount: Pattern
+    line_automaton: KeywordAutomaton
+    exclusions: Pattern
+    date_keyword_groups: Tuple[Tuple[DateKeyword, ...], ...]
+    date_patterns: Tuple[DatePattern, ...]
+    month_name: Pattern
+    fallback_date_skip: Tuple[str, ...]
+    merchant_header_skip: Pattern
+    category_keywords: Tuple[Tuple[str, Tuple[str, ...]], ...]
+    payment_indicators: Tuple[Tuple[str, Tuple[str, ...]], ...]
+    text_keywords: Tuple[str, ...]
+
+
+# --- Amounts ---------------------------------------------------------------
+
+# Priority keywords (case-insensitive)
+PRIORITY_KEYWORDS = [
+    (['total amount', 'totalamount', 'amount total', 'tot amt'], 1000, 'TOTAL AMOUNT'),
+    (['grand total', 'grandtotal'], 900, 'GRAND TOTAL'),
+    (['final total', 'finaltotal', 'net total', 'nettotal'], 850, 'FINAL TOTAL'),
+    (['amount due', 'amountdue', 'due amount'], 800, 'AMOUNT DUE'),
+    (['balance due', 'balancedue', 'due balance'], 750, 'BALANCE DUE'),
+    (['total', 'tot', 'ttl'], 600, 'TOTAL'),
+    (['sub total', 'subtotal', 'sub-total', 'sub ttl'], 400, 'SUBTOTAL'),
+    (['amount', 'amt'], 300, 'AMOUNT'),
+    (['balance', 'bal'], 200, 'BALANCE'),
+]
+
+# Absolute exclusions
+EXCLUSION_KEYWORDS = [
+    'cash', 'change', 'change due', 'tender', 'tendered',
+    'payment', 'visa', 'card', 'mastercard', 'amex', 'credit card', 'debit card',
+    'received', 'given', 'discount', 'savings', 'you saved'
+]
+
+# A keyword counts when it appears in the line with separators removed:
+# "Total:", "TOT AMT" and "tot-amt" all match. Lines with a space-separated
+# or joined "sub total" don't count as a plain TOTAL.
+SEPARATORS = re.compile(r'[\s\-_:;.,]+')
+SUBTOTAL = re.compile(r'sub(?:total|[\s\-_:;.,]+tot)')
+
+# Run over the whole receipt, so the gap after "$" must stay on one line
+DOLLAR_AMOUNT = re.compile(r'\$[^\S\n]*(\d{1,6}\.\d{2})\b')
+STANDALONE_AMOUNT = re.compile(r'(?<![.\d])(\d{1,6}\.\d{2})(?![.\d])')
+
+
+def _squash(keyword):
+    return keyword.replace(' ', '').replace('-', '')
+
+
+# --- Dates -----------------------------------------------------------------
+
+# Priority date keywords with ALL variations (spacing-agnostic)
+DATE_KEYWORD_GROUPS = [
+    ['due', 'duedate', 'due date', 'due-date', 'duedt'],
+    ['receiptdate', 'receipt date', 'receipt-date'],
+    ['transactiondate', 'transaction date', 'trans date', 'transdate', 'trans-date'],
+    ['purchasedate', 'purchase date', 'purchase-date'],
+    ['saledate', 'sale date', 'sale-date'],
+    ['orderdate', 'order date', 'order-date'],
+    ['invoicedate', 'invoice date', 'invoice-date'],
+    ['date', 'dated', 'dt'],
+]
+
+
+def _date_keyword(keyword):
+    # Convert "due date" to match "due[\s\-:]*date"; kept exactly as the
+    # extractor has always built it so results don't change.
+    pattern = keyword.replace(' ', r'[\s\-:]*').replace('-', r'[\s\-:]*')
+    return DateKeyword(
+        keyword=keyword,
+        regex=re.compile(pattern, re.IGNORECASE),
+        literal=re.match(r'[a-z]*', keyword).group(0),
+    )
+
+
+_MONTHS = (
+    r'(Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|Jun(?:e)?|Jul(?:y)?|Aug(?:ust)?'
+    r'|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)'
+)
+
+
+# Comprehensive date patterns, tried in order
+DATE_PATTERNS = [
+    # 1. Text month formats
+    # Day Month Year (28 August 2022, 28Aug2022, 28-August-2022). Each
+    # separator run is a single [,\s\-]*; with \s* on either side of it a
+    # long run of spaces backtracks polynomially.
+    (r'(\d{1,2})(?:\s*(?:st|nd|rd|th))?[,\s\-]*' + _MONTHS + r'[,\s\-]*(\d{2,4})',
+     date_parsing.DAY_MONTH_NAME_YEAR,
+     'text_day_month_year'),
+
+    # Month Day Year (August 28 2022, Aug-28-2022)
+    (_MONTHS + r'[,\s\-]*(\d{1,2})(?:st|nd|rd|th)?[,\s\-]*(\d{2,4})',
+     date_parsing.MONTH_NAME_DAY_YEAR,
+     'text_month_day_year'),
+
+    # Month Year only (August 2022, Aug-2022), read as the 1st
+    (_MONTHS + r'[,\s\-]*(\d{4})',
+     date_parsing.MONTH_NAME_YEAR,
+     'text_month_year'),
+
+    # 2. ISO format (2024-12-21, 2024/12/21, 20241221)
+    (r'(\d{4})[/\-](\d{1,2})[/\-](\d{1,2})',
+     date_parsing.YEAR_MONTH_DAY,
+     'iso_format'),
+
+    (r'\b(20\d{2})(\d{2})(\d{2})\b',
+     date_parsing.YEAR_MONTH_DAY,
+     'compact_iso'),
+
+    # 3. Standard formats (12/05/2024, 12-05-2024, 28 12 2025); month and
+    # day order follows the user's preference
+    (r'\b(\d{1,2})[/\-\.](\d{1,2})[/\-\.](\d{4})\b',
+     date_parsing.NUMERIC,
+     'standard_slash_dash'),
+
+    (r'\b(\d{1,2})\s+(\d{1,2})\s+(\d{4})\b',
+     date_parsing.NUMERIC,
+     'space_separated'),
+
+    # 4. Short year (12/05/24, 12-05-24)
+    (r'\b(\d{1,2})[/\-\.](\d{1,2})[/\-\.](\d{2})\b',
+     date_parsing.NUMERIC_SHORT_YEAR,
+     'short_year'),
+]
+
+# Lines skipped by the last-resort date search
+FALLBACK_DATE_SKIP = ('total', 'amount', 'price', 'qty')
+
+
+# --- Merchant, category, payment --------------------------------------------
+
+KNOWN_MERCHANTS = [
+    'Starbucks', 'Walmart', 'Wall-Mart', 'Target', 'Amazon', 'Costco',
+    'McDonald\'s', 'Burger King', 'KFC', 'Subway', 'Domino\'s', 'Pizza Hut',
+    'Shell', 'Chevron', 'Exxon', 'BP', 'Total', 'Caltex',
+    'Whole Foods', 'Trader Joe\'s', 'Safeway', 'Kroger',
+    'CVS', 'Walgreens', '7-Eleven', 'Circle K',
+    'Supermarket', 'Burger Kingdom'
+]
+
+# Header/info lines that are never the merchant name
+MERCHANT_HEADER_SKIP = [
+    'RECEIPT', 'INVOICE', 'TEL', 'PHONE', 'FAX', 'ADDRESS',
+    'STREET', 'CITY', 'STATE', 'ZIP', 'WWW', '.COM', 'HTTP',
+    'MANAGER', 'CASHIER', 'SERVER', 'THANK YOU'
+]
+
+CATEGORY_KEYWORDS = {
+    'Food & Dining': [
+        'restaurant', 'cafe', 'coffee', 'burger', 'pizza', 'sushi',
+        'chinese', 'thai', 'italian', 'mexican', 'fast food',
+        'starbucks', 'mcdonald', 'burger king', 'kfc', 'subway',
+        'food', 'lunch', 'dinner', 'breakfast', 'meal'
+    ],
+    'Groceries': [
+        'supermarket', 'grocery', 'market', 'walmart', 'target', 'costco',
+        'whole foods', 'trader joe', 'safeway', 'kroger',
+        'vegetables', 'fruits', 'meat', 'dairy'
+    ],
+    'Transportation': [
+        'gas', 'fuel', 'petrol', 'diesel', 'shell', 'chevron', 'exxon', 'bp',
+        'parking', 'toll', 'uber', 'lyft', 'taxi', 'transportation'
+    ],
+    'Shopping': [
+        'store', 'mall', 'shop', 'clothing', 'fashion', 'electronics',
+        'amazon', 'best buy', 'apple store'
+    ],
+}
+
+PAYMENT_INDICATORS = {
+    'Credit Card': ['visa', 'mastercard', 'amex', 'discover', 'credit', 'card'],
+    'Cash': ['cash', 'cash payment'],
+    'Bank Transfer': ['transfer', 'online payment', 'e-payment'],
+}
+
+
+def build_rules():
+    families = tuple(
+        AmountFamily(
+            name=name,
+            score=score,
+            variations=tuple((kw, _squash(kw)) for kw in variations),
+            is_total=name == 'TOTAL',
+        )
+        for variations, score, name in PRIORITY_KEYWORDS
+    )
+    needles = {squashed for family in families for _, squashed in family.variations}
+
+    categories = tuple((name, tuple(words)) for name, words in CATEGORY_KEYWORDS.items())
+    payments = tuple((name, tuple(words)) for name, words in PAYMENT_INDICATORS.items())
+    text_keywords = (
+        {w for _, words in categories for w in words}
+        | {w for _, words in payments for w in words}
+    )
+
+    return ExtractionRules(
+        amount_families=families,
+        exclusion_keywords=frozenset(EXCLUSION_KEYWORDS),
+        separators=SEPARATORS,
+        subtotal=SUBTOTAL,
+        dollar_amount=DOLLAR_AMOUNT,
+        standalone_amount=STANDALONE_AMOUNT,
+        line_automaton=KeywordAutomaton(needles | {'sub'}),
+        exclusions=re.compile('|'.join(re.escape(kw) for kw in EXCLUSION_KEYWORDS)),
+        date_keyword_groups=tuple(
+            tuple(_date_keyword(kw) for kw in group) for group in DATE_KEYWORD_GROUPS
+        ),
+        date_patterns=tuple(
+            DatePattern(re.compile(pattern, re.IGNORECASE), layout, name, _MONTHS in pattern)
+            for pattern, layout, name in DATE_PATTERNS
+        ),
+        # Every month alternative starts with its three-letter abbreviation
+        month_name=re.compile(r'Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec', re.IGNORECASE),
+        fallback_date_skip=FALLBACK_DATE_SKIP,
+        merchant_header_skip=re.compile('|'.join(re.escape(x) for x in MERCHANT_HEADER_SKIP)),
+        category_keywords=categories,
+        payment_indicators=payments,
+        text_keywords=tuple(sorted(text_keywords)),
+    )
+
+
+RULES = build_rules()
+
+
+@dataclass(frozen=True)
+class LineFeatures:
+    excluded: bool
+    # (keyword, score, family name, keyword length) for each matching family
+    matches: Tuple[Tuple[str, int, str, int], ...]
+
+
+_PLAIN = LineFeatures(False, ())
+_EXCLUDED = LineFeatures(True, ())
+
+
+def _line_index(starts, pos):
+    return bisect_right(starts, pos) - 1
+
+
+def scan_lines(lines, rules=RULES):
+    """
+    Exclusion flag and amount keyword families of every receipt line.
+
+    Both checks run once over the whole receipt (lines joined by newlines,
+    which no keyword contains) instead of once per line; hits are mapped
+    back to their line by offset.
+    """
+    clean = [line.lower().strip() for line in lines]
+    squashed = [rules.separators.sub('', c) for c in clean]
+
+    features = [_PLAIN] * len(lines)
+    clean_starts, squashed_starts = [], []
+    offset = 0
+    for c in clean:
+        clean_starts.append(offset)
+        offset += len(c) + 1
+    offset = 0
+    for s in squashed:
+        squashed_starts.append(offset)
+        offset += len(s) + 1
+
+    for m in rules.exclusions.finditer("\n".join(clean)):
+        features[_line_index(clean_starts, m.start())] = _EXCLUDED
+
+    hits = {}
+    for start, word in rules.line_automaton.scan("\n".join(squashed)):
+        i = _line_index(squashed_starts, start)
+        if features[i] is not _EXCLUDED:
+            hits.setdefault(i, set()).add(word)
+
+    for i, found in hits.items():
+        matches = []
+        for family in rules.amount_families:
+            for keyword, squashed_kw in family.variations:
+                if squashed_kw in found:
+                    if family.is_total and 'sub' in found and rules.subtotal.search(clean[i]):
+                        break
+                    matches.append((keyword, family.score, family.name, len(keyword)))
+                    break
+        if matches:
+            features[i] = LineFeatures(False, tuple(matches))
+    return features
+
+
+class AmountCandidate(NamedTuple):
+    line: int
+    offset: int      # Start of the number within its line
+    cents: int
+    score: int       # Score of the keyword that applies to it, 0 if none
+    anchor: int      # Line of that keyword: this line or the one above
+    excluded: bool   # The line matched an exclusion keyword
+
+    @property
+    def amount(self):
+        return Decimal(self.cents).scaleb(-2)
+
+
+def _plausible_cents(cents):
+    """Drop values that are rarely a receipt amount: zero, huge, round 1000-9999, years."""
+    # 0.01 is rejected too: the original Decimal check compared against the float 0.01
+    if cents < 2 or cents > 5000000:
+        return False
+    if 100000 <= cents <= 999900 and cents % 100 == 0:
+        return False
+    return not 202000 <= cents <= 203000
+
+
+def scan_amounts(lines, features, rules=RULES):
+    """
+    Every plausible amount in the receipt, in text order, from one pass per
+    amount pattern over the whole text.
+
+    Numbers written as "$12.34" come before bare ones on the same line and
+    a value repeated on a line is kept once. A number takes the score of
+    its line's amount keyword, or of the keyword on the line above when
+    that line has no number of its own ("TOTAL" / "12.34").
+    """
+    starts = []
+    offset = 0
+    for line in lines:
+        starts.append(offset)
+        offset += len(line) + 1
+    doc = "\n".join(lines)
+
+    per_line = {}
+    for m in rules.dollar_amount.finditer(doc):
+        per_line.setdefault(_line_index(starts, m.start(1)), []).append(m)
+    for m in rules.standalone_amount.finditer(doc):
+        start = m.start(1)
+        if start > 0 and doc[start - 1] == '$':
+            continue
+        per_line.setdefault(_line_index(starts, start), []).append(m)
+
+    keyword_scores = [
+        0 if feature.excluded or not feature.matches else max(match[1] for match in feature.matches)
+        for feature in features
+    ]
+    tokens = []
+    has_amount = set()
+    for i in sorted(per_line):
+        excluded = features[i].excluded
+        seen = set()
+        for m in per_line[i]:
+            whole, fraction = m.group(1).split('.')
+            cents = int(whole) * 100 + int(fraction)
+            if cents in seen or not _plausible_cents(cents):
+                continue
+            seen.add(cents)
+            tokens.append((i, m.start(1) - starts[i], cents, excluded))
+            if not excluded:
+                has_amount.add(i)
+
+    candidates = []
+    for i, offset, cents, excluded in tokens:
+        score, anchor = 0, i
+        if not excluded:
+            score = keyword_scores[i]
+            if i > 0 and i - 1 not in has_amount and keyword_scores[i - 1] > score:
+                score, anchor = keyword_scores[i - 1], i - 1
+        candidates.append(AmountCandidate(i, offset, cents, score, anchor, excluded))
+    return candidates
+
+
+def keywords_in(text, rules=RULES):
+    """Merchant, category and payment keywords occurring in lowercased ``text``."""
+    return {keyword for keyword in rules.text_keywords if keyword in text}
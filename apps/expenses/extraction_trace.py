@@ -0,0 +1,69 @@
+# apps/expenses/extraction_trace.py
+#
+# Structured record of the decisions an extractor made (amount candidates
+# and scores, matched keywords, the date pattern used, ...). Tracing is off
+# unless the 'apps.expenses.extraction' logger is at DEBUG or the request is
+# picked by EXTRACTION_TRACE_SAMPLE_RATE; otherwise extractors get NO_TRACE,
+# whose methods do nothing.
+
+import json
+import logging
+import random
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger('apps.expenses.extraction')
+
+
+class ExtractionTrace:
+    enabled = True
+
+    def __init__(self, source, level=logging.DEBUG):
+        self.source = source
+        self.level = level
+        self.steps = []
+
+    def add(self, step, **details):
+        self.steps.append({'step': step, **details})
+
+    def as_dict(self):
+        """JSON-ready copy for AIExtraction.trace."""
+        return json.loads(str(self))
+
+    def emit(self):
+        # Formatted only if a handler actually takes the record
+        logger.log(self.level, "%s extraction trace: %s", self.source, self)
+
+    def __str__(self):
+        return json.dumps({'source': self.source, 'steps': self.steps}, cls=DjangoJSONEncoder)
+
+
+class _NoTrace:
+    enabled = False
+
+    def add(self, step, **details):
+        pass
+
+    def as_dict(self):
+        return None
+
+    def emit(self):
+        pass
+
+
+NO_TRACE = _NoTrace()
+
+
+def start_trace(source):
+    """
+    A new trace for one extraction, or NO_TRACE. Every extraction is traced
+    while the trace logger is at DEBUG; otherwise a sampled fraction is, and
+    those traces are logged at INFO.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        return ExtractionTrace(source)
+    rate = getattr(settings, 'EXTRACTION_TRACE_SAMPLE_RATE', 0.0)
+    if rate and random.random() < rate:
+        return ExtractionTrace(source, level=logging.INFO)
+    return NO_TRACE
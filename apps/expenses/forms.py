@@ -33,6 +33,52 @@ class ExpenseForm(forms.ModelForm):
             self.fields['category'].queryset = Category.objects.filter(user=self.instance.user)
 
 
+class BulkTextEntryForm(forms.Form):
+    """
+    One row of the bulk text review grid. Categories come from the user's
+    CategoryIndex (passed as ``index``) so the grid needs no query per row.
+    Rows that aren't ticked are not validated.
+    """
+    include = forms.BooleanField(required=False, initial=True,
+                                 widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+    source_text = forms.CharField(required=False, widget=forms.HiddenInput)
+    expense_date = forms.DateField(required=False,
+                                   widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+    amount = forms.DecimalField(required=False, max_digits=10, decimal_places=2, min_value=0,
+                                widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'step': '0.01'}))
+    merchant_name = forms.CharField(required=False, max_length=100,
+                                    widget=forms.TextInput(attrs={'class': 'form-control form-control-sm'}))
+    category = forms.TypedChoiceField(required=False, coerce=int,
+                                      widget=forms.Select(attrs={'class': 'form-select form-select-sm'}))
+    payment_method = forms.CharField(required=False, max_length=50,
+                                     widget=forms.TextInput(attrs={'class': 'form-control form-control-sm'}))
+
+    def __init__(self, *args, index=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = index
+        self.fields['category'].choices = [
+            (c.pk, f"{c.icon} {c.category_name}") for c in index.categories
+        ]
+
+    def clean_category(self):
+        pk = self.cleaned_data.get('category')
+        return self.index.get(pk) if pk not in (None, '') else None
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('include'):
+            # Rows left out of the import aren't checked
+            self._errors.clear()
+            return cleaned_data
+        for name in ('expense_date', 'amount', 'category'):
+            if cleaned_data.get(name) is None and name not in self.errors:
+                self.add_error(name, "This field is required.")
+        return cleaned_data
+
+
+BulkTextEntryFormSet = forms.formset_factory(BulkTextEntryForm, extra=0)
+
+
 class ReceiptUploadForm(forms.ModelForm):
     """Form for uploading a receipt image."""
     class Meta:
@@ -0,0 +1,224 @@
+# apps/expenses/image_preprocessing.py
+
+import io
+import mmap
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+from django.conf import settings
+
+
+@dataclass(frozen=True)
+class PreprocessOptions:
+    """Knobs for the pre-OCR image clean-up. ``max_long_edge=None`` keeps the full resolution."""
+    max_long_edge: Optional[int] = 1600
+    contrast: bool = True
+    deskew: bool = False
+    auto_crop: bool = False
+    max_skew_angle: float = 10.0
+    skew_step: float = 0.5
+
+
+def options_from_settings():
+    return PreprocessOptions(
+        max_long_edge=getattr(settings, 'OCR_MAX_LONG_EDGE', 1600),
+        contrast=getattr(settings, 'OCR_CONTRAST_NORMALIZE', True),
+        deskew=getattr(settings, 'OCR_DESKEW', False),
+        auto_crop=getattr(settings, 'OCR_AUTO_CROP', False),
+    )
+
+
+def load_image(source):
+    """Open a path, raw bytes or file-like object as a PIL image."""
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+@contextmanager
+def open_image(source):
+    """
+    Open an image for the duration of the block.
+
+    Paths are memory-mapped so the encoded file is paged in by the OS instead
+    of being copied into a Python buffer. Anything else goes to load_image.
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        yield load_image(source)
+        return
+
+    with open(source, 'rb') as fh:
+        try:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and some filesystems can't be mapped
+            yield Image.open(fh)
+            return
+        with mapped:
+            yield Image.open(mapped)
+
+
+def check_pixel_limit(img, max_pixels=None):
+    """Refuse to decode images larger than RECEIPT_MAX_PIXELS (header only)."""
+    if max_pixels is None:
+        max_pixels = getattr(settings, 'RECEIPT_MAX_PIXELS', None)
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        raise ValueError(f"Image is {width}x{height}, over the {max_pixels} pixel limit.")
+
+
+def _otsu_threshold(gray):
+    """Global Otsu threshold of a uint8 array."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+
+    levels = np.arange(256, dtype=np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = np.divide(sum_bg, weight_bg, out=np.zeros(256), where=weight_bg > 0)
+    mean_fg = np.divide(sum_bg[-1] - sum_bg, weight_fg, out=np.zeros(256), where=weight_fg > 0)
+
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+def crop_to_paper(img, min_fill=0.5, min_area=0.2, padding=8):
+    """
+    Crop a grayscale image to the bright paper area.
+
+    Rows and columns where at least ``min_fill`` of the pixels are brighter
+    than the Otsu threshold are treated as paper. The crop is skipped if the
+    paper box would be smaller than ``min_area`` of the image, which usually
+    means the photo has no clear background.
+    """
+    gray = np.asarray(img)
+    paper = gray > _otsu_threshold(gray)
+
+    rows = np.flatnonzero(paper.mean(axis=1) >= min_fill)
+    cols = np.flatnonzero(paper.mean(axis=0) >= min_fill)
+    if rows.size == 0 or cols.size == 0:
+        return img
+
+    top, bottom = rows[0], rows[-1] + 1
+    left, right = cols[0], cols[-1] + 1
+    height, width = gray.shape
+    if (bottom - top) * (right - left) < min_area * height * width:
+        return img
+
+    box = (
+        max(0, left - padding),
+        max(0, top - padding),
+        min(width, right + padding),
+        min(height, bottom + padding),
+    )
+    return img.crop(box)
+
+
+def estimate_skew(img, max_angle=10.0, step=0.5, sample_edge=600):
+    """
+    Estimate the text skew angle in degrees with a projection profile.
+
+    Text lines produce sharp steps in the row sums of dark pixels when they
+    are horizontal, so the angle whose profile changes most between rows wins.
+    Scoring the steps rather than the raw variance keeps a dark background
+    around the paper from dominating. The search runs on a small copy.
+    """
+    small = img.copy()
+    small.thumbnail((sample_edge, sample_edge))
+    gray = np.asarray(small)
+    ink = Image.fromarray(((gray < _otsu_threshold(gray)) * 255).astype(np.uint8))
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rotated = np.asarray(ink.rotate(float(angle), resample=Image.Resampling.NEAREST, fillcolor=0))
+        profile = rotated.sum(axis=1, dtype=np.float64)
+        score = float(np.sum(np.diff(profile) ** 2))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(img, max_angle=10.0, step=0.5):
+    angle = estimate_skew(img, max_angle=max_angle, step=step)
+    if abs(angle) < step:
+        return img
+    return img.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+
+
+def perceptual_hash(source, hash_size=8):
+    """
+    Difference hash (dHash) of an image as a ``hash_size**2``-bit int.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale grid and
+    each bit says whether a cell is brighter than its right neighbour, so
+    re-compressed, rescaled or slightly re-lit copies hash alike. The paper is
+    cropped first so a different background or framing matters less. JPEGs
+    are decoded at reduced size via ``draft``, which keeps this cheap.
+    """
+    with open_image(source) as img:
+        check_pixel_limit(img)
+        img.draft('L', (256, 256))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('L')
+
+    img.thumbnail((512, 512))
+    img = crop_to_paper(img)
+    grid = np.asarray(
+        img.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS),
+        dtype=np.int16,
+    )
+    bits = (grid[:, 1:] > grid[:, :-1]).ravel()
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def preprocess_receipt(source, options=None):
+    """
+    Prepare a receipt image for OCR and return it as a uint8 grayscale array.
+
+    Steps: EXIF orientation fix, grayscale, downscale to ``max_long_edge``,
+    optional crop to the paper area, optional deskew and contrast stretch.
+    OCR time grows with pixel count, so the downscale matters most.
+    ``source`` may be a path (read through a memory map), bytes, a file
+    object or a PIL image.
+    """
+    options = options or options_from_settings()
+
+    with open_image(source) as img:
+        check_pixel_limit(img)
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('L')
+
+    if options.max_long_edge and max(img.size) > options.max_long_edge:
+        img.thumbnail(
+            (options.max_long_edge, options.max_long_edge),
+            Image.Resampling.LANCZOS,
+            reducing_gap=2.0,
+        )
+
+    if options.auto_crop:
+        img = crop_to_paper(img)
+
+    if options.deskew:
+        img = deskew(img, max_angle=options.max_skew_angle, step=options.skew_step)
+
+    if options.contrast:
+        img = ImageOps.autocontrast(img, cutoff=1)
+
+    return np.asarray(img)
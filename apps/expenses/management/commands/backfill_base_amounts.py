@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from apps.core.currency_rates import rate_snapshot
+from apps.expenses.models import Expense
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in Expense.amount_minor and base_amount_minor (the amount in "
+        "BASE_CURRENCY at the rate of the expense date, in minor units) for "
+        "expenses saved before they existed, in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every expense, e.g. after loading older rates.')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only this user id (can be repeated).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Count the expenses without saving.')
+
+    def handle(self, *args, **options):
+        expenses = Expense.objects.order_by('pk')
+        if not options['all']:
+            expenses = expenses.filter(Q(amount_minor__isnull=True) | Q(base_amount_minor__isnull=True))
+        if options['users']:
+            expenses = expenses.filter(user_id__in=options['users'])
+
+        if options['dry_run']:
+            self.stdout.write(f"[dry run] {expenses.count()} expenses to fill in.")
+            return
+
+        rates = rate_snapshot()
+        batch_size = max(1, options['batch_size'])
+        done = last_pk = 0
+        while True:
+            # Keyset pagination: rows filled in by the last batch drop out of the filter
+            batch = list(
+                expenses.filter(pk__gt=last_pk)
+                .only('pk', 'amount', 'currency', 'expense_date')[:batch_size]
+            )
+            if not batch:
+                break
+            for expense in batch:
+                expense.set_minor_amounts(rates)
+            with transaction.atomic():
+                Expense.objects.bulk_update(batch, ['amount_minor', 'base_amount_minor'])
+            done += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f"  {done} expenses filled in...")
+
+        self.stdout.write(self.style.SUCCESS(f"Filled in the minor-unit amounts of {done} expenses."))
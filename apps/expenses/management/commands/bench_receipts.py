@@ -0,0 +1,226 @@
+import json
+import os
+import time
+from contextlib import redirect_stdout
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.ai_services.models import AIExtraction
+from apps.expenses.image_preprocessing import preprocess_receipt
+from apps.expenses.models import Expense, Receipt
+from apps.expenses.ocr_engines import ENGINE_CLASSES, get_engine, run_ocr
+from apps.expenses.ocr_service import parse_ocr_text
+from apps.expenses.receipt_benchmark import (
+    accuracy,
+    from_parse_ocr_text,
+    from_smart_extract,
+    frozen_today,
+    latency_summary,
+    load_manifest,
+    score_fields,
+)
+from apps.expenses.views import _get_fallback_category, _smart_extract
+
+
+PARSERS = {
+    'smart_extract': (lambda text: _smart_extract(text, None), from_smart_extract),
+    'parse_ocr_text': (parse_ocr_text, from_parse_ocr_text),
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark receipt processing on the checked-in corpus: per-stage latency "
+        "(decode, OCR, extract, DB write), throughput and field accuracy. "
+        "Use --json to compare runs across engine and parser changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=None, help='Corpus directory (default: the checked-in one).')
+        parser.add_argument('--mode', choices=['text', 'image', 'all'], default='all',
+                            help="'text' runs the parsers on the OCR text fixtures, 'image' the full pipeline.")
+        parser.add_argument('--engine', choices=sorted(ENGINE_CLASSES), default=None,
+                            help='OCR engine for image mode (default: the OCR_ENGINES chain).')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Times each text fixture is parsed, for stable timings.')
+        parser.add_argument('--no-db', action='store_true', help='Skip the DB write stage in image mode.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+        parser.add_argument('--output', default=None, help='Also write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        try:
+            manifest = load_manifest(options['corpus'])
+        except FileNotFoundError:
+            raise CommandError("No corpus found; run `manage.py generate_receipt_corpus` first.")
+
+        results = {
+            'generated_at': timezone.now().isoformat(),
+            'reference_date': manifest['reference_date'].isoformat(),
+            'receipts': len(manifest['receipts']),
+        }
+
+        # OCR and pipeline helpers print progress for every receipt; keep it off the terminal.
+        with open(os.devnull, 'w') as devnull, frozen_today(manifest['reference_date']):
+            if options['mode'] in ('text', 'all'):
+                with redirect_stdout(devnull):
+                    results['text'] = self._bench_text(manifest, max(1, options['repeat']))
+            if options['mode'] in ('image', 'all'):
+                with redirect_stdout(devnull):
+                    results['image'] = self._bench_images(manifest, options['engine'], not options['no_db'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(results, fh, indent=2)
+                fh.write("\n")
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._print_report(results)
+
+    def _bench_text(self, manifest, repeat):
+        corpus_dir = manifest['dir']
+        report = {}
+
+        for parser_name, (parse, normalize) in PARSERS.items():
+            report[parser_name] = {}
+            variants = sorted({v for r in manifest['receipts'] for v in r['texts']})
+
+            for variant in variants:
+                timings, scores, failures = [], [], []
+                for receipt in manifest['receipts']:
+                    text = (corpus_dir / receipt['texts'][variant]).read_text(encoding='utf-8')
+
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        found = parse(text)
+                        timings.append(time.perf_counter() - started)
+
+                    row = score_fields(receipt['truth'], normalize(found))
+                    scores.append(row)
+                    if not all(row.values()):
+                        failures.append({
+                            'id': receipt['id'],
+                            'fields': [f for f, ok in row.items() if not ok],
+                        })
+
+                total = sum(timings)
+                report[parser_name][variant] = {
+                    'extract': latency_summary(timings),
+                    'throughput_per_s': round(len(timings) / total, 1) if total else None,
+                    'accuracy': accuracy(scores),
+                    'misses': failures,
+                }
+        return report
+
+    def _bench_images(self, manifest, engine_name, write_db):
+        corpus_dir = manifest['dir']
+        stages = {'decode': [], 'ocr': [], 'extract': [], 'db_write': []}
+        report = {'engine': engine_name or 'chain', 'variants': {}}
+
+        jobs = [
+            (variant, receipt)
+            for receipt in manifest['receipts']
+            for variant in sorted(receipt['images'])
+        ]
+
+        try:
+            with transaction.atomic():
+                user = None
+                if write_db:
+                    user = get_user_model().objects.create_user(
+                        email='bench-receipts@example.invalid',
+                        username='bench-receipts',
+                        full_name='Receipt Benchmark',
+                        password=None,
+                    )
+                    category = _get_fallback_category(user)
+
+                by_variant = {}
+                started_all = time.perf_counter()
+                for variant, receipt in jobs:
+                    path = str(corpus_dir / receipt['images'][variant])
+
+                    started = time.perf_counter()
+                    image = preprocess_receipt(path)
+                    stages['decode'].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    if engine_name:
+                        text = "\n".join(get_engine(engine_name).readtext(image))
+                    else:
+                        text, _engine = run_ocr(image)
+                    stages['ocr'].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    extracted = _smart_extract(text, None)
+                    stages['extract'].append(time.perf_counter() - started)
+
+                    if write_db:
+                        started = time.perf_counter()
+                        with transaction.atomic():
+                            expense = Expense.objects.create(
+                                user=user,
+                                category=category,
+                                amount=extracted['amount'] or 0,
+                                expense_date=extracted['date'],
+                                merchant_name=extracted['merchant'][:100],
+                                description=f"Scanned: {text[:100]}...",
+                                payment_method=extracted['payment_method'],
+                                entry_method='receipt_scan',
+                            )
+                            Receipt.objects.create(expense=expense, file=receipt['images'][variant], ocr_text=text)
+                            AIExtraction.objects.create(
+                                expense=expense,
+                                raw_data={"text": text, "extracted": str(extracted)},
+                                confidence_score=extracted['confidence'],
+                                extraction_method='ocr_easyocr',
+                            )
+                        stages['db_write'].append(time.perf_counter() - started)
+
+                    by_variant.setdefault(variant, []).append(
+                        score_fields(receipt['truth'], from_smart_extract(extracted))
+                    )
+
+                elapsed = time.perf_counter() - started_all
+                # Nothing written by the benchmark is kept
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        report['stages'] = {name: latency_summary(values) for name, values in stages.items() if values}
+        report['throughput_per_s'] = round(len(jobs) / elapsed, 2) if elapsed else None
+        report['accuracy'] = accuracy([row for rows in by_variant.values() for row in rows])
+        report['variants'] = {variant: accuracy(rows) for variant, rows in by_variant.items()}
+        return report
+
+    def _print_report(self, results):
+        self.stdout.write(f"Corpus: {results['receipts']} receipts, scored as of {results['reference_date']}")
+
+        for parser_name, variants in results.get('text', {}).items():
+            for variant, row in variants.items():
+                acc = row['accuracy']
+                self.stdout.write(
+                    f"{parser_name:<16}{variant:<8}"
+                    f"p50 {row['extract']['p50_ms']:>8.3f} ms  "
+                    f"{row['throughput_per_s'] or 0:>9.1f}/s  "
+                    + "  ".join(f"{f} {acc.get(f, 0):.0%}" for f in ('amount', 'date', 'merchant', 'category', 'overall'))
+                )
+
+        image = results.get('image')
+        if image:
+            self.stdout.write(f"\nImage pipeline ({image['engine']}): {image['throughput_per_s']} receipts/s")
+            for stage, row in image['stages'].items():
+                self.stdout.write(f"  {stage:<10}mean {row['mean_ms']:>9.2f} ms  p95 {row['p95_ms']:>9.2f} ms")
+            for variant, acc in image['variants'].items():
+                self.stdout.write(
+                    f"  {variant:<10}"
+                    + "  ".join(f"{f} {acc.get(f, 0):.0%}" for f in ('amount', 'date', 'merchant', 'category', 'overall'))
+                )
@@ -0,0 +1,100 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.expenses.image_preprocessing import PreprocessOptions, preprocess_receipt
+from apps.expenses.ocr_engines import ENGINE_CLASSES, get_engine
+from apps.expenses.receipt_benchmark import from_smart_extract, score_fields
+from apps.expenses.synthetic_receipts import (
+    SAMPLE_RECEIPTS,
+    expected_fields,
+    photograph,
+    receipt_lines,
+    render_receipt,
+)
+from apps.expenses.views import _smart_extract
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare OCR latency and extraction accuracy across preprocessing settings, "
+        "using generated phone-photo style receipts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--long-edges', default='2400,1600,1200,800',
+                            help='Comma separated max long edge values to try.')
+        parser.add_argument('--photo-edge', type=int, default=3000,
+                            help='Long edge of the generated photos, in pixels.')
+        parser.add_argument('--skew', type=float, default=3.0,
+                            help='Rotation applied to the generated photos, in degrees.')
+        parser.add_argument('--engine', default='easyocr', choices=sorted(ENGINE_CLASSES),
+                            help='OCR engine to benchmark.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        edges = [int(e) for e in options['long_edges'].split(',') if e.strip()]
+        default_edge = edges[len(edges) // 2] if edges else 1600
+
+        photos = []
+        for i, sample in enumerate(SAMPLE_RECEIPTS):
+            scan = render_receipt(receipt_lines(sample, today))
+            photo = photograph(scan, long_edge=options['photo_edge'], skew=options['skew'], seed=i)
+            photos.append((photo, expected_fields(sample, today)))
+
+        # 'raw' is what OCR received before this stage existed: the full-size colour image.
+        variants = [('raw', None)]
+        variants += [(f'edge={edge}', PreprocessOptions(max_long_edge=edge)) for edge in edges]
+        variants += [
+            (f'edge={default_edge}+crop', PreprocessOptions(max_long_edge=default_edge, auto_crop=True)),
+            (f'edge={default_edge}+deskew', PreprocessOptions(max_long_edge=default_edge, deskew=True)),
+            (f'edge={default_edge}+crop+deskew',
+             PreprocessOptions(max_long_edge=default_edge, auto_crop=True, deskew=True)),
+        ]
+
+        engine = get_engine(options['engine'])
+        if options['engine'] == 'easyocr':
+            from apps.expenses.ocr_pool import get_reader_pool
+            get_reader_pool().warm()
+
+        results = []
+        for name, opts in variants:
+            prep_total = ocr_total = 0.0
+            correct = fields = 0
+
+            for photo, expected in photos:
+                started = time.perf_counter()
+                image = preprocess_receipt(photo, opts) if opts else np.asarray(photo)
+                prep_total += time.perf_counter() - started
+
+                started = time.perf_counter()
+                text = "\n".join(engine.readtext(image))
+                ocr_total += time.perf_counter() - started
+
+                scores = score_fields(expected, from_smart_extract(_smart_extract(text, None)))
+                fields += len(scores)
+                correct += sum(scores.values())
+
+            count = len(photos)
+            results.append({
+                'variant': name,
+                'preprocess_ms': round(prep_total / count * 1000, 1),
+                'ocr_ms': round(ocr_total / count * 1000, 1),
+                'total_ms': round((prep_total + ocr_total) / count * 1000, 1),
+                'field_accuracy': round(correct / fields, 3) if fields else 0.0,
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'variant':<28}{'prep ms':>10}{'ocr ms':>10}{'total ms':>10}{'accuracy':>10}")
+        for row in results:
+            self.stdout.write(
+                f"{row['variant']:<28}{row['preprocess_ms']:>10}{row['ocr_ms']:>10}"
+                f"{row['total_ms']:>10}{row['field_accuracy']:>10.1%}"
+            )
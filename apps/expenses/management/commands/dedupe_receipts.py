@@ -0,0 +1,64 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from apps.expenses.models import Receipt
+from apps.expenses.receipt_storage import hash_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Hash receipts stored before content addressing and point duplicates "
+        "at a single file, deleting the redundant copies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        hashed = missing = 0
+        entries = {}  # pk -> (file name, content hash)
+
+        for receipt in Receipt.objects.filter(content_hash='').exclude(file='').iterator():
+            if not default_storage.exists(receipt.file.name):
+                missing += 1
+                continue
+            with receipt.file.open('rb') as fh:
+                receipt.content_hash = hash_file(fh)
+            if not dry_run:
+                receipt.save(update_fields=['content_hash'])
+            entries[receipt.pk] = (receipt.file.name, receipt.content_hash)
+            hashed += 1
+
+        self.stdout.write(f"Hashed {hashed} receipts ({missing} with missing files).")
+
+        for pk, name, digest in Receipt.objects.exclude(content_hash='').values_list('pk', 'file', 'content_hash'):
+            entries.setdefault(pk, (name, digest))
+
+        duplicates = {}
+        for pk in sorted(entries):
+            name, digest = entries[pk]
+            duplicates.setdefault(digest, []).append((pk, name))
+
+        relinked = 0
+        released = set()
+        for digest, rows in duplicates.items():
+            keep_name = rows[0][1]
+            for pk, name in rows[1:]:
+                if name == keep_name:
+                    continue
+                relinked += 1
+                released.add(name)
+                if not dry_run:
+                    Receipt.objects.filter(pk=pk).update(file=keep_name)
+
+        deleted = 0
+        for name in released:
+            if dry_run or Receipt.objects.filter(file=name).exists():
+                continue
+            if default_storage.exists(name):
+                default_storage.delete(name)
+                deleted += 1
+
+        prefix = "[dry run] " if dry_run else ""
+        self.stdout.write(f"{prefix}Re-linked {relinked} duplicate receipts, deleted {deleted} files.")
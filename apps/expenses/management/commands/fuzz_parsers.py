@@ -0,0 +1,186 @@
+import json
+import os
+import random
+import time
+from contextlib import redirect_stdout
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.expenses.parser_fuzz import (
+    GENERATORS,
+    generate_case,
+    input_limit,
+    latency_bound_ms,
+    parsers,
+)
+from apps.expenses.receipt_benchmark import latency_summary
+
+BENCH_SIZES = (100, 1000, 10000, 100000)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fuzz the smart-input parsers with adversarial and very long inputs, "
+        "reporting exceptions and parses slower than the per-length latency "
+        "bound, and benchmark their throughput at several input sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['fuzz', 'bench', 'all'], default='all')
+        parser.add_argument('--parser', action='append', dest='parsers',
+                            help='Only this parser (can be repeated).')
+        parser.add_argument('--cases', type=int, default=2000, help='Fuzz cases to generate.')
+        parser.add_argument('--seed', default='0', help='Seed; failures are reported as seed + case number.')
+        parser.add_argument('--max-size', type=int, default=50000, help='Longest fuzz input, in characters.')
+        parser.add_argument('--repeat', type=int, default=20, help='Parses per input in bench mode.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+        parser.add_argument('--output', default=None,
+                            help='Also write the JSON results, with the full failing inputs, to this file.')
+
+    def handle(self, *args, **options):
+        available = parsers()
+        names = options['parsers'] or list(available)
+        unknown = sorted(set(names) - set(available))
+        if unknown:
+            raise CommandError(f"Unknown parser(s): {', '.join(unknown)}. Choose from: {', '.join(available)}")
+        selected = {name: available[name] for name in names}
+
+        results = {
+            'generated_at': timezone.now().isoformat(),
+            'latency_bound': {
+                name: {
+                    'input_limit': input_limit(name),
+                    'max_ms_at_limit': round(latency_bound_ms(name, input_limit(name)), 1),
+                }
+                for name in selected
+            },
+        }
+
+        # Some parsers print while they work; keep it off the terminal.
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            if options['mode'] in ('fuzz', 'all'):
+                results['fuzz'] = self._fuzz(selected, options['seed'], options['cases'], options['max_size'])
+            if options['mode'] in ('bench', 'all'):
+                results['bench'] = self._bench(selected, options['seed'], max(1, options['repeat']))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(results, fh, indent=2)
+                fh.write("\n")
+
+        for row in results.get('fuzz', {}).get('failures', []):
+            row.pop('input', None)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._print_report(results)
+
+        failures = results.get('fuzz', {}).get('failures')
+        over_bound = [row for rows in results.get('bench', {}).values() for row in rows if not row['within_bound']]
+        if failures or over_bound:
+            raise CommandError(
+                f"{len(failures or [])} fuzz failure(s), {len(over_bound)} benchmark size(s) over the latency bound."
+            )
+
+    def _fuzz(self, selected, seed, cases, max_size):
+        failures = []
+        slowest = {name: {'ms': 0.0} for name in selected}
+        by_generator = dict.fromkeys(GENERATORS, 0)
+
+        for case in range(cases):
+            generator, text = generate_case(seed, case, max_size)
+            by_generator[generator] += 1
+
+            for name, parse in selected.items():
+                started = time.perf_counter()
+                try:
+                    parse(text)
+                    error = None
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+                bound = latency_bound_ms(name, len(text))
+                if error is None and elapsed_ms > bound:
+                    error = f"took {elapsed_ms:.1f} ms, bound {bound:.1f} ms"
+                if error:
+                    failures.append({
+                        'parser': name,
+                        'seed': seed,
+                        'case': case,
+                        'generator': generator,
+                        'length': len(text),
+                        'error': error,
+                        'sample': repr(text[:80]),
+                        'input': text,
+                    })
+                if elapsed_ms > slowest[name]['ms']:
+                    slowest[name] = {'ms': round(elapsed_ms, 3), 'case': case, 'length': len(text)}
+
+        return {
+            'cases': cases,
+            'max_size': max_size,
+            'generators': by_generator,
+            'slowest': slowest,
+            'failures': failures,
+        }
+
+    def _bench(self, selected, seed, repeat):
+        report = {}
+        for name, parse in selected.items():
+            report[name] = []
+            for size in BENCH_SIZES:
+                # Receipt-like text and a pathological repeat of the same length
+                rng = random.Random(f"{seed}:{name}:{size}")
+                texts = [GENERATORS['token_soup'](rng, size), GENERATORS['repeated'](rng, size)]
+                timings = []
+                for text in texts:
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        parse(text)
+                        timings.append(time.perf_counter() - started)
+
+                summary = latency_summary(timings)
+                bound = latency_bound_ms(name, size)
+                report[name].append({
+                    'size': size,
+                    'parses_per_s': round(len(timings) / sum(timings), 1) if sum(timings) else None,
+                    'p50_ms': summary['p50_ms'],
+                    'max_ms': summary['max_ms'],
+                    'bound_ms': round(bound, 1),
+                    'within_bound': summary['max_ms'] <= bound,
+                })
+        return report
+
+    def _print_report(self, results):
+        fuzz = results.get('fuzz')
+        if fuzz:
+            self.stdout.write(
+                f"Fuzz: {fuzz['cases']} cases up to {fuzz['max_size']} chars "
+                f"({', '.join(f'{g} {n}' for g, n in fuzz['generators'].items())})"
+            )
+            for name, row in fuzz['slowest'].items():
+                bound = results['latency_bound'][name]
+                self.stdout.write(
+                    f"  {name:<24}slowest {row['ms']:>8.2f} ms  "
+                    f"(reads {bound['input_limit']} chars, bound {bound['max_ms_at_limit']} ms)"
+                )
+            for row in fuzz['failures']:
+                self.stdout.write(self.style.ERROR(
+                    f"  FAIL {row['parser']} seed {row['seed']} case {row['case']} "
+                    f"({row['generator']}, {row['length']} chars): {row['error']}  {row['sample']}"
+                ))
+
+        bench = results.get('bench')
+        if bench:
+            self.stdout.write("\nThroughput (parses/s, p50 / max vs bound in ms):")
+            for name, rows in bench.items():
+                self.stdout.write(f"  {name}")
+                for row in rows:
+                    mark = "ok" if row['within_bound'] else self.style.ERROR("OVER")
+                    self.stdout.write(
+                        f"    {row['size']:>7} chars {row['parses_per_s'] or 0:>11.1f}/s  "
+                        f"p50 {row['p50_ms']:>8.3f}  max {row['max_ms']:>8.3f}  bound {row['bound_ms']:>6.1f}  {mark}"
+                    )
@@ -0,0 +1,81 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.expenses.receipt_benchmark import CORPUS_DIR
+from apps.expenses.synthetic_receipts import (
+    SAMPLE_RECEIPTS,
+    expected_fields,
+    ocr_noise,
+    photograph,
+    receipt_lines,
+    render_receipt,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the receipt benchmark corpus used by `bench_receipts`: a flat scan "
+        "and a phone-style photo of each sample receipt, clean and OCR-noisy text "
+        "fixtures, and manifest.json with the ground truth."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(CORPUS_DIR), help='Corpus directory to (re)write.')
+        parser.add_argument('--photo-edge', type=int, default=1000,
+                            help='Long edge of the photo variants, in pixels.')
+        parser.add_argument('--skew', type=float, default=2.0,
+                            help='Rotation of the photo variants, in degrees.')
+
+    def handle(self, *args, **options):
+        output = Path(options['output'])
+        (output / 'images').mkdir(parents=True, exist_ok=True)
+        (output / 'text').mkdir(parents=True, exist_ok=True)
+        today = timezone.now().date()
+
+        receipts = []
+        for i, sample in enumerate(SAMPLE_RECEIPTS):
+            slug = sample['merchant'].lower().replace(' ', '_')
+            lines = receipt_lines(sample, today)
+
+            scan = render_receipt(lines)
+            scan.save(output / 'images' / f'{slug}_scan.png', optimize=True)
+            photo = photograph(scan, long_edge=options['photo_edge'], skew=options['skew'], noise=3.0, seed=i)
+            photo.save(output / 'images' / f'{slug}_photo.jpg', quality=80, optimize=True)
+
+            (output / 'text' / f'{slug}.txt').write_text("\n".join(lines) + "\n", encoding='utf-8')
+            noisy = ocr_noise(lines, seed=i)
+            (output / 'text' / f'{slug}_noisy.txt').write_text("\n".join(noisy) + "\n", encoding='utf-8')
+
+            truth = expected_fields(sample, today)
+            receipts.append({
+                'id': slug,
+                'images': {
+                    'scan': f'images/{slug}_scan.png',
+                    'photo': f'images/{slug}_photo.jpg',
+                },
+                'texts': {
+                    'clean': f'text/{slug}.txt',
+                    'noisy': f'text/{slug}_noisy.txt',
+                },
+                'truth': {
+                    'amount': str(truth['amount']),
+                    'date': truth['date'].isoformat(),
+                    'merchant': truth['merchant'],
+                    'category': truth['category'],
+                },
+            })
+
+        manifest = {
+            # Receipt dates are fixed in the images; bench_receipts scores
+            # them as if today were this date.
+            'reference_date': today.isoformat(),
+            'receipts': receipts,
+        }
+        with open(output / 'manifest.json', 'w', encoding='utf-8') as fh:
+            json.dump(manifest, fh, indent=2)
+            fh.write("\n")
+
+        self.stdout.write(f"Wrote {len(receipts)} receipts to {output}")
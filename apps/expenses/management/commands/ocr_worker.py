@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from apps.expenses.models import OCRJob
+from apps.expenses.ocr_jobs import (
+    claim_next_job,
+    complete_receipt_text,
+    default_worker_name,
+    process_job,
+    requeue_stale_jobs,
+)
+from apps.expenses.ocr_engines import engine_metrics
+from apps.expenses.ocr_pool import get_reader_pool, warm_reader_pool
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Process pending receipt OCR jobs. Each process runs --concurrency jobs at "
+        "once, sharing one reader pool; start more processes to scale out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default=None, help='Worker name stored on claimed jobs.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue and exit instead of polling forever.')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Jobs processed at once (default: OCR_MAX_CONCURRENCY).')
+
+    def handle(self, *args, **options):
+        worker_name = options['name'] or default_worker_name()
+        concurrency = max(1, options['concurrency'] or getattr(settings, 'OCR_MAX_CONCURRENCY', 1))
+
+        warm_reader_pool()
+        self.stdout.write(f"OCR worker {worker_name} started ({concurrency} at a time).")
+
+        # One thread per concurrent job. They share this process's reader
+        # pool, whose semaphore still caps how many OCR calls run at once;
+        # the rest of a job (downloads, extraction, saving) overlaps freely.
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=self._work,
+                args=(worker_name, options['poll_interval'], options['once'], stop),
+                name=f"{worker_name}-{n}",
+                daemon=True,
+            )
+            for n in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1.0)
+        except KeyboardInterrupt:
+            # let the running jobs finish; unclaimed ones stay queued
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        for name, stats in engine_metrics().items():
+            self.stdout.write(
+                f"{name}: {stats['count']} calls, avg {stats['avg']:.2f}s, "
+                f"{stats['errors']} errors ({stats['timeouts']} timeouts), buckets {stats['buckets']}"
+            )
+        pool = get_reader_pool().stats()
+        self.stdout.write(
+            f"reader pool: {pool['readers_loaded']}/{pool['size']} readers, "
+            f"max {pool['max_concurrency']} at once, {pool['inference_calls']} calls "
+            f"(avg {pool['inference_avg']:.2f}s, max {pool['inference_max']:.2f}s, "
+            f"{pool['inference_errors']} errors), {pool['checkouts']} checkouts "
+            f"(avg wait {pool['checkout_wait_avg']:.2f}s, max {pool['checkout_wait_max']:.2f}s)"
+        )
+        self.stdout.write(f"OCR worker {worker_name} stopped.")
+
+    def _work(self, worker_name, poll_interval, once, stop):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                requeue_stale_jobs()
+                job = claim_next_job(worker_name)
+
+                if job is None:
+                    if once:
+                        break
+                    stop.wait(poll_interval)
+                    continue
+
+                try:
+                    self._run_job(job)
+                except Exception:
+                    # e.g. the database went away while marking it failed;
+                    # the job is requeued once it goes stale
+                    logger.exception("OCR job %s crashed", job.pk)
+        finally:
+            # each thread has its own connection
+            connection.close()
+
+    def _run_job(self, job):
+        started = time.perf_counter()
+        if job.kind == OCRJob.KIND_FULL_TEXT:
+            receipt = complete_receipt_text(job)
+            elapsed = time.perf_counter() - started
+            if receipt:
+                self.stdout.write(f"Job {job.pk}: full text of receipt {receipt.pk} read in {elapsed:.2f}s")
+            else:
+                self.stderr.write(f"Job {job.pk}: failed after {elapsed:.2f}s")
+            return
+
+        expense = process_job(job)
+        elapsed = time.perf_counter() - started
+
+        if expense:
+            self.stdout.write(f"Job {job.pk}: expense {expense.pk} created in {elapsed:.2f}s")
+        elif job.status == OCRJob.STATUS_DONE:
+            self.stdout.write(f"Job {job.pk}: read in {elapsed:.2f}s, waiting for the rest of its batch")
+        else:
+            self.stderr.write(f"Job {job.pk}: failed after {elapsed:.2f}s")
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.categories.index import FALLBACK_CATEGORY_NAME
+from apps.categories.models import Category
+from apps.expenses.categorizer import features, forget_categorizer, get_categorizer
+from apps.expenses.models import Expense
+
+
+class Command(BaseCommand):
+    help = (
+        "Move 'Uncategorized' expenses to the category each user's learned "
+        "categorizer is confident about. Predictions run vectorized per batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only this user id (can be repeated).')
+        parser.add_argument('--min-probability', type=float, default=None,
+                            help='Confidence needed to move an expense (default: CATEGORIZER_MIN_PROBABILITY).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without saving.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        threshold = options['min_probability']
+        if threshold is None:
+            threshold = getattr(settings, 'CATEGORIZER_MIN_PROBABILITY', 0.6)
+        min_examples = getattr(settings, 'CATEGORIZER_MIN_EXAMPLES', 10)
+
+        uncategorized = Expense.objects.filter(category__category_name=FALLBACK_CATEGORY_NAME).order_by()
+        if options['users']:
+            uncategorized = uncategorized.filter(user_id__in=options['users'])
+        user_ids = sorted(set(uncategorized.values_list('user_id', flat=True)))
+
+        total_seen = total_moved = 0
+        for user_id in user_ids:
+            model = get_categorizer(user_id)
+            if not model.classes or model.n_docs < min_examples:
+                self.stdout.write(f"User {user_id}: not enough categorized expenses, skipped.")
+                continue
+            valid = set(Category.objects.filter(user_id=user_id, pk__in=model.classes).values_list('pk', flat=True))
+
+            rows = list(
+                uncategorized.filter(user_id=user_id).values_list('pk', 'merchant_name', 'description')
+            )
+            moves = {}  # category id -> expense pks
+            for start in range(0, len(rows), options['batch_size']):
+                batch = rows[start:start + options['batch_size']]
+                predicted, probability = model.predict_many(
+                    [features(merchant, description) for _pk, merchant, description in batch]
+                )
+                for (pk, _m, _d), category_id, p in zip(batch, predicted, probability):
+                    if p >= threshold and category_id in valid:
+                        moves.setdefault(category_id, []).append(pk)
+
+            moved = sum(len(pks) for pks in moves.values())
+            if not dry_run and moves:
+                now = timezone.now()
+                with transaction.atomic():
+                    for category_id, pks in moves.items():
+                        Expense.objects.filter(pk__in=pks).update(category_id=category_id, updated_at=now)
+                forget_categorizer(user_id)
+
+            total_seen += len(rows)
+            total_moved += moved
+            self.stdout.write(f"User {user_id}: {moved} of {len(rows)} uncategorized expenses recategorized.")
+
+        prefix = "[dry run] " if dry_run else ""
+        self.stdout.write(f"{prefix}Recategorized {total_moved} of {total_seen} expenses.")
@@ -0,0 +1,353 @@
+# apps/expenses/merchants.py
+#
+# Merchant dictionary used by smart input: built-in brands plus merchants
+# learned from each user's manual entries and edits (MerchantAlias), matched
+# in one pass over the text with a character trie. Names must be whole words,
+# and the one found earliest in the text wins (receipts name the merchant at
+# the top); of names starting at the same place, the longest does.
+#
+# Each process keeps a trie per user. New entries are appended to a per-user
+# log in the cache and applied to those tries incrementally. The log is a
+# generation token, a length counter bumped with cache.incr and one key per
+# entry, so appends don't race and a lookup only reads the two small keys
+# (plus any entries it hasn't applied yet). The log gets a new generation
+# (and tries are rebuilt from the database) when it is lost, has a gap, is
+# too long, or an alias is deleted.
+
+import threading
+import uuid
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .extraction_rules import KNOWN_MERCHANTS
+from .quick_add import invalidate_quick_add_cache
+
+# Brands looked for in free-form voice/text input; the rest of the receipt
+# list only counts on receipts.
+SPOKEN_MERCHANTS = [
+    'Starbucks', 'Walmart', 'Target', 'Amazon', 'Costco',
+    'McDonald\'s', 'Burger King', 'KFC', 'Subway', 'Domino\'s',
+    'Shell', 'Chevron', 'Uber', 'Lyft', 'Netflix', 'Spotify',
+    'Whole Foods', 'Trader Joe\'s', 'Safeway', 'Kroger'
+]
+# Brands that are also words printed on most receipts ('TOTAL', ...). They
+# aren't looked for, so a receipt from one is named by its header line.
+GENERIC_MERCHANTS = {'Total', 'Supermarket'}
+BUILTIN_MERCHANTS = [
+    m for m in dict.fromkeys(KNOWN_MERCHANTS + SPOKEN_MERCHANTS) if m not in GENERIC_MERCHANTS
+]
+
+# Names filled in when nothing was found; never learned
+PLACEHOLDER_MERCHANTS = {'unknown merchant', 'scanned receipt', 'voice entry', 'quick add'}
+MIN_LEARNED_LENGTH = 3
+
+SOURCE_BUILTIN = 'builtin'
+SOURCE_LEARNED = 'learned'
+SOURCE_ALIAS = 'alias'
+
+_END = ''  # Trie key of a node's entry; never a character of the text
+
+
+class MerchantMatch(NamedTuple):
+    merchant: str
+    source: str
+    start: int
+    end: int
+
+
+def _is_word_char(ch):
+    return ch.isalnum()
+
+
+class MerchantTrie:
+    """
+    Character trie of lowercased names, matched as whole words. Entries can
+    be left out of lookups in free-form (spoken) text.
+    """
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    def add(self, key, merchant, source, spoken=True):
+        node = self._root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = (merchant, source, spoken)
+
+    def get(self, key):
+        """``(merchant, source)`` stored under exactly ``key``, or None."""
+        node = self._root
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                return None
+        entry = node.get(_END)
+        return entry[:2] if entry is not None else None
+
+    def first_match(self, text, spoken=False):
+        """
+        Earliest entry occurring in lowercased ``text`` (the longest of those
+        starting there), as a MerchantMatch, or None. With ``spoken``,
+        receipt-only entries are skipped.
+        """
+        root = self._root
+        n = len(text)
+        for i in range(n):
+            node = root.get(text[i])
+            if node is None or (i > 0 and _is_word_char(text[i - 1])):
+                continue
+            best = None
+            j = i + 1
+            while True:
+                entry = node.get(_END)
+                if entry is not None and (entry[2] or not spoken) and (j == n or not _is_word_char(text[j])):
+                    best = MerchantMatch(entry[0], entry[1], i, j)
+                if j == n:
+                    break
+                node = node.get(text[j])
+                if node is None:
+                    break
+                j += 1
+            if best is not None:
+                return best
+        return None
+
+    find = first_match
+
+
+def learnable_key(name):
+    """Lowercased dictionary key for a merchant name, or None if it shouldn't be learned."""
+    key = ' '.join((name or '').split()).lower()
+    if len(key) < MIN_LEARNED_LENGTH or key in PLACEHOLDER_MERCHANTS:
+        return None
+    if not any(ch.isalpha() for ch in key):
+        return None
+    return key
+
+
+def is_builtin(name):
+    return (name or '').strip().lower() in _BUILTIN_KEYS
+
+
+def _builtin_trie():
+    trie = MerchantTrie()
+    spoken = set(SPOKEN_MERCHANTS)
+    for merchant in BUILTIN_MERCHANTS:
+        trie.add(merchant.lower(), merchant, SOURCE_BUILTIN, spoken=merchant in spoken)
+    return trie
+
+
+# Generic names are never learned as aliases either
+_BUILTIN_KEYS = frozenset(m.lower() for m in BUILTIN_MERCHANTS + sorted(GENERIC_MERCHANTS))
+BUILTIN_TRIE = _builtin_trie()
+
+
+# --- Per-user dictionaries -------------------------------------------------
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _generation_key(user_id):
+    return f"merchant_dictionary_generation:{user_id}"
+
+
+def _length_key(user_id, generation):
+    return f"merchant_dictionary_length:{user_id}:{generation}"
+
+
+def _entry_key(user_id, generation, n):
+    return f"merchant_dictionary_entry:{user_id}:{generation}:{n}"
+
+
+class _UserDictionary:
+    __slots__ = ('trie', 'generation', 'applied')
+
+    def __init__(self, generation):
+        self.trie = _builtin_trie()
+        self.generation = generation
+        self.applied = 0
+
+    def apply(self, entries):
+        for key, merchant, source in entries:
+            self.trie.add(key, merchant, source)
+        self.applied += len(entries)
+
+
+def _entries_from_db(user_id):
+    """Learned entries, oldest first, so the latest spelling of a name wins."""
+    from django.db.models import Max
+    from .models import Expense, MerchantAlias
+
+    entries = []
+    names = (
+        Expense.objects
+        .filter(user_id=user_id, entry_method='manual')
+        .values('merchant_name')
+        .annotate(last=Max('updated_at'))
+        .order_by('last')
+    )
+    for row in names:
+        key = learnable_key(row['merchant_name'])
+        if key:
+            entries.append((key, row['merchant_name'].strip(), SOURCE_LEARNED))
+
+    for alias, merchant in (
+        MerchantAlias.objects.filter(user_id=user_id).order_by('updated_at').values_list('alias', 'merchant_name')
+    ):
+        key = learnable_key(alias)
+        if key:
+            entries.append((key, merchant, SOURCE_ALIAS))
+    return entries
+
+
+def _build_log(user_id):
+    """Write the user's entries from the database as a new generation; returns ``(generation, length)``."""
+    generation = uuid.uuid4().hex
+    entries = _entries_from_db(user_id)
+    ttl = getattr(settings, 'MERCHANT_DICTIONARY_TTL', 7 * 86400)
+    # The entries and length first: the generation key publishes them
+    cache.set_many(
+        {_entry_key(user_id, generation, n): entry for n, entry in enumerate(entries, 1)},
+        ttl,
+    )
+    cache.set(_length_key(user_id, generation), len(entries), ttl)
+    cache.set(_generation_key(user_id), generation, ttl)
+    return generation, len(entries)
+
+
+def reset_merchant_dictionary(user_id):
+    """Rebuild the user's entry log from the database under a new generation."""
+    log = _build_log(user_id)
+    invalidate_quick_add_cache(user_id)
+    return log
+
+
+def learn_merchant(user_id, key, merchant, source=SOURCE_LEARNED):
+    """Append one entry to the user's log; processes apply it on their next lookup."""
+    generation = cache.get(_generation_key(user_id))
+    if generation is None:
+        # The rebuild reads the database, which already has this entry
+        reset_merchant_dictionary(user_id)
+        return
+
+    with _local_lock:
+        user_dict = _local.get(user_id)
+        if user_dict is not None and user_dict.generation == generation:
+            known = user_dict.trie.get(key)
+        else:
+            known = None
+    if known == (merchant, source):
+        return
+
+    try:
+        n = cache.incr(_length_key(user_id, generation))
+    except ValueError:
+        # The length expired
+        reset_merchant_dictionary(user_id)
+        return
+    if n > getattr(settings, 'MERCHANT_DICTIONARY_MAX_LOG', 2000):
+        reset_merchant_dictionary(user_id)
+        return
+
+    cache.set(
+        _entry_key(user_id, generation, n), (key, merchant, source),
+        getattr(settings, 'MERCHANT_DICTIONARY_TTL', 7 * 86400),
+    )
+    invalidate_quick_add_cache(user_id)
+
+
+def _log_version(user_id, generation):
+    """``(generation, length)`` of the user's log, rebuilt when it is missing."""
+    keys = [_generation_key(user_id)]
+    if generation is not None:
+        keys.append(_length_key(user_id, generation))
+    found = cache.get_many(keys)
+
+    current = found.get(keys[0])
+    if current is not None and current != generation:
+        generation, length = current, cache.get(_length_key(user_id, current))
+    else:
+        generation, length = current, found.get(keys[-1])
+    if generation is None or length is None:
+        # Same entries as before it expired, so cached quick-add parses stay
+        return _build_log(user_id)
+    return generation, length
+
+
+def _read_entries(user_id, generation, start, stop):
+    """Entries ``start + 1`` to ``stop`` of the log, or None when one of them is missing."""
+    keys = [_entry_key(user_id, generation, n) for n in range(start + 1, stop + 1)]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return None
+    return [found[k] for k in keys]
+
+
+def get_merchant_dictionary(user):
+    """
+    The merchant trie for ``user``: ``find(text_lower[, spoken])`` returns
+    the best MerchantMatch or None. Without a user only built-in brands are
+    known.
+    """
+    if user is None:
+        return BUILTIN_TRIE
+
+    with _local_lock:
+        user_dict = _local.get(user.pk)
+    generation, length = _log_version(user.pk, user_dict.generation if user_dict else None)
+
+    if user_dict is None or user_dict.generation != generation:
+        user_dict = _UserDictionary(generation)
+    start = user_dict.applied
+    entries = []
+    if start < length:
+        entries = _read_entries(user.pk, generation, start, length)
+        if entries is None:
+            # Expired, or lost to a concurrent rebuild: start again from the database
+            generation, length = reset_merchant_dictionary(user.pk)
+            user_dict, start = _UserDictionary(generation), 0
+            entries = _read_entries(user.pk, generation, 0, length) or []
+
+    size = getattr(settings, 'MERCHANT_DICTIONARY_LOCAL_SIZE', 256)
+    with _local_lock:
+        current = _local.get(user.pk)
+        if current is not None and current.generation == generation and current.applied >= start:
+            # Another thread may have applied some of these already
+            user_dict = current
+        user_dict.apply(entries[user_dict.applied - start:])
+        _local[user.pk] = user_dict
+        _local.move_to_end(user.pk)
+        while len(_local) > size:
+            _local.popitem(last=False)
+    return user_dict.trie
+
+
+def record_merchant_edit(user, old_name, new_name):
+    """
+    Learn from an edited expense: the saved name is confirmed, and the name
+    it replaced (e.g. a misread receipt header) becomes an alias of it.
+    Built-in brand names are never turned into aliases.
+    """
+    from .models import MerchantAlias
+
+    new_key = learnable_key(new_name)
+    if not new_key:
+        return
+    new_name = new_name.strip()
+
+    keys = [new_key]
+    old_key = learnable_key(old_name)
+    if old_key and old_key != new_key and not is_builtin(old_name):
+        keys.append(old_key)
+
+    for key in keys:
+        MerchantAlias.objects.update_or_create(
+            user=user, alias=key[:100], defaults={'merchant_name': new_name}
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0003_receipt_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+    ]
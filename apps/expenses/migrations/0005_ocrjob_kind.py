@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0004_receipt_perceptual_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrjob',
+            name='kind',
+            field=models.CharField(choices=[('expense', 'Create expense'), ('full_text', 'Complete OCR text')], default='expense', max_length=20),
+        ),
+    ]
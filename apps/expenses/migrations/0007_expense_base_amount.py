@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0006_merchantalias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='base_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=18, null=True),
+        ),
+    ]
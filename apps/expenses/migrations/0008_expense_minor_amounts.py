@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db import migrations, models
+
+from apps.core.money import to_minor
+
+
+def fill_minor_amounts(apps, schema_editor):
+    # base_amount was already converted (to the cent); carry it over as is
+    Expense = apps.get_model('expenses', 'Expense')
+    base_currency = getattr(settings, 'BASE_CURRENCY', 'USD')
+    expenses = Expense.objects.order_by('pk').only('pk', 'amount', 'currency', 'base_amount')
+    last_pk = 0
+    while True:
+        batch = list(expenses.filter(pk__gt=last_pk)[:1000])
+        if not batch:
+            break
+        for expense in batch:
+            expense.amount_minor = to_minor(expense.amount, expense.currency or 'USD')
+            if expense.base_amount is not None:
+                expense.base_amount_minor = to_minor(expense.base_amount, base_currency)
+        Expense.objects.bulk_update(batch, ['amount_minor', 'base_amount_minor'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0007_expense_base_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='amount_minor',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='base_amount_minor',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_minor_amounts, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='expense',
+            name='base_amount',
+        ),
+    ]
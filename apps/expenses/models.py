@@ -1,6 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from apps.categories.models import Category
+from apps.core.currency_rates import convert_amount
+from apps.core.money import to_minor
+
+# Fields amount_minor and base_amount_minor are worked out from
+MINOR_AMOUNT_INPUTS = {'amount', 'currency', 'expense_date'}
 
 
 class Expense(models.Model):
@@ -16,6 +23,13 @@ class Expense(models.Model):
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='expenses')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, default='USD')
+    # amount as an integer of the currency's minor unit (see apps/core/money.py),
+    # and in settings.BASE_CURRENCY's minor unit at the rate of expense_date.
+    # Both are set on save, so totals are exact integer sums in SQL (see
+    # totals.py). Null only for rows written before they existed:
+    # `manage.py backfill_base_amounts`
+    amount_minor = models.BigIntegerField(null=True, blank=True, editable=False)
+    base_amount_minor = models.BigIntegerField(null=True, blank=True, editable=False)
     expense_date = models.DateField()
     merchant_name = models.CharField(max_length=100, blank=True)
     description = models.TextField(blank=True)
@@ -36,6 +50,34 @@ class Expense(models.Model):
     def __str__(self):
         return f"{self.merchant_name} - ${self.amount}"
 
+    def _minor_amount_inputs(self):
+        return (self.amount, self.currency or 'USD', self._meta.get_field('expense_date').to_python(self.expense_date))
+
+    def set_minor_amounts(self, snapshot=None):
+        """
+        Work out amount_minor and base_amount_minor; pass a rate snapshot
+        when doing this for many expenses. Without one the rates may be
+        fetched, so call this with a snapshot before opening a transaction
+        that holds locks: save() then keeps the amounts unless an input
+        changed since.
+        """
+        amount, currency, expense_date = inputs = self._minor_amount_inputs()
+        base_currency = getattr(settings, 'BASE_CURRENCY', 'USD')
+        self.amount_minor = to_minor(amount, currency)
+        self.base_amount_minor = to_minor(
+            convert_amount(amount, currency, base_currency, snapshot, on=expense_date), base_currency
+        )
+        self._minor_amounts_for = inputs
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or MINOR_AMOUNT_INPUTS & set(update_fields):
+            if getattr(self, '_minor_amounts_for', None) != self._minor_amount_inputs():
+                self.set_minor_amounts()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'amount_minor', 'base_amount_minor'}
+        super().save(*args, **kwargs)
+
 
 class Receipt(models.Model):
     """Receipt attachments for expenses"""
@@ -52,9 +94,153 @@ class Receipt(models.Model):
     file_type = models.CharField(max_length=50, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     ocr_text = models.TextField(blank=True, null=True) # Raw text result from OCR
+    # SHA-256 of the file content. Receipts with the same hash share one stored file.
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # 64-bit dHash in hex, used to spot re-photographed copies of the same receipt.
+    perceptual_hash = models.CharField(max_length=16, blank=True)
     
     class Meta:
         db_table = 'RECEIPT'
     
     def __str__(self):
-        return f"Receipt ID {self.pk} - Linked to Expense {self.expense_id or 'Unlinked'}"
\ No newline at end of file
+        return f"Receipt ID {self.pk} - Linked to Expense {self.expense_id or 'Unlinked'}"
+
+class OCRJob(models.Model):
+    """Background OCR work for an uploaded receipt"""
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    # 'expense' jobs create the Expense; 'full_text' jobs complete Receipt.ocr_text
+    # after the expense was made from a partial (region-of-interest) read.
+    KIND_EXPENSE = 'expense'
+    KIND_FULL_TEXT = 'full_text'
+    KIND_CHOICES = [
+        (KIND_EXPENSE, 'Create expense'),
+        (KIND_FULL_TEXT, 'Complete OCR text'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ocr_jobs')
+    receipt = models.ForeignKey(Receipt, on_delete=models.CASCADE, related_name='ocr_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=KIND_EXPENSE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    worker = models.CharField(max_length=100, blank=True)  # Which worker process claimed the job
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Receipts uploaded together share a batch; the last of its jobs to finish
+    # creates all of their expenses at once (see ocr_jobs.py). Until then a
+    # finished job keeps what it extracted in ``result``.
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'OCR_JOB'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"OCR Job {self.pk} ({self.status}) - Receipt {self.receipt_id}"
+
+
+class MerchantAlias(models.Model):
+    """
+    A merchant name the user confirmed or corrected on the edit page.
+    ``alias`` is the lowercased text to look for (the saved name itself, or
+    the name it replaced); see merchants.py.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='merchant_aliases')
+    alias = models.CharField(max_length=100)
+    merchant_name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'MERCHANT_ALIAS'
+        unique_together = ['user', 'alias']
+
+    def __str__(self):
+        return f"{self.alias} -> {self.merchant_name}"
+
+
+@receiver(post_delete, sender=Receipt)
+def release_receipt_file(sender, instance, **kwargs):
+    """Delete the stored image once no other receipt references it."""
+    name = instance.file.name
+    if not name:
+        return
+
+    storage = instance.file.storage
+
+    def _release():
+        if not Receipt.objects.filter(file=name).exists():
+            storage.delete(name)
+
+    transaction.on_commit(_release)
+
+
+@receiver(post_save, sender=Expense)
+def learn_expense_merchant(sender, instance, **kwargs):
+    """Add the merchant of a manually entered expense to the user's dictionary."""
+    if instance.entry_method != 'manual':
+        return
+    from .merchants import SOURCE_LEARNED, learn_merchant, learnable_key
+
+    key = learnable_key(instance.merchant_name)
+    if key:
+        user_id, merchant = instance.user_id, instance.merchant_name.strip()
+        transaction.on_commit(lambda: learn_merchant(user_id, key, merchant, SOURCE_LEARNED))
+
+
+@receiver(post_save, sender=Expense)
+def update_categorizer(sender, instance, created, **kwargs):
+    """Count new expenses in the user's category model; retrain it after edits."""
+    from apps.categories.index import category_index_for
+    from .categorizer import forget_categorizer, learn_expense
+
+    user_id = instance.user_id
+    if not created:
+        transaction.on_commit(lambda: forget_categorizer(user_id))
+        return
+    fallback = category_index_for(user_id).fallback
+    if fallback is not None and instance.category_id == fallback.pk:
+        return
+    args = (user_id, instance.category_id, instance.merchant_name, instance.description)
+    transaction.on_commit(lambda: learn_expense(*args))
+
+
+@receiver(post_delete, sender=Expense)
+def forget_deleted_expense(sender, instance, **kwargs):
+    from .categorizer import forget_categorizer
+
+    user_id = instance.user_id
+    transaction.on_commit(lambda: forget_categorizer(user_id))
+
+
+@receiver(post_save, sender=MerchantAlias)
+def learn_merchant_alias(sender, instance, **kwargs):
+    from .merchants import SOURCE_ALIAS, learn_merchant, learnable_key
+
+    key = learnable_key(instance.alias)
+    if key:
+        user_id, merchant = instance.user_id, instance.merchant_name
+        transaction.on_commit(lambda: learn_merchant(user_id, key, merchant, SOURCE_ALIAS))
+
+
+@receiver(post_delete, sender=MerchantAlias)
+def forget_merchant_alias(sender, instance, **kwargs):
+    from .merchants import reset_merchant_dictionary
+
+    user_id = instance.user_id
+    transaction.on_commit(lambda: reset_merchant_dictionary(user_id))
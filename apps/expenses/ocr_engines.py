@@ -0,0 +1,284 @@
+# apps/expenses/ocr_engines.py
+
+import bisect
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OCRTimeout(Exception):
+    """An engine took longer than its configured timeout."""
+
+
+class OCRFailed(Exception):
+    """Every engine in the chain failed or returned too little text."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {err}" for name, err in errors) or "No OCR engines configured")
+
+
+class LatencyHistogram:
+    """Thread-safe cumulative latency histogram with fixed bucket bounds (seconds)."""
+    BOUNDS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, bounds=None):
+        self.bounds = tuple(bounds or self.BOUNDS)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._errors = 0
+        self._timeouts = 0
+
+    def observe(self, seconds, error=False, timeout=False):
+        index = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+            self._count += 1
+            self._errors += int(error)
+            self._timeouts += int(timeout)
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            data = {
+                'count': self._count,
+                'sum': self._sum,
+                'avg': self._sum / self._count if self._count else 0.0,
+                'errors': self._errors,
+                'timeouts': self._timeouts,
+            }
+        labels = [f"le_{bound:g}" for bound in self.bounds] + ['le_inf']
+        data['buckets'] = dict(zip(labels, counts))
+        return data
+
+
+class OCREngine:
+    """
+    Base class for OCR backends.
+
+    Subclasses implement ``_readtext(image)`` and return the text lines.
+    ``readtext`` adds the per-call timeout and records latency.
+    """
+    name = None
+    default_timeout = 60
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout if timeout is not None else self.default_timeout
+        self.histogram = LatencyHistogram()
+
+    def _readtext(self, image):
+        raise NotImplementedError
+
+    def _call(self, image):
+        return self._readtext(image)
+
+    def readtext(self, image):
+        started = time.perf_counter()
+        try:
+            lines = self._call(image)
+        except OCRTimeout:
+            self.histogram.observe(time.perf_counter() - started, error=True, timeout=True)
+            raise
+        except Exception:
+            self.histogram.observe(time.perf_counter() - started, error=True)
+            raise
+        self.histogram.observe(time.perf_counter() - started)
+        return lines
+
+
+# EasyOCR has no timeout of its own, so calls run on helper threads and the
+# caller stops waiting after the timeout. An abandoned call can't be stopped:
+# it keeps its thread and its pooled reader until readtext returns. Calls hold
+# one of the reader pool's max_concurrency slots from submission until they
+# return, and there are as many threads as slots, so nothing queues behind
+# stuck calls. Once every slot is taken, new calls time out.
+_timeout_executor = None
+_timeout_slots = None
+_timeout_lock = threading.Lock()
+
+
+def _timeout_runner():
+    global _timeout_executor, _timeout_slots
+    if _timeout_executor is None:
+        with _timeout_lock:
+            if _timeout_executor is None:
+                from .ocr_pool import get_reader_pool
+                size = get_reader_pool().max_concurrency
+                _timeout_slots = threading.BoundedSemaphore(size)
+                _timeout_executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='ocr-timeout')
+    return _timeout_executor, _timeout_slots
+
+
+class EasyOCREngine(OCREngine):
+    name = 'easyocr'
+    default_timeout = 60
+
+    def _readtext(self, image):
+        from .ocr_pool import get_reader_pool
+        return get_reader_pool().readtext(image, detail=0)
+
+    def _with_timeout(self, fn, *args):
+        if not self.timeout:
+            return fn(*args)
+        executor, slots = _timeout_runner()
+        started = time.monotonic()
+        if not slots.acquire(timeout=self.timeout):
+            raise OCRTimeout(f"easyocr readers stayed busy for {self.timeout}s")
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=max(0, self.timeout - (time.monotonic() - started)))
+        except FutureTimeout:
+            raise OCRTimeout(f"easyocr took longer than {self.timeout}s")
+
+    def _call(self, image):
+        return self._with_timeout(self._readtext, image)
+
+    def _detect_key_regions(self, image, options):
+        from .ocr_pool import get_reader_pool
+        from .roi_ocr import detect_key_regions
+        with get_reader_pool().reader() as reader:
+            return detect_key_regions(reader, image, options)
+
+    def _recognize_remaining(self, regions):
+        from .ocr_pool import get_reader_pool
+        from .roi_ocr import recognize_remaining
+        with get_reader_pool().reader() as reader:
+            return recognize_remaining(reader, regions)
+
+    def _observed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            result = self._with_timeout(fn, *args)
+        except OCRTimeout:
+            self.histogram.observe(time.perf_counter() - started, error=True, timeout=True)
+            raise
+        except Exception:
+            self.histogram.observe(time.perf_counter() - started, error=True)
+            raise
+        self.histogram.observe(time.perf_counter() - started)
+        return result
+
+    def read_key_regions(self, image, extract):
+        """
+        Two-stage read of the merchant/total regions; see roi_ocr.read_key_regions.
+        Only the OCR runs on the timeout threads: ``extract`` runs in the
+        calling thread, so it can use that thread's database connection.
+        """
+        from .roi_ocr import options_from_settings, read_key_regions
+        options = options_from_settings()
+        return read_key_regions(
+            lambda: self._observed(self._detect_key_regions, image, options),
+            lambda regions: self._observed(self._recognize_remaining, regions),
+            extract,
+            options,
+        )
+
+
+class TesseractEngine(OCREngine):
+    name = 'tesseract'
+    default_timeout = 20
+
+    def __init__(self, timeout=None):
+        super().__init__(timeout)
+        import pytesseract
+        self._pytesseract = pytesseract
+
+        cmd = getattr(settings, 'TESSERACT_CMD', None)
+        if cmd:
+            pytesseract.pytesseract.tesseract_cmd = cmd
+
+    def _readtext(self, image):
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        elif isinstance(image, (str, bytes, bytearray)):
+            from .image_preprocessing import load_image
+            image = load_image(image)
+
+        try:
+            text = self._pytesseract.image_to_string(image, timeout=self.timeout or 0)
+        except RuntimeError as e:
+            # pytesseract kills the subprocess and raises RuntimeError on timeout
+            if 'timeout' in str(e).lower():
+                raise OCRTimeout(f"tesseract took longer than {self.timeout}s")
+            raise
+        return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+ENGINE_CLASSES = {
+    EasyOCREngine.name: EasyOCREngine,
+    TesseractEngine.name: TesseractEngine,
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name):
+    """Process-wide engine instance, so latency histograms accumulate across calls."""
+    if name not in _engines:
+        with _engines_lock:
+            if name not in _engines:
+                try:
+                    engine_class = ENGINE_CLASSES[name]
+                except KeyError:
+                    raise ValueError(f"Unknown OCR engine: {name}")
+                timeouts = getattr(settings, 'OCR_ENGINE_TIMEOUTS', {})
+                _engines[name] = engine_class(timeout=timeouts.get(name))
+    return _engines[name]
+
+
+def engine_chain():
+    return list(getattr(settings, 'OCR_ENGINES', ['easyocr']))
+
+
+def run_ocr(image, engines=None):
+    """
+    Read ``image`` with the first engine in the chain that succeeds.
+
+    An engine falls through to the next one when it raises, times out, or
+    returns fewer than OCR_MIN_TEXT_CHARS letters and digits. Returns
+    ``(text, engine_name)``; raises OCRFailed if no engine produced text.
+    """
+    min_chars = getattr(settings, 'OCR_MIN_TEXT_CHARS', 10)
+    errors = []
+
+    for name in engines or engine_chain():
+        try:
+            lines = get_engine(name).readtext(image)
+        except Exception as e:
+            logger.warning("OCR engine %s failed: %s", name, e)
+            errors.append((name, str(e)))
+            continue
+
+        text = "\n".join(lines)
+        if sum(ch.isalnum() for ch in text) < min_chars:
+            errors.append((name, "too little text"))
+            continue
+        return text, name
+
+    raise OCRFailed(errors)
+
+
+def extraction_method(engine):
+    """AIExtraction.extraction_method for text read by ``engine`` (None: reused text)."""
+    return f"ocr_{engine}" if engine else 'ocr_reused'
+
+
+def engine_metrics():
+    """Latency histograms of every engine used in this process."""
+    return {name: engine.histogram.snapshot() for name, engine in list(_engines.items())}
@@ -0,0 +1,389 @@
+# apps/expenses/ocr_jobs.py
+
+import logging
+import os
+import socket
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+
+from apps.ai_services.models import AIExtraction
+from apps.ai_services.utils import check_budget_alerts
+from apps.core.currency_rates import rate_snapshot
+from .models import Expense, OCRJob, Receipt
+from .image_preprocessing import preprocess_receipt
+from .ocr_engines import engine_chain, extraction_method, get_engine, run_ocr
+from .extraction_trace import NO_TRACE, start_trace
+from .receipt_storage import find_ocr_text
+from .views import _bulk_create_expenses, _smart_extract, _get_fallback_category, _learned_category
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next_job(worker_name=None):
+    """
+    Claim the oldest pending job. Jobs a user is waiting on come before
+    background full-text jobs.
+
+    The row is locked with SKIP LOCKED, so several worker processes can poll
+    the same table without handing out a job twice.
+    """
+    with transaction.atomic():
+        job = (
+            OCRJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OCRJob.STATUS_PENDING)
+            .annotate(background=Case(
+                When(kind=OCRJob.KIND_FULL_TEXT, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            ))
+            .order_by('background', 'created_at', 'pk')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = OCRJob.STATUS_PROCESSING
+        job.worker = (worker_name or default_worker_name())[:100]
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'worker', 'attempts', 'started_at'])
+
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Put jobs back in the queue when their worker died mid-way.
+
+    Jobs that already used up OCR_JOB_MAX_ATTEMPTS are marked failed instead.
+    A worker that was only slow may still finish a requeued job; whichever
+    worker gets there first creates the expense (see _create_expense).
+    """
+    timeout = getattr(settings, 'OCR_JOB_TIMEOUT', 300)
+    max_attempts = getattr(settings, 'OCR_JOB_MAX_ATTEMPTS', 3)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+
+    stale = OCRJob.objects.filter(status=OCRJob.STATUS_PROCESSING, started_at__lt=cutoff)
+    given_up = stale.filter(attempts__gte=max_attempts)
+    batch_ids = set(given_up.exclude(batch_id=None).values_list('batch_id', flat=True))
+    failed = given_up.update(
+        status=OCRJob.STATUS_FAILED,
+        error='Worker stopped responding.',
+        finished_at=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=OCRJob.STATUS_PENDING)
+
+    # The rest of a batch may have been waiting for the jobs that just failed
+    for batch_id in batch_ids:
+        finish_batch(batch_id)
+    return requeued, failed
+
+
+def _load_receipt_image(receipt):
+    try:
+        # Local storage: let OCR read the file itself (memory-mapped)
+        source = receipt.file.path
+    except NotImplementedError:
+        with receipt.file.open('rb') as fh:
+            source = fh.read()
+
+    if getattr(settings, 'OCR_PREPROCESS', True):
+        return preprocess_receipt(source)
+    return source
+
+
+def _read_receipt_text(receipt):
+    """OCR the receipt file; returns ``(text, engine_name)``."""
+    return run_ocr(_load_receipt_image(receipt))
+
+
+def _read_receipt_fast(receipt, user, trace=NO_TRACE):
+    """
+    Region-of-interest read for a new expense.
+
+    Returns ``(text, engine_name, extracted, complete)``; ``extracted`` is None
+    and the full engine chain is used when the fast path is off or fails.
+    """
+    image = _load_receipt_image(receipt)
+
+    if getattr(settings, 'OCR_ROI_FAST_PATH', True) and engine_chain()[:1] == ['easyocr']:
+        try:
+            result = get_engine('easyocr').read_key_regions(image, lambda text: _smart_extract(text, user, trace))
+        except Exception as e:
+            logger.warning("ROI OCR failed, falling back to full OCR: %s", e)
+        else:
+            if result.text.strip():
+                logger.debug("ROI OCR read %s/%s lines", result.lines_read, result.lines_total)
+                return result.text, 'easyocr', result.extracted, result.complete
+
+    text, engine = run_ocr(image)
+    return text, engine, None, True
+
+
+def _fail_job(job, error):
+    logger.warning("OCR job %s failed: %s", job.pk, error)
+    job.status = OCRJob.STATUS_FAILED
+    job.error = str(error)[:1000]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def _finish_job(job):
+    job.status = OCRJob.STATUS_DONE
+    job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def complete_receipt_text(job):
+    """
+    Full OCR of a receipt whose expense was created from a partial read.
+
+    Returns the Receipt, or None when the job failed.
+    """
+    try:
+        receipt = job.receipt
+        ocr_text, _engine = _read_receipt_text(receipt)
+        with transaction.atomic():
+            receipt.ocr_text = ocr_text
+            receipt.save(update_fields=['ocr_text'])
+            _finish_job(job)
+        return receipt
+    except Exception as e:
+        _fail_job(job, e)
+        return None
+
+
+def process_job(job):
+    """
+    Run OCR and extraction for a claimed job, then create the Expense.
+
+    Returns the created Expense, or None when the job failed or is waiting
+    for the rest of its batch (its status is then 'done'). Any error marks
+    the job failed with its message instead of leaving it 'processing'.
+    """
+    try:
+        return _create_expense(job)
+    except Exception as e:
+        _fail_job(job, e)
+        if job.batch_id:
+            finish_batch(job.batch_id)
+        return None
+
+
+def _read_expense_data(job):
+    """
+    OCR and extraction for an expense job, done before any row is locked.
+
+    Returns what the Expense is made from (see _build_expense), ready for
+    JSON: batch jobs keep it on OCRJob.result until their batch is done.
+    """
+    receipt = job.receipt
+    user = job.user
+
+    # A receipt with the same content may have been read since this one was queued
+    ocr_text = receipt.ocr_text or find_ocr_text(receipt.content_hash)
+    reused_ocr = bool(ocr_text)
+    engine = None
+    extracted = None
+    complete = True
+    trace = start_trace('receipt_scan')
+
+    if not ocr_text:
+        ocr_text, engine, extracted, complete = _read_receipt_fast(receipt, user, trace)
+
+    if extracted is None:
+        extracted = _smart_extract(ocr_text, user, trace)
+
+    amount = extracted['amount'] or Decimal('0.00')
+    merchant = extracted['merchant'] or "Scanned Receipt"
+    description = f"Scanned: {ocr_text[:100]}..."
+    category = (
+        extracted['category']
+        or _learned_category(user, merchant, description, trace)
+        or _get_fallback_category(user)
+    )
+    trace.emit()
+
+    return {
+        'amount': str(amount),
+        'currency': user.preferences.currency if hasattr(user, 'preferences') else 'USD',
+        'date': extracted['date'].isoformat(),
+        'merchant': merchant,
+        'description': description,
+        'category_id': category.pk,
+        'payment_method': extracted['payment_method'],
+        'confidence': extracted['confidence'],
+        'extracted': str(extracted),
+        'text': ocr_text,
+        'reused_ocr': reused_ocr,
+        'engine': engine,
+        'complete': complete,
+        'trace': trace.as_dict(),
+    }
+
+
+def _build_expense(user, data):
+    return Expense(
+        user=user,
+        category_id=data['category_id'],
+        amount=Decimal(data['amount']),
+        currency=data['currency'],
+        expense_date=date.fromisoformat(data['date']),
+        merchant_name=data['merchant'],
+        description=data['description'],
+        payment_method=data['payment_method'],
+        entry_method='receipt_scan'
+    )
+
+
+def _build_extraction(expense, data):
+    return AIExtraction(
+        expense=expense,
+        raw_data={
+            "text": data['text'],
+            "extracted": data['extracted'],
+            "reused_ocr": data['reused_ocr'],
+            "engine": data['engine'],
+            "partial_text": not data['complete'],
+        },
+        confidence_score=data['confidence'],
+        extraction_method=extraction_method(data['engine']),
+        trace=data['trace'],
+    )
+
+
+def _create_expense(job):
+    receipt = job.receipt
+    user = job.user
+    if receipt.expense_id:
+        # Requeued after another worker had already finished it
+        _finish_job(job)
+        return receipt.expense
+
+    data = _read_expense_data(job)
+    if job.batch_id:
+        return _finish_batch_job(job, data)
+
+    # Rates may have to be fetched; not while the receipt row is locked
+    expense = _build_expense(user, data)
+    expense.set_minor_amounts(rate_snapshot())
+
+    with transaction.atomic():
+        # Two workers can hold the same requeued job; only one creates the expense
+        receipt = Receipt.objects.select_for_update().get(pk=receipt.pk)
+        if receipt.expense_id:
+            _finish_job(job)
+            return receipt.expense
+
+        expense.save()
+
+        receipt.expense = expense
+        if data['complete']:
+            receipt.ocr_text = data['text']
+        receipt.save(update_fields=['expense', 'ocr_text'])
+
+        _build_extraction(expense, data).save()
+        _finish_job(job)
+
+        if not data['complete']:
+            # Only the key regions were read; fill in Receipt.ocr_text later
+            OCRJob.objects.create(user=user, receipt=receipt, kind=OCRJob.KIND_FULL_TEXT)
+
+    check_budget_alerts(user)
+    return expense
+
+
+# --- Batches ---------------------------------------------------------------
+#
+# Jobs of a batch are read like single ones, by however many workers are
+# running, but only keep what they extracted. The last one to finish (done or
+# failed) creates every expense of the batch in one transaction, then checks
+# the budgets once. Holding the locks of all the batch's jobs while a job marks
+# itself done means exactly one of them sees the batch complete.
+
+def _lock_batch(batch_id):
+    return list(
+        OCRJob.objects
+        .select_for_update()
+        .select_related('receipt', 'user')
+        .filter(batch_id=batch_id)
+        .order_by('pk')
+    )
+
+
+def _finish_batch_job(job, data):
+    """Keep a batch job's result; returns its Expense if it completed the batch."""
+    rates = rate_snapshot()
+    with transaction.atomic():
+        jobs = _lock_batch(job.batch_id)
+        for batch_job in jobs:
+            if batch_job.pk == job.pk:
+                batch_job.result = data
+                batch_job.status = OCRJob.STATUS_DONE
+                batch_job.error = ''
+                batch_job.finished_at = timezone.now()
+                batch_job.save(update_fields=['result', 'status', 'error', 'finished_at'])
+                job.status = batch_job.status
+        created = _create_batch_expenses(jobs, rates)
+    if created:
+        check_budget_alerts(job.user)
+    return created.get(job.pk)
+
+
+def finish_batch(batch_id):
+    """Create the batch's expenses if none of its jobs are left (after one failed)."""
+    rates = rate_snapshot()
+    with transaction.atomic():
+        jobs = _lock_batch(batch_id)
+        created = _create_batch_expenses(jobs, rates)
+    if created:
+        check_budget_alerts(jobs[0].user)
+
+
+def _create_batch_expenses(jobs, rates):
+    """
+    Expenses for the locked jobs of one batch, once all of them are done
+    or failed; returns them by job pk. Jobs whose receipt already has an
+    expense (the batch was finished before) are skipped.
+    """
+    if not jobs or any(job.status not in (OCRJob.STATUS_DONE, OCRJob.STATUS_FAILED) for job in jobs):
+        return {}
+    ready = [
+        job for job in jobs
+        if job.status == OCRJob.STATUS_DONE and job.result is not None and not job.receipt.expense_id
+    ]
+    if not ready:
+        return {}
+
+    user = ready[0].user
+    expenses = _bulk_create_expenses(user, [_build_expense(user, job.result) for job in ready], rates)
+
+    receipts = []
+    for job, expense in zip(ready, expenses):
+        job.receipt.expense = expense
+        if job.result['complete']:
+            job.receipt.ocr_text = job.result['text']
+        receipts.append(job.receipt)
+    Receipt.objects.bulk_update(receipts, ['expense', 'ocr_text'])
+
+    AIExtraction.objects.bulk_create([
+        _build_extraction(expense, job.result) for job, expense in zip(ready, expenses)
+    ])
+    # Only the key regions of these were read; fill in Receipt.ocr_text later
+    OCRJob.objects.bulk_create([
+        OCRJob(user=user, receipt=job.receipt, kind=OCRJob.KIND_FULL_TEXT)
+        for job in ready if not job.result['complete']
+    ])
+    OCRJob.objects.filter(pk__in=[job.pk for job in ready]).update(result=None)
+    return {job.pk: expense for job, expense in zip(ready, expenses)}
@@ -0,0 +1,161 @@
+# apps/expenses/ocr_pool.py
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class ReaderPool:
+    """
+    Process-wide pool of EasyOCR readers.
+
+    Loading an ``easyocr.Reader`` pulls the detection and recognition weights
+    from disk, so readers are built once and handed out to requests. The
+    semaphore caps how many OCR calls run at the same time; extra callers
+    queue instead of competing for CPU cores.
+    """
+
+    def __init__(self, size=1, max_concurrency=None, languages=None, gpu=False):
+        self.size = max(1, int(size))
+        self.max_concurrency = max(1, int(max_concurrency or self.size))
+        self.languages = list(languages or ['en'])
+        self.gpu = gpu
+
+        self._readers = queue.LifoQueue()
+        self._created = 0
+        self._create_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'checkout_wait_total': 0.0,
+            'checkout_wait_max': 0.0,
+            'inference_calls': 0,
+            'inference_total': 0.0,
+            'inference_max': 0.0,
+            'inference_errors': 0,
+        }
+
+    def _new_reader(self):
+        # Imported here: easyocr (and torch) are only needed when it's in the
+        # engine chain, e.g. not with OCR_ENGINES=tesseract
+        import easyocr
+        return easyocr.Reader(self.languages, gpu=self.gpu)
+
+    def warm(self):
+        """Load every reader up front so the first upload doesn't pay for it."""
+        with self._create_lock:
+            while self._created < self.size:
+                self._readers.put(self._new_reader())
+                self._created += 1
+
+    def _take_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._create_lock:
+            if self._created < self.size:
+                self._created += 1
+                build = True
+            else:
+                build = False
+
+        if build:
+            try:
+                return self._new_reader()
+            except Exception:
+                with self._create_lock:
+                    self._created -= 1
+                raise
+
+        return self._readers.get()
+
+    @contextmanager
+    def reader(self):
+        """Check a reader out of the pool for the duration of the block."""
+        started = time.perf_counter()
+        self._slots.acquire()
+        try:
+            reader = self._take_reader()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self._stats['checkouts'] += 1
+            self._stats['checkout_wait_total'] += waited
+            self._stats['checkout_wait_max'] = max(self._stats['checkout_wait_max'], waited)
+
+        try:
+            yield reader
+        finally:
+            self._readers.put(reader)
+            self._slots.release()
+
+    def readtext(self, image, **kwargs):
+        """Run ``Reader.readtext`` on a pooled reader and record its timing."""
+        with self.reader() as reader:
+            started = time.perf_counter()
+            try:
+                return reader.readtext(image, **kwargs)
+            except Exception:
+                with self._stats_lock:
+                    self._stats['inference_errors'] += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._stats_lock:
+                    self._stats['inference_calls'] += 1
+                    self._stats['inference_total'] += elapsed
+                    self._stats['inference_max'] = max(self._stats['inference_max'], elapsed)
+
+    def stats(self):
+        """Snapshot of the pool counters (times are in seconds)."""
+        with self._stats_lock:
+            data = dict(self._stats)
+
+        data['size'] = self.size
+        data['max_concurrency'] = self.max_concurrency
+        data['readers_loaded'] = self._created
+        data['readers_idle'] = self._readers.qsize()
+        data['checkout_wait_avg'] = (
+            data['checkout_wait_total'] / data['checkouts'] if data['checkouts'] else 0.0
+        )
+        data['inference_avg'] = (
+            data['inference_total'] / data['inference_calls'] if data['inference_calls'] else 0.0
+        )
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_reader_pool():
+    """Return the process-wide reader pool, creating it from settings on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ReaderPool(
+                    size=getattr(settings, 'OCR_READER_POOL_SIZE', 1),
+                    max_concurrency=getattr(settings, 'OCR_MAX_CONCURRENCY', None),
+                    languages=getattr(settings, 'OCR_LANGUAGES', ['en']),
+                    gpu=getattr(settings, 'OCR_USE_GPU', False),
+                )
+    return _pool
+
+
+def warm_reader_pool():
+    """Pre-load the reader pool when a worker process starts (if enabled and EasyOCR is used)."""
+    from .ocr_engines import engine_chain
+
+    if getattr(settings, 'OCR_PREWARM_READERS', True) and 'easyocr' in engine_chain():
+        get_reader_pool().warm()
@@ -1,24 +1,36 @@
 # apps/expenses/ocr_service.py
 
-import pytesseract
-from PIL import Image
 import datetime
+import logging
 from decimal import Decimal
 from typing import Dict, Any
 import re
 
-# --- IMPORTANT CONFIGURATION ---
-# >>> YOU MUST SET THIS PATH TO YOUR TESSERACT INSTALLATION <<<
-# Example for Windows:
-# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-# ---------------------------------
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+from django.conf import settings
+
+from . import date_parsing
+from .ocr_engines import OCRFailed, run_ocr
+
+logger = logging.getLogger(__name__)
+
+# The OCR engines and their order come from settings.OCR_ENGINES.
+# Point settings.TESSERACT_CMD (or the TESSERACT_CMD environment variable) at
+# the tesseract binary if it is not on your PATH, e.g. on Windows:
+#   C:\Program Files\Tesseract-OCR\tesseract.exe
+
+
+# "DATE: 12/05/2024" (month first unless that isn't a valid date)
+_DATE = re.compile(r'DATE[:\s]*(\d{1,2})[\/-](\d{1,2})[\/-](\d{2,4})')
+
+
 def parse_ocr_text(raw_text: str) -> Dict[str, Any]:
     """
     Parses the raw text output from the OCR engine into structured data fields 
     using Regular Expressions, specifically targeting common receipt formats.
     """
     
+    # Only the first RECEIPT_TEXT_MAX_CHARS characters are parsed
+    raw_text = raw_text[:getattr(settings, 'RECEIPT_TEXT_MAX_CHARS', 10000)]
     text = raw_text.upper().replace('\n', ' ').replace('$', '')
     
     # --- 1. Extract Merchant Name ---
@@ -35,16 +47,12 @@ def parse_ocr_text(raw_text: str) -> Dict[str, Any]:
             pass 
 
     # --- 3. Extract Date ---
-    date_match = re.search(r'DATE[:\s]*(\d{1,2}[\/-]\d{1,2}[\/-]\d{2,4})', text)
+    date_match = _DATE.search(text)
     expense_date = datetime.date.today()
     if date_match:
-        date_str = date_match.group(1)
-        for fmt in ('%m/%d/%Y', '%m-%d-%Y', '%d/%m/%Y', '%Y/%m/%d'):
-            try:
-                expense_date = datetime.datetime.strptime(date_str, fmt).date()
-                break
-            except ValueError:
-                continue
+        expense_date = date_parsing.parse_date_match(
+            date_match, date_parsing.NUMERIC, expense_date, max_age_days=None
+        ) or expense_date
 
     # --- 4. Extract Category and Payment ---
     category = 'Uncategorized'
@@ -71,27 +79,27 @@ def parse_ocr_text(raw_text: str) -> Dict[str, Any]:
 
 def perform_receipt_ocr(receipt_file_path: str) -> tuple[Dict[str, Any], str]:
     """
-    Processes the receipt image using Tesseract OCR to get extracted data, 
-    with a fallback to mock data on error.
+    Processes the receipt image with the configured OCR engine chain to get
+    extracted data, with a fallback to mock data on error.
     """
-    print(f"Starting OCR processing for file: {receipt_file_path}")
+    logger.info("Starting OCR processing for file: %s", receipt_file_path)
     
     try:
-        # Use pytesseract to extract text from the image file
-        raw_ocr_text = pytesseract.image_to_string(Image.open(receipt_file_path))
+        # Try each engine in settings.OCR_ENGINES until one returns text
+        raw_ocr_text, engine = run_ocr(receipt_file_path)
         
         # 1. Parse the raw text into structured fields
         extracted_data = parse_ocr_text(raw_ocr_text)
 
-        print("OCR successful.")
+        logger.info("OCR successful (%s).", engine)
         
         return extracted_data, raw_ocr_text
         
-    except pytesseract.TesseractNotFoundError:
-        error_message = "Tesseract is not installed or not in your PATH. Falling back to mock data."
-        print(f"ERROR: {error_message}")
+    except OCRFailed as e:
+        error_message = f"No OCR engine could read the receipt ({e}). Falling back to mock data."
+        logger.warning(error_message)
         
-        # Fallback to Mock Data if Tesseract is not found
+        # Fallback to Mock Data if no engine could read the receipt
         extracted_data = {
             'amount': Decimal('45.99'),
             'currency': 'USD',
@@ -105,7 +113,7 @@ def perform_receipt_ocr(receipt_file_path: str) -> tuple[Dict[str, Any], str]:
 
     except Exception as e:
         error_message = f"OCR processing failed: {e}. Falling back to mock data."
-        print(f"ERROR: {error_message}")
+        logger.warning(error_message, exc_info=True)
         
         # Fallback to Mock Data on other failure
         extracted_data = {
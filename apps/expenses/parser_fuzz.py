@@ -0,0 +1,152 @@
+# apps/expenses/parser_fuzz.py
+#
+# Adversarial input generators for the smart-input parsers, and the latency
+# bound those parsers are held to. Used by `manage.py fuzz_parsers`.
+#
+# Every case is generated from its own Random(f"{seed}:{case}"), so a
+# failure can be reproduced from the seed and case number alone.
+
+import math
+import random
+
+from django.conf import settings
+
+# Latency bound of one parse: a fixed allowance plus a per-KB one. Input
+# beyond the configured limits is not parsed, so the bound flattens out
+# at SMART_INPUT_MAX_CHARS / RECEIPT_TEXT_MAX_CHARS.
+LATENCY_BASE_MS = 5.0
+LATENCY_MS_PER_KB = 10.0
+
+RECEIPT_WORDS = [
+    'TOTAL', 'total', 'Total Amount', 'tot amt', 'grand total', 'net total', 'amount due',
+    'balance due', 'sub total', 'SUB-TOT', 'subtotal', 'amount', 'amt', 'balance', 'cash',
+    'change due', 'tender', 'visa', 'master card', 'credit', 'transfer', 'you saved', 'discount',
+    'date', 'Date:', 'due date', 'receipt date', 'trans-date', 'invoice date', 'dt', 'dated',
+    'Starbucks', 'walmart', 'Burger King', 'McDonald\'s', 'coffee', 'gas', 'store', 'TEL', 'qty',
+    'spent', 'cost', 'paid', 'dollars', 'bucks', 'usd', 'at', 'from', 'to', 'yesterday', 'today',
+    'days ago', 'monday', 'Store', 'Market', 'Cafe', 'DATE', 'BALANCE', 'AMOUNT',
+]
+
+# Strings that stress one construct when repeated: quantifier runs,
+# separators, unterminated numbers and dates, keyword prefixes
+PATHOLOGICAL_UNITS = [
+    '1', '12', ' ', '\t', '\n', '$', '$ ', '1.', '1,', '.1', '1/', '1-', '12 ', '1 1 ',
+    '12/', '12/12/', 'Aug ', '12 Aug ', 'Aug 12 ', 'due ', 'due-', 'date ', 'total ',
+    'total:', 'sub ', 'dt ', 'spent ', 'at ', 'Aaaa ', 'Aa', 'a', 'A', '-', ',', ':',
+    '\u00a0', '\u200b', '\u0661', '\uff11', 'K\u0130', '\u017f',
+]
+
+UNICODE_RANGES = [
+    (0x20, 0x7e),        # ASCII
+    (0xa0, 0x17f),       # Latin-1, Latin Extended-A
+    (0x300, 0x36f),      # Combining marks
+    (0x590, 0x6ff),      # Hebrew, Arabic (incl. Arabic-Indic digits)
+    (0x1780, 0x17ff),    # Khmer
+    (0x2000, 0x206f),    # General punctuation, zero-width and bidi controls
+    (0xff01, 0xff5e),    # Full-width forms (incl. full-width digits)
+    (0x1f300, 0x1f5ff),  # Emoji
+]
+
+
+def random_ascii(rng, size):
+    return ''.join(chr(rng.randint(0x09, 0x7e)) for _ in range(size))
+
+
+def random_unicode(rng, size):
+    chars = []
+    for _ in range(size):
+        low, high = rng.choice(UNICODE_RANGES)
+        chars.append(chr(rng.randint(low, high)))
+    return ''.join(chars)
+
+
+def _amount(rng):
+    value = rng.choice([rng.randint(0, 99999) / 100, rng.randint(1000, 9999), rng.random() * 10 ** 7])
+    return rng.choice(['{:.2f}', '${:.2f}', '$ {:.2f}', '{:,.2f}', '{:.0f}', '{:.3f}']).format(value)
+
+
+def _date(rng):
+    return rng.choice([
+        '{m}/{d}/{y}', '{d}/{m}/{y}', '{y}-{m}-{d}', '{y}/{m}/{d}', '{d} Aug {y}', 'Aug {d}, {y}',
+        '{d}.{m}.{y}', '{m}/{d}/{yy}', '{d} {m} {y}', '{y}{m:0>2}{d:0>2}',
+    ]).format(
+        d=rng.randint(0, 40), m=rng.randint(0, 14), y=rng.randint(1900, 2100), yy=rng.randint(0, 99)
+    )
+
+
+def token_soup(rng, size):
+    """Receipt-like tokens in random order and spacing."""
+    parts = []
+    length = 0
+    while length < size:
+        r = rng.random()
+        token = rng.choice(RECEIPT_WORDS) if r < 0.5 else _amount(rng) if r < 0.8 else _date(rng)
+        token += rng.choice([' ', '  ', '\t', ':', ' - ', '', '\n', '\n\n'])
+        parts.append(token)
+        length += len(token)
+    return ''.join(parts)[:size]
+
+
+def repeated(rng, size):
+    """One pathological unit repeated, usually with a tail that makes the match fail late."""
+    unit = rng.choice(PATHOLOGICAL_UNITS)
+    head = rng.choice(['', 'total ', 'Date: ', '$', 'spent ', 'due date ', 'Aug ', '12 '])
+    tail = rng.choice(['', 'x', '!', '.', 'Q', ' dollars', '2024', '.5', 'AUG'])
+    return (head + unit * (size // len(unit) + 1))[:max(0, size - len(tail))] + tail
+
+
+def one_long_line(rng, size):
+    return token_soup(rng, size).replace('\n', ' ')
+
+
+def many_lines(rng, size):
+    return '\n'.join(rng.choice(RECEIPT_WORDS + ['', ' ', '1', '$']) for _ in range(size // 3))[:size]
+
+
+GENERATORS = {
+    'random_ascii': random_ascii,
+    'random_unicode': random_unicode,
+    'token_soup': token_soup,
+    'repeated': repeated,
+    'one_long_line': one_long_line,
+    'many_lines': many_lines,
+}
+
+
+def parsers():
+    """name -> callable(text) for every parser that takes untrusted text."""
+    from .ocr_service import parse_ocr_text
+    from .views import (
+        _smart_amount_detect, _smart_date_detect, _smart_extract,
+        _smart_merchant_detect, _smart_payment_detect,
+    )
+
+    return {
+        'smart_amount_detect': _smart_amount_detect,
+        'smart_date_detect': _smart_date_detect,
+        'smart_merchant_detect': _smart_merchant_detect,
+        'smart_payment_detect': _smart_payment_detect,
+        'smart_extract': lambda text: _smart_extract(text, None),
+        'parse_ocr_text': parse_ocr_text,
+    }
+
+
+def input_limit(parser_name):
+    """Characters of input a parser reads; the rest is ignored."""
+    if parser_name in ('smart_extract', 'parse_ocr_text'):
+        return getattr(settings, 'RECEIPT_TEXT_MAX_CHARS', 10000)
+    return getattr(settings, 'SMART_INPUT_MAX_CHARS', 1000)
+
+
+def latency_bound_ms(parser_name, length):
+    """Slowest acceptable parse of ``length`` characters."""
+    return LATENCY_BASE_MS + LATENCY_MS_PER_KB * min(length, input_limit(parser_name)) / 1024
+
+
+def generate_case(seed, case, max_size):
+    """``(generator name, text)`` of one reproducible case."""
+    rng = random.Random(f"{seed}:{case}")
+    name = rng.choice(sorted(GENERATORS))
+    # Mostly short inputs, with sizes spread evenly on a log scale up to max_size
+    size = int(round(10 ** rng.uniform(0, math.log10(max(max_size, 1)))))
+    return name, GENERATORS[name](rng, min(size, max_size))
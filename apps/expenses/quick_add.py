@@ -0,0 +1,106 @@
+# apps/expenses/quick_add.py
+#
+# Per-user LRU of parsed voice/text phrases, so the phrases people repeat
+# ("coffee at starbucks $5") skip detection. An entry holds what doesn't
+# depend on the day: amount, merchant, keyword category id and payment
+# method. Dates ("yesterday", "last monday") are resolved on every lookup.
+#
+# Entries are per process. A user's phrases are dropped when their
+# categories change (the category index version) or their merchant
+# dictionary learns something (a quick-add token in the cache).
+
+import re
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.categories.index import category_index_version
+
+_SPACES = re.compile(r'\s+')
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+class QuickAddParse(NamedTuple):
+    amount: object  # Decimal
+    merchant: Optional[str]
+    category_id: Optional[int]  # Keyword match only; None when no family matched
+    payment_method: str
+
+
+class _UserPhrases:
+    __slots__ = ('version', 'phrases')
+
+    def __init__(self, version):
+        self.version = version
+        self.phrases = OrderedDict()
+
+
+def _token_key(user_id):
+    return f"quick_add_version:{user_id}"
+
+
+def normalize_phrase(text):
+    """
+    Cache key of a phrase: NFKC, whitespace collapsed. Case is kept, since
+    "at Joe's" and "at joe's" don't find the same merchant.
+    """
+    return _SPACES.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def _version(user_id):
+    token = cache.get(_token_key(user_id))
+    if token is None:
+        token = invalidate_quick_add_cache(user_id)
+    return category_index_version(user_id), token
+
+
+def invalidate_quick_add_cache(user_id):
+    """Drop the user's cached phrases in every process; returns the new token."""
+    token = uuid.uuid4().hex
+    cache.set(_token_key(user_id), token, None)
+    return token
+
+
+def _user_phrases(user_id, version):
+    # Call with _local_lock held
+    entry = _local.get(user_id)
+    if entry is None or entry.version != version:
+        entry = _UserPhrases(version)
+        _local[user_id] = entry
+    _local.move_to_end(user_id)
+    while len(_local) > getattr(settings, 'QUICK_ADD_CACHE_USERS', 256):
+        _local.popitem(last=False)
+    return entry
+
+
+def lookup(user_id, key):
+    """
+    ``(version, parse)``: the cached QuickAddParse of a normalized phrase or
+    None, and the version to store a fresh parse under.
+    """
+    version = _version(user_id)
+    with _local_lock:
+        phrases = _user_phrases(user_id, version).phrases
+        parse = phrases.get(key)
+        if parse is not None:
+            phrases.move_to_end(key)
+        return version, parse
+
+
+def store(user_id, version, key, parse):
+    """Cache a fresh parse under the version its lookup returned."""
+    with _local_lock:
+        entry = _local.get(user_id)
+        if entry is None or entry.version != version:
+            return  # Evicted or out of date since the lookup
+        entry.phrases[key] = parse
+        entry.phrases.move_to_end(key)
+        while len(entry.phrases) > getattr(settings, 'QUICK_ADD_CACHE_PHRASES', 128):
+            entry.phrases.popitem(last=False)
@@ -0,0 +1,114 @@
+# apps/expenses/receipt_benchmark.py
+#
+# Helpers shared by the receipt benchmark commands: the checked-in corpus,
+# field scoring and latency summaries.
+
+import json
+import statistics
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from django.utils import timezone
+
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'benchmark_corpus'
+FIELDS = ('amount', 'date', 'merchant', 'category')
+
+
+def load_manifest(corpus_dir=None):
+    """Read manifest.json; truth values are converted to Decimal / date."""
+    corpus_dir = Path(corpus_dir or CORPUS_DIR)
+    with open(corpus_dir / 'manifest.json', encoding='utf-8') as fh:
+        manifest = json.load(fh)
+
+    manifest['reference_date'] = date.fromisoformat(manifest['reference_date'])
+    for receipt in manifest['receipts']:
+        truth = receipt['truth']
+        truth['amount'] = Decimal(truth['amount'])
+        truth['date'] = date.fromisoformat(truth['date'])
+    manifest['dir'] = corpus_dir
+    return manifest
+
+
+@contextmanager
+def frozen_today(day):
+    """
+    Make ``timezone.now()`` fall on ``day``. The extractor rejects dates in
+    the future or more than three years back, so a corpus with fixed dates
+    is scored as of the day it was generated.
+    """
+    moment = timezone.make_aware(datetime.combine(day, dt_time(12, 0)))
+    with mock.patch('django.utils.timezone.now', return_value=moment):
+        yield
+
+
+def from_smart_extract(data):
+    """Comparable fields from a _smart_extract result."""
+    if data.get('category') is not None:
+        category = data['category'].category_name
+    else:
+        matches = data.get('category_matches') or []
+        category = matches[0] if matches else None
+    return {
+        'amount': data['amount'],
+        'date': data['date'],
+        'merchant': data['merchant'],
+        'category': category,
+    }
+
+
+def from_parse_ocr_text(data):
+    """Comparable fields from an ocr_service.parse_ocr_text result."""
+    return {
+        'amount': data['amount'],
+        'date': data['expense_date'],
+        'merchant': data['merchant_name'],
+        'category': data['category_name'],
+    }
+
+
+def score_fields(truth, found):
+    """Per-field correctness; merchants and categories compare case-insensitively."""
+    scores = {}
+    for field in FIELDS:
+        if field not in truth:
+            continue
+        expected, value = truth[field], found.get(field)
+        if field in ('merchant', 'category'):
+            scores[field] = str(value or '').strip().lower() == expected.lower()
+        else:
+            scores[field] = value == expected
+    return scores
+
+
+def accuracy(score_rows):
+    """Fraction correct per field plus ``overall`` over all fields."""
+    totals = {}
+    for row in score_rows:
+        for field, ok in row.items():
+            hit, seen = totals.get(field, (0, 0))
+            totals[field] = (hit + int(ok), seen + 1)
+
+    result = {field: round(hit / seen, 3) for field, (hit, seen) in totals.items()}
+    hits = sum(hit for hit, _ in totals.values())
+    seen = sum(seen for _, seen in totals.values())
+    result['overall'] = round(hits / seen, 3) if seen else 0.0
+    return result
+
+
+def latency_summary(seconds):
+    """mean / p50 / p95 / max of a list of durations, in milliseconds."""
+    if not seconds:
+        return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+    ordered = sorted(seconds)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
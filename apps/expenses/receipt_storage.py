@@ -0,0 +1,191 @@
+# apps/expenses/receipt_storage.py
+
+import hashlib
+import os
+from contextlib import contextmanager
+
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+from .image_preprocessing import hamming_distance
+from .models import Receipt
+
+
+class ReceiptRejected(Exception):
+    """The upload can't be used as a receipt; the message is safe to show the user."""
+
+
+def hash_file(f):
+    """SHA-256 hex digest of an uploaded or stored file, read in chunks."""
+    digest = hashlib.sha256()
+    f.seek(0)
+    for chunk in f.chunks():
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def content_path(digest, original_name=''):
+    """Storage name for a blob: receipts/sha256/ab/abcdef....png"""
+    ext = os.path.splitext(original_name)[1].lower()[:10]
+    return f"receipts/sha256/{digest[:2]}/{digest}{ext}"
+
+
+def check_image_limits(uploaded_file):
+    """
+    Reject files over RECEIPT_MAX_UPLOAD_BYTES or images over RECEIPT_MAX_PIXELS.
+
+    Only the image header is read, so an oversized image is never decoded.
+    """
+    max_bytes = getattr(settings, 'RECEIPT_MAX_UPLOAD_BYTES', None)
+    max_pixels = getattr(settings, 'RECEIPT_MAX_PIXELS', None)
+
+    if getattr(uploaded_file, 'oversized', False) or (max_bytes and uploaded_file.size > max_bytes):
+        raise ReceiptRejected(f"{uploaded_file.name} is larger than {max_bytes // (1024 * 1024)} MB.")
+
+    try:
+        if hasattr(uploaded_file, 'temporary_file_path'):
+            img = Image.open(uploaded_file.temporary_file_path())
+        else:
+            uploaded_file.seek(0)
+            img = Image.open(uploaded_file)
+        with img:
+            width, height = img.size
+    except Image.DecompressionBombError:
+        raise ReceiptRejected(f"{uploaded_file.name} has too many pixels to process.")
+    except Exception:
+        raise ReceiptRejected(f"{uploaded_file.name} is not a readable image.")
+    finally:
+        uploaded_file.seek(0)
+
+    if max_pixels and width * height > max_pixels:
+        raise ReceiptRejected(
+            f"{uploaded_file.name} is {width}x{height} pixels; "
+            f"please upload an image under {max_pixels // 1_000_000} megapixels."
+        )
+
+
+def store_receipt_file(uploaded_file):
+    """
+    Store an upload by content and return ``(storage_name, sha256)``.
+
+    If a receipt with the same content already exists, its file is reused
+    and nothing new is written to disk. Uploads streamed by
+    ReceiptUploadHandler arrive already hashed and are moved into place
+    rather than copied. Raises ReceiptRejected for files over the limits.
+    """
+    check_image_limits(uploaded_file)
+    digest = getattr(uploaded_file, 'sha256', None) or hash_file(uploaded_file)
+
+    existing = (
+        Receipt.objects
+        .filter(content_hash=digest)
+        .exclude(file='')
+        .values_list('file', flat=True)
+        .first()
+    )
+    if existing and default_storage.exists(existing):
+        return existing, digest
+
+    name = content_path(digest, uploaded_file.name or '')
+    if not default_storage.exists(name):
+        name = default_storage.save(name, uploaded_file)
+    return name, digest
+
+
+@contextmanager
+def removed_on_error(name):
+    """
+    Wrap the transaction that creates the Receipt for a file from
+    store_receipt_file. If it fails (and rolls back), the file is deleted
+    again unless another receipt uses it, so no orphan is left on disk.
+    """
+    try:
+        yield
+    except BaseException:
+        if not Receipt.objects.filter(file=name).exists():
+            default_storage.delete(name)
+        raise
+
+
+def find_ocr_text(digest):
+    """OCR text of an earlier receipt with the same content, if any."""
+    if not digest:
+        return None
+    return (
+        Receipt.objects
+        .filter(content_hash=digest, ocr_text__isnull=False)
+        .exclude(ocr_text='')
+        .values_list('ocr_text', flat=True)
+        .first()
+    )
+
+
+def _phash_index_key(user):
+    return f"receipt_phash_index:{user.pk}"
+
+
+def _user_receipts(user):
+    return Receipt.objects.filter(Q(expense__user=user) | Q(ocr_jobs__user=user)).distinct()
+
+
+def _load_phash_index(user):
+    """
+    The user's recent ``[(hash, receipt_id), ...]``, most recently used first.
+
+    Rebuilt from the database when the cache entry has expired or was evicted.
+    """
+    index = cache.get(_phash_index_key(user))
+    if index is None:
+        size = getattr(settings, 'RECEIPT_PHASH_INDEX_SIZE', 50)
+        rows = (
+            _user_receipts(user)
+            .exclude(perceptual_hash='')
+            .order_by('-uploaded_at')
+            .values_list('perceptual_hash', 'pk')[:size]
+        )
+        index = [(int(phash, 16), pk) for phash, pk in rows]
+    return index
+
+
+def _save_phash_index(user, index):
+    size = getattr(settings, 'RECEIPT_PHASH_INDEX_SIZE', 50)
+    timeout = getattr(settings, 'RECEIPT_PHASH_INDEX_TTL', 7 * 86400)
+    cache.set(_phash_index_key(user), index[:size], timeout)
+
+
+def find_near_duplicate(user, phash):
+    """
+    The user's recent receipt closest to ``phash``, if within
+    RECEIPT_PHASH_MAX_DISTANCE bits, else None. A match is only a possible
+    duplicate for the user to confirm, not grounds to reuse its OCR text.
+    """
+    max_distance = getattr(settings, 'RECEIPT_PHASH_MAX_DISTANCE', 2)
+    index = _load_phash_index(user)
+
+    best = None
+    for position, (other, receipt_id) in enumerate(index):
+        distance = hamming_distance(phash, other)
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, position, receipt_id)
+    if best is None:
+        return None
+
+    receipt = _user_receipts(user).select_related('expense').filter(pk=best[2]).first()
+    if receipt is None:
+        # Deleted since it was indexed
+        del index[best[1]]
+    else:
+        index.insert(0, index.pop(best[1]))
+    _save_phash_index(user, index)
+    return receipt
+
+
+def remember_perceptual_hash(user, phash, receipt_id):
+    """Add a new receipt to the front of the user's recent-hash index."""
+    index = [entry for entry in _load_phash_index(user) if entry[1] != receipt_id]
+    index.insert(0, (phash, receipt_id))
+    _save_phash_index(user, index)
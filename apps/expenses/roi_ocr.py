@@ -0,0 +1,192 @@
+# apps/expenses/roi_ocr.py
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Lines next to these words usually hold the total, date or amount
+ROI_KEYWORDS = ('total', 'amount', 'amt', 'due', 'balance', 'date', 'paid')
+
+
+@dataclass(frozen=True)
+class RoiOptions:
+    top_lines: int = 4
+    bottom_lines: int = 10
+    min_confidence: float = 0.9       # Extraction confidence needed to skip the full pass
+    min_text_confidence: float = 0.5  # Mean recognizer confidence of the lines read
+
+
+def options_from_settings():
+    return RoiOptions(
+        top_lines=getattr(settings, 'OCR_ROI_TOP_LINES', 4),
+        bottom_lines=getattr(settings, 'OCR_ROI_BOTTOM_LINES', 10),
+        min_confidence=getattr(settings, 'OCR_ROI_MIN_CONFIDENCE', 0.9),
+        min_text_confidence=getattr(settings, 'OCR_ROI_MIN_TEXT_CONFIDENCE', 0.5),
+    )
+
+
+@dataclass
+class RoiResult:
+    text: str
+    extracted: dict
+    complete: bool        # False when only the key regions were recognized
+    lines_read: int
+    lines_total: int
+    confidence: Optional[float] = None
+
+
+@dataclass
+class KeyRegions:
+    """Text lines detected on a receipt and ``(text, confidence)`` of those recognized so far."""
+    image: Any
+    lines: list
+    texts: dict = field(default_factory=dict)
+
+    @property
+    def lines_total(self):
+        return len(self.lines)
+
+    @property
+    def lines_read(self):
+        return len(self.texts)
+
+    @property
+    def complete(self):
+        return len(self.texts) == len(self.lines)
+
+    @property
+    def text(self):
+        return "\n".join(self.texts[i][0] for i in range(len(self.lines)) if i in self.texts and self.texts[i][0])
+
+    @property
+    def text_confidence(self):
+        return sum(c for _t, c in self.texts.values()) / len(self.texts) if self.texts else 0.0
+
+
+def group_lines(boxes):
+    """
+    Group EasyOCR horizontal boxes ``[x_min, x_max, y_min, y_max]`` into
+    text lines, top to bottom; boxes in a line are sorted left to right.
+    """
+    if not boxes:
+        return []
+
+    heights = sorted(max(1, b[3] - b[2]) for b in boxes)
+    tolerance = heights[len(heights) // 2] / 2
+
+    lines = []
+    for box in sorted(boxes, key=lambda b: (b[2] + b[3]) / 2):
+        centre = (box[2] + box[3]) / 2
+        if lines and abs(centre - lines[-1][0]) <= tolerance:
+            centre_sum, members = lines[-1][1] + centre, lines[-1][2] + [box]
+            lines[-1] = (centre_sum / len(members), centre_sum, members)
+        else:
+            lines.append((centre, centre, [box]))
+
+    return [sorted(members, key=lambda b: b[0]) for _, _, members in lines]
+
+
+def _recognize(reader, image, lines, indexes, texts):
+    """Recognize the given line indexes and store ``(text, confidence)`` in ``texts``."""
+    indexes = [i for i in indexes if i not in texts]
+    if not indexes:
+        return
+
+    owner = {}
+    boxes = []
+    for i in indexes:
+        for box in lines[i]:
+            owner[(int(box[0]), int(box[2]))] = i
+            boxes.append(box)
+
+    words = {i: [] for i in indexes}
+    for corners, text, conf in reader.recognize(image, horizontal_list=boxes, free_list=[], detail=1):
+        x, y = corners[0]
+        i = owner.get((int(x), int(y)))
+        if i is not None:
+            words[i].append((x, text, conf))
+
+    for i, found in words.items():
+        found.sort(key=lambda w: w[0])
+        text = " ".join(w[1] for w in found)
+        conf = sum(w[2] for w in found) / len(found) if found else 0.0
+        texts[i] = (text, conf)
+
+
+def detect_key_regions(reader, image, options=None):
+    """
+    Detect the text lines of ``image`` and recognize only the top lines
+    (merchant), the bottom lines (total, payment, usually the date) and the
+    lines next to ROI_KEYWORDS found there. Returns KeyRegions.
+    """
+    options = options or options_from_settings()
+
+    horizontal, free = reader.detect(image)
+    boxes = [[max(0, int(v)) for v in b] for b in horizontal[0]]
+    # Rotated text comes back as free-form quadrilaterals; use their bounding boxes
+    for quad in free[0]:
+        xs = [p[0] for p in quad]
+        ys = [p[1] for p in quad]
+        boxes.append([max(0, int(min(xs))), int(max(xs)), max(0, int(min(ys))), int(max(ys))])
+
+    regions = KeyRegions(image, group_lines(boxes))
+    total = regions.lines_total
+
+    key_lines = set(range(min(options.top_lines, total)))
+    key_lines |= set(range(max(0, total - options.bottom_lines), total))
+    _recognize(reader, image, regions.lines, sorted(key_lines), regions.texts)
+
+    neighbours = set()
+    for i, (text, _conf) in regions.texts.items():
+        if any(keyword in text.lower() for keyword in ROI_KEYWORDS):
+            neighbours |= {i - 1, i + 1}
+    _recognize(reader, image, regions.lines, sorted(n for n in neighbours if 0 <= n < total), regions.texts)
+    return regions
+
+
+def recognize_remaining(reader, regions):
+    """Recognize the lines detect_key_regions skipped; returns ``regions``."""
+    _recognize(reader, regions.image, regions.lines, range(regions.lines_total), regions.texts)
+    return regions
+
+
+def read_key_regions(detect, recognize_rest, extract, options=None):
+    """
+    Two-stage receipt OCR.
+
+    Text detection runs on the whole image, but recognition (the expensive
+    part on long receipts) first covers only the key regions: ``detect()``
+    returns them as KeyRegions. ``extract(text)`` is run on that; if the
+    amount or date is missing or the confidence is low,
+    ``recognize_rest(regions)`` reads the remaining lines and extraction
+    runs again on the full text. The two stages are the OCR engine's calls;
+    extraction and the decision run in the calling thread.
+    """
+    options = options or options_from_settings()
+
+    regions = detect()
+    extracted = extract(regions.text)
+    text_conf = regions.text_confidence
+
+    good_enough = (
+        extracted['amount']
+        and extracted.get('date_found', True)
+        and extracted['confidence'] >= options.min_confidence
+        and text_conf >= options.min_text_confidence
+    )
+    if good_enough or regions.complete:
+        return RoiResult(regions.text, extracted, regions.complete, regions.lines_read, regions.lines_total, text_conf)
+
+    logger.debug(
+        "ROI pass not enough (amount=%s, date_found=%s, confidence=%.2f, text confidence=%.2f), "
+        "reading all lines",
+        extracted['amount'], extracted.get('date_found'), extracted['confidence'], text_conf,
+    )
+    regions = recognize_rest(regions)
+    return RoiResult(
+        regions.text, extract(regions.text), True, regions.lines_read, regions.lines_total, regions.text_confidence
+    )
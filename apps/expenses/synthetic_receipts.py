@@ -0,0 +1,199 @@
+# apps/expenses/synthetic_receipts.py
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+# Ground truth for generated receipts. Dates are stored as an offset from
+# "today" so the extractor's 3-year window never rejects them. ``category`` is
+# the keyword family _smart_extract should match; ``date_format`` and
+# ``total_label`` vary the layout so more of the parser is exercised.
+SAMPLE_RECEIPTS = [
+    {
+        'merchant': 'Starbucks',
+        'category': 'Food & Dining',
+        'header': ['STARBUCKS', 'Store #1024', '500 Pine St'],
+        'items': [('Caffe Latte', '4.95'), ('Blueberry Muffin', '3.25')],
+        'tax': '0.74',
+        'total': '8.94',
+        'days_ago': 2,
+        'payment': 'VISA',
+    },
+    {
+        'merchant': 'Walmart',
+        'category': 'Groceries',
+        'header': ['WALMART', 'Save money. Live better.', 'TEL 555-0134'],
+        'items': [('Milk 1gal', '3.48'), ('Bread', '2.24'), ('Eggs 12ct', '4.12'), ('Bananas', '1.37')],
+        'tax': '0.00',
+        'total': '11.21',
+        'days_ago': 9,
+        'payment': 'CASH',
+    },
+    {
+        'merchant': 'Shell',
+        'category': 'Transportation',
+        'header': ['SHELL', 'Station 8841', 'Pump 04'],
+        'items': [('Unleaded 10.2 gal', '38.66')],
+        'tax': '0.00',
+        'total': '38.66',
+        'days_ago': 30,
+        'payment': 'MASTERCARD',
+    },
+    {
+        'merchant': 'Burger King',
+        'category': 'Food & Dining',
+        'header': ['BURGER KING', 'Order 77'],
+        'items': [('Whopper Meal', '9.49'), ('Onion Rings', '2.99'), ('Soda', '1.89')],
+        'tax': '1.15',
+        'total': '15.52',
+        'days_ago': 60,
+        'payment': 'CASH',
+    },
+    {
+        'merchant': 'Best Buy',
+        'category': 'Shopping',
+        'header': ['BEST BUY', 'Electronics', 'Store 212'],
+        'items': [('USB-C Cable', '19.99'), ('Screen Protector', '14.99')],
+        'tax': '2.80',
+        'total': '37.78',
+        'days_ago': 5,
+        'payment': 'MASTERCARD',
+        'date_format': '%d %b %Y',
+        'total_label': 'GRAND TOTAL',
+    },
+    {
+        'merchant': 'Chevron',
+        'category': 'Transportation',
+        'header': ['CHEVRON', 'Pump 7'],
+        'items': [('Diesel 12.5 gal', '51.13')],
+        'tax': '0.00',
+        'total': '51.13',
+        'days_ago': 14,
+        'payment': 'VISA',
+        'date_format': '%Y-%m-%d',
+        'total_label': 'AMOUNT DUE',
+    },
+    {
+        'merchant': 'Subway',
+        'category': 'Food & Dining',
+        'header': ['SUBWAY', 'Restaurant 3390'],
+        'items': [('Footlong Italian BMT', '8.99'), ('Cookie', '1.29'), ('Fountain Drink', '2.19')],
+        'tax': '1.06',
+        'total': '13.53',
+        'days_ago': 21,
+        'payment': 'CASH',
+        'date_format': '%m/%d/%y',
+    },
+    {
+        'merchant': 'Costco',
+        'category': 'Groceries',
+        'header': ['COSTCO WHOLESALE', 'Warehouse 118'],
+        'items': [('Rotisserie Chicken', '4.99'), ('Paper Towels', '21.99'), ('Vegetables Mix', '8.49'),
+                  ('Coffee Beans 2lb', '15.99'), ('Olive Oil', '12.79')],
+        'tax': '2.40',
+        'total': '66.65',
+        'days_ago': 45,
+        'payment': 'VISA',
+        'total_label': 'TOTAL AMOUNT',
+    },
+]
+
+
+def receipt_lines(sample, today):
+    """Text lines of a sample receipt, top to bottom."""
+    expense_date = today - timedelta(days=sample['days_ago'])
+    subtotal = sum(Decimal(price) for _, price in sample['items'])
+
+    lines = list(sample['header'])
+    lines.append(f"Date: {expense_date.strftime(sample.get('date_format', '%m/%d/%Y'))}")
+    lines.append('')
+    for name, price in sample['items']:
+        lines.append(f"{name:<22}{price:>8}")
+    lines.append('')
+    lines.append(f"{'Subtotal':<22}{subtotal:>8}")
+    lines.append(f"{'Tax':<22}{sample['tax']:>8}")
+    lines.append(f"{sample.get('total_label', 'TOTAL'):<22}{sample['total']:>8}")
+    lines.append(f"{sample['payment']:<22}{sample['total']:>8}")
+    lines.append('')
+    lines.append('THANK YOU')
+    return lines
+
+
+def expected_fields(sample, today):
+    return {
+        'amount': Decimal(sample['total']),
+        'date': today - timedelta(days=sample['days_ago']),
+        'merchant': sample['merchant'],
+        'category': sample['category'],
+    }
+
+
+# Confusions typical of OCR on thermal paper
+_OCR_CONFUSIONS = {'O': '0', '0': 'O', 'l': '1', 'I': '1', 'S': '5', 'B': '8', 'e': 'c'}
+
+
+def ocr_noise(lines, rate=0.04, seed=0):
+    """
+    Corrupt receipt lines the way OCR tends to: swapped look-alike letters,
+    collapsed column spacing and the odd dropped character. Digits inside
+    prices are left alone so the ground truth stays valid.
+    """
+    rng = random.Random(seed)
+    noisy = []
+    for line in lines:
+        if rng.random() < 0.5:
+            line = " ".join(line.split())
+        chars = []
+        for i, ch in enumerate(line):
+            in_number = ch.isdigit() and (
+                (i > 0 and line[i - 1] in '0123456789.') or (i + 1 < len(line) and line[i + 1] in '0123456789.')
+            )
+            roll = rng.random()
+            if not in_number and ch in _OCR_CONFUSIONS and roll < rate * 3:
+                chars.append(_OCR_CONFUSIONS[ch])
+            elif not in_number and ch.isalpha() and roll > 1 - rate / 2:
+                continue
+            else:
+                chars.append(ch)
+        noisy.append("".join(chars))
+    return noisy
+
+
+def render_receipt(lines, width=420, font_size=20, margin=24):
+    """Draw receipt lines as a clean, flat scan."""
+    font = ImageFont.load_default(size=font_size)
+    line_height = int(font_size * 1.5)
+    height = margin * 2 + line_height * len(lines)
+
+    img = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * line_height), line, fill=0, font=font)
+    return img
+
+
+def photograph(img, long_edge=3000, skew=0.0, background=90, noise=6.0, seed=0):
+    """
+    Make a flat scan look like a phone photo: upscaled to ``long_edge``,
+    rotated by ``skew`` degrees on a darker background, with sensor noise.
+    """
+    scale = long_edge / max(img.size)
+    img = img.resize((int(img.width * scale), int(img.height * scale)), Image.Resampling.BICUBIC)
+
+    pad = int(max(img.size) * 0.08)
+    canvas = Image.new('L', (img.width + pad * 2, img.height + pad * 2), background)
+    canvas.paste(img, (pad, pad))
+    if skew:
+        canvas = canvas.rotate(skew, resample=Image.Resampling.BICUBIC, expand=False, fillcolor=background)
+
+    if noise:
+        rng = np.random.default_rng(seed)
+        arr = np.asarray(canvas, dtype=np.float32)
+        arr = arr + rng.normal(0, noise, arr.shape)
+        canvas = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+
+    return canvas.convert('RGB')
@@ -1,3 +1,317 @@
-from django.test import TestCase
+import os
+import random
+import time
+from contextlib import redirect_stdout
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.categories.models import Category
+from apps.core.currency_rates import invalidate_rate_history, rate_snapshot
+from apps.core.models import CurrencyRate
+
+from .merchants import BUILTIN_TRIE
+from .models import Expense
+from .parser_fuzz import RECEIPT_WORDS, generate_case, latency_bound_ms, parsers, token_soup
+from .synthetic_receipts import SAMPLE_RECEIPTS, receipt_lines
+from .totals import converted_totals
+from .views import _smart_date_detect, _smart_extract
+
+CORPUS_TEXT_DIR = os.path.join(os.path.dirname(__file__), 'benchmark_corpus', 'text')
+
+# "Today" for the parsers, which read dates relative to it
+TODAY = timezone.make_aware(datetime(2026, 10, 17, 12))
+
+
+def read_corpus_text(name):
+    with open(os.path.join(CORPUS_TEXT_DIR, name), encoding='utf-8') as fh:
+        return fh.read()
+
+
+class MerchantDetectionTests(SimpleTestCase):
+    # Merchant _smart_extract returned before the merchant dictionary, for
+    # the benchmark corpus texts it got right
+    BASELINE_MERCHANTS = {
+        'burger_king.txt': 'Burger King',
+        'chevron.txt': 'Chevron',
+        'costco.txt': 'Costco',
+        'shell.txt': 'Shell',
+        'shell_noisy.txt': 'Shell',
+        'starbucks.txt': 'Starbucks',
+        'starbucks_noisy.txt': 'Starbucks',
+        'subway.txt': 'Subway',
+        'subway_noisy.txt': 'Subway',
+        'walmart.txt': 'Walmart',
+        'walmart_noisy.txt': 'Walmart',
+    }
+
+    def merchant(self, text):
+        return _smart_extract(text, None)['merchant']
+
+    def test_corpus_matches_baseline(self):
+        for name, expected in self.BASELINE_MERCHANTS.items():
+            with self.subTest(name):
+                self.assertEqual(self.merchant(read_corpus_text(name)), expected)
+
+    def test_earliest_brand_wins(self):
+        self.assertEqual(self.merchant("KFC\nStore 221\n2pc Meal 6.50\nTOTAL 6.50\nCASH 6.50"), 'KFC')
+        self.assertEqual(self.merchant("SHELL\nPump 3\nUnleaded 20.00\nsubway coupon inside\nTOTAL 20.00"), 'Shell')
+        self.assertEqual(self.merchant("BURGER KINGDOM\nOrder 12\nTOTAL 9.99"), 'Burger Kingdom')
+
+    def test_brands_match_whole_words(self):
+        self.assertEqual(self.merchant("BP\nPump 2\nTOTAL 30.00"), 'BP')
+        self.assertEqual(self.merchant("BPX LOGISTICS\nRef 99\nTOTAL 30.00"), 'Bpx Logistics')
+        self.assertEqual(self.merchant("OCEAN GRILL\nShellfish platter 24.00\nTOTAL 24.00"), 'Ocean Grill')
+        self.assertIsNone(BUILTIN_TRIE.find('shellfish and subways'))
+
+    def test_generic_words_are_not_brands(self):
+        self.assertEqual(self.merchant("CVS PHARMACY\nStore 9\nTOTAL 12.00"), 'CVS')
+        self.assertEqual(self.merchant("FRESH SUPERMARKET\nApples 3.00\nTOTAL 3.00"), 'Fresh Supermarket')
+        # A TOTAL station is still named from its header line
+        self.assertEqual(self.merchant("TOTAL\nStation 41\nDiesel 40.00\nAMOUNT DUE 40.00"), 'Total')
+
+    def test_other_brands_in_the_body_dont_win(self):
+        brands = [s['merchant'] for s in SAMPLE_RECEIPTS if BUILTIN_TRIE.find(s['merchant'].lower())]
+        known = [s for s in SAMPLE_RECEIPTS if s['merchant'] in brands]
+        for case in range(200):
+            rng = random.Random(f"merchant:{case}")
+            sample = rng.choice(known)
+            lines = receipt_lines(sample, date(2026, 1, 15))
+            for _ in range(rng.randint(1, 3)):
+                words = ' '.join(rng.choice(RECEIPT_WORDS + brands) for _ in range(rng.randint(1, 4)))
+                lines.insert(rng.randint(len(sample['header']), len(lines)), words)
+            with self.subTest(case=case):
+                self.assertEqual(self.merchant('\n'.join(lines)), sample['merchant'])
+
+
+class ParserFuzzTests(SimpleTestCase):
+    """A short, fixed-seed run of `manage.py fuzz_parsers`."""
+
+    CASES = 200
+    MAX_SIZE = 20000
+    # Generous against the per-length bound: catches runaway parses, not slow machines
+    LATENCY_SLACK = 10
+
+    def check_result(self, name, result):
+        if name == 'smart_amount_detect':
+            self.assertIsInstance(result, Decimal)
+            self.assertGreaterEqual(result, 0)
+        elif name == 'smart_date_detect':
+            self.assertIsInstance(result, date)
+        elif name == 'smart_merchant_detect':
+            self.assertTrue(result is None or isinstance(result, str))
+        elif name == 'smart_payment_detect':
+            self.assertIsInstance(result, str)
+        elif name == 'smart_extract':
+            self.assertIsInstance(result['amount'], Decimal)
+            self.assertGreaterEqual(result['amount'], 0)
+            self.assertIsInstance(result['date'], date)
+            self.assertIsInstance(result['date_found'], bool)
+            self.assertTrue(0 <= result['confidence'] <= 1)
+            self.assertIsInstance(result['merchant'], str)
+            self.assertIsInstance(result['payment_method'], str)
+            self.assertIsInstance(result['category_matches'], list)
+        elif name == 'parse_ocr_text':
+            self.assertIsInstance(result['amount'], Decimal)
+            self.assertIsInstance(result['expense_date'], date)
+            self.assertIsInstance(result['merchant_name'], str)
+
+    def test_seeded_cases(self):
+        selected = parsers()
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            for case in range(self.CASES):
+                generator, text = generate_case('0', case, self.MAX_SIZE)
+                for name, parse in selected.items():
+                    with self.subTest(parser=name, case=case, generator=generator, length=len(text)):
+                        started = time.perf_counter()
+                        result = parse(text)
+                        elapsed_ms = (time.perf_counter() - started) * 1000
+                        self.check_result(name, result)
+                        self.assertLess(elapsed_ms, self.LATENCY_SLACK * latency_bound_ms(name, len(text)))
+
+
+@mock.patch('django.utils.timezone.now', return_value=TODAY)
+class ExtractionBaselineTests(SimpleTestCase):
+    """
+    Amount and payment method _smart_extract returned before the rule
+    tables were precompiled, for the benchmark corpus and seeded receipt-like
+    token soups.
+    """
+
+    BASELINE_CORPUS = {
+        'best_buy.txt': ('37.78', 'Credit Card'),
+        'best_buy_noisy.txt': ('37.78', 'Credit Card'),
+        'burger_king.txt': ('15.52', 'Cash'),
+        'burger_king_noisy.txt': ('14.37', 'Cash'),
+        'chevron.txt': ('51.13', 'Credit Card'),
+        'chevron_noisy.txt': ('51.13', 'Credit Card'),
+        'costco.txt': ('66.65', 'Credit Card'),
+        'costco_noisy.txt': ('66.65', 'Cash'),
+        'shell.txt': ('38.66', 'Credit Card'),
+        'shell_noisy.txt': ('38.66', 'Credit Card'),
+        'starbucks.txt': ('8.94', 'Credit Card'),
+        'starbucks_noisy.txt': ('8.94', 'Credit Card'),
+        'subway.txt': ('13.53', 'Cash'),
+        'subway_noisy.txt': ('12.47', 'Cash'),
+        'walmart.txt': ('11.21', 'Cash'),
+        'walmart_noisy.txt': ('11.21', 'Cash'),
+    }
+    BASELINE_SOUPS = [
+        ('138.73', 'Credit Card'), ('324.66', 'Credit Card'), ('64.80', 'Credit Card'), ('941.29', 'Cash'),
+        ('41.00', 'Credit Card'), ('85.74', 'Credit Card'), ('400.57', 'Credit Card'), ('683.53', 'Cash'),
+        ('65.82', 'Credit Card'), ('731.79', 'Credit Card'), ('521.76', 'Credit Card'), ('328.45', 'Cash'),
+        ('584.50', 'Credit Card'), ('100.75', 'Cash'), ('445.07', 'Cash'), ('581.06', 'Credit Card'),
+        ('711.18', 'Cash'), ('509.34', 'Cash'), ('877.27', 'Credit Card'), ('23.00', 'Bank Transfer'),
+        ('392.57', 'Credit Card'), ('287.99', 'Credit Card'), ('783.13', 'Credit Card'), ('880.82', 'Credit Card'),
+        ('26.84', 'Credit Card'), ('825.94', 'Credit Card'), ('219.26', 'Cash'), ('171.68', 'Credit Card'),
+        ('35.88', 'Credit Card'), ('618.85', 'Cash'), ('125.79', 'Credit Card'), ('989.00', 'Cash'),
+        ('717.04', 'Credit Card'), ('786.95', 'Credit Card'), ('912.00', 'Credit Card'), ('0.00', 'Credit Card'),
+        ('723.74', 'Cash'), ('562.86', 'Credit Card'), ('0.00', 'Cash'), ('740.02', 'Cash'),
+    ]
+
+    def extract(self, text):
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            result = _smart_extract(text, None)
+        return str(result['amount']), result['payment_method']
+
+    def test_corpus_matches_baseline(self, _now):
+        for name, expected in self.BASELINE_CORPUS.items():
+            with self.subTest(name):
+                self.assertEqual(self.extract(read_corpus_text(name)), expected)
+
+    def test_token_soups_match_baseline(self, _now):
+        for i, expected in enumerate(self.BASELINE_SOUPS):
+            rng = random.Random(f"baseline:{i}")
+            text = token_soup(rng, rng.randint(100, 800))
+            with self.subTest(soup=i):
+                self.assertEqual(self.extract(text), expected)
+
+
+@mock.patch('django.utils.timezone.now', return_value=TODAY)
+class DateParsingBaselineTests(SimpleTestCase):
+    """
+    Dates read from a receipt line and from voice/text input, as before the
+    date parsers were shared; None where the receipt has no date. Voice input
+    falls back to today.
+    """
+
+    TODAY = date(2026, 10, 17)
+    BASELINE = [
+        # text, receipt date, voice date
+        ('12/25/2025', date(2025, 12, 25), date(2025, 12, 25)),
+        ('25/12/2025', date(2025, 12, 25), date(2025, 12, 25)),
+        ('2025-12-25', date(2025, 12, 25), date(2025, 12, 25)),
+        # Voice input used to miss year-first dates with slashes
+        ('2025/12/25', date(2025, 12, 25), date(2025, 12, 25)),
+        ('20251225', date(2025, 12, 25), TODAY),
+        ('25 Dec 2025', date(2025, 12, 25), TODAY),
+        ('25 December 2025', date(2025, 12, 25), TODAY),
+        ('Dec 25, 2025', date(2025, 12, 25), TODAY),
+        ('December 25, 2025', date(2025, 12, 25), TODAY),
+        ('12/25/25', date(2025, 12, 25), TODAY),
+        ('25-12-25', date(2025, 12, 25), TODAY),
+        ('25.12.2025', date(2025, 12, 25), TODAY),
+        ('Dec-25-2025', date(2025, 12, 25), TODAY),
+        ('03/04/2026', date(2026, 3, 4), date(2026, 3, 4)),
+        ('3/4/26', date(2026, 3, 4), TODAY),
+        ('13/13/2025', None, TODAY),
+        ('02/30/2026', None, TODAY),
+        # In the future, or too far back
+        ('2026-10-18', None, TODAY),
+        ('10/17/2023', None, TODAY),
+        ('1/1/2020', None, TODAY),
+        ('10/17/2026', date(2026, 10, 17), date(2026, 10, 17)),
+        ('Aug 5 2026', date(2026, 8, 5), TODAY),
+        ('5th Aug 26', date(2026, 8, 5), TODAY),
+        ('2026-02-29', None, TODAY),
+        ('2024-02-29', date(2024, 2, 29), TODAY),
+    ]
+
+    def test_receipt_dates(self, _now):
+        for text, expected, _ in self.BASELINE:
+            with self.subTest(text):
+                with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                    result = _smart_extract(f"SHOP\nDate: {text}\nTOTAL 5.00", None)
+                self.assertEqual(result['date'] if result['date_found'] else None, expected)
+
+    def test_voice_dates(self, _now):
+        for text, _, expected in self.BASELINE:
+            with self.subTest(text):
+                self.assertEqual(_smart_date_detect(f"spent 5 on {text}"), expected)
+
+
+@override_settings(BASE_CURRENCY='USD', CURRENCY_RATES_SOURCE='apps.core.currency_rates.static_rates')
+class ConvertedTotalsTests(TestCase):
+    """Totals summed in minor units and converted at each expense date's rate."""
+
+    @classmethod
+    def setUpTestData(cls):
+        CurrencyRate.objects.bulk_create([
+            CurrencyRate(date=date(2025, 1, 1), currency='EUR', rate=Decimal('0.5')),
+            CurrencyRate(date=date(2025, 1, 2), currency='EUR', rate=Decimal('0.8')),
+            CurrencyRate(date=date(2025, 1, 1), currency='JPY', rate=Decimal('100')),
+        ])
+        invalidate_rate_history()
+
+        cls.user = get_user_model().objects.create_user(
+            email='totals@example.com', username='totals', full_name='Totals Test', password='x'
+        )
+        cls.meals = Category.objects.create(user=cls.user, category_name='Test Meals')
+        cls.travel = Category.objects.create(user=cls.user, category_name='Test Travel')
+        for category, amount, currency, day in [
+            (cls.meals, '10.00', 'USD', date(2025, 1, 1)),
+            (cls.meals, '5.00', 'EUR', date(2025, 1, 1)),    # 10.00 USD
+            (cls.travel, '4.00', 'EUR', date(2025, 1, 2)),   # 5.00 USD
+            (cls.travel, '1000', 'JPY', date(2025, 1, 1)),   # 10.00 USD
+        ]:
+            Expense.objects.create(
+                user=cls.user, category=category, amount=Decimal(amount), currency=currency,
+                expense_date=day, merchant_name='Test', entry_method='manual',
+            )
+
+    def totals(self, target_currency, group_by=()):
+        expenses = Expense.objects.filter(user=self.user)
+        return converted_totals(expenses, target_currency, group_by, snapshot=rate_snapshot())
+
+    def test_minor_amounts_are_stored(self):
+        self.assertEqual(
+            sorted(Expense.objects.values_list('amount_minor', 'base_amount_minor')),
+            [(400, 500), (500, 1000), (1000, 1000), (1000, 1000)],
+        )
+
+    def test_total_in_each_currency(self):
+        for currency, total_minor, total in [
+            ('USD', 3500, Decimal('35.00')),
+            # 9.00 EUR, and 20.00 USD at 0.5 on Jan 1
+            ('EUR', 1900, Decimal('19.00')),
+            # 1000 JPY, 20.00 USD at 100 on Jan 1 and 5.00 USD at the same rate on Jan 2
+            ('JPY', 3500, Decimal('3500')),
+        ]:
+            with self.subTest(currency):
+                [row] = self.totals(currency)
+                self.assertEqual((row['total_minor'], row['total'], row['count']), (total_minor, total, 4))
+
+    def test_grouped_totals(self):
+        rows = {row['category_id']: row for row in self.totals('USD', ['category_id'])}
+        self.assertEqual(rows[self.meals.pk]['total_minor'], 2000)
+        self.assertEqual(rows[self.travel.pk]['total_minor'], 1500)
+        self.assertEqual(rows[self.travel.pk]['count'], 2)
+
+    def test_dates_past_the_history_use_live_rates(self):
+        # Static live rates: 0.95 EUR per USD
+        expense = Expense.objects.create(
+            user=self.user, category=self.meals, amount=Decimal('9.50'), currency='EUR',
+            expense_date=date(2025, 1, 3), merchant_name='Test', entry_method='manual',
+        )
+        self.assertEqual(expense.base_amount_minor, 1000)
+        # Jan 2 is the last day loaded: its own rate, for every currency
+        self.assertEqual(rate_snapshot().rate('JPY', date(2025, 1, 2)), Decimal('100'))
+
+    def test_rows_without_base_amount_are_converted(self):
+        Expense.objects.filter(currency='EUR').update(base_amount_minor=None)
+        [row] = self.totals('USD')
+        self.assertEqual(row['total_minor'], 3500)
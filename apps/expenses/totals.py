@@ -0,0 +1,69 @@
+# apps/expenses/totals.py
+#
+# Cross-currency expense totals, summed exactly in SQL as integers of the
+# currencies' minor units (see apps/core/money.py). Expenses already in the
+# target currency are summed by amount_minor; the rest by base_amount_minor
+# (their amount in BASE_CURRENCY at the rate of their date). The base sums
+# come back per expense_date, so each day's is converted to the target
+# currency at that day's rate: at most one row per day and group, and a
+# past month's total doesn't move with today's rates.
+#
+# Rows whose base_amount_minor hasn't been backfilled yet are converted one
+# by one in Python; after `manage.py backfill_base_amounts` there are none.
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+
+from apps.core.currency_rates import rate_snapshot
+from apps.core.money import from_minor, to_minor
+
+
+def converted_totals(queryset, target_currency, group_by=(), snapshot=None):
+    """
+    Totals of ``queryset`` in ``target_currency``, one row per distinct
+    value of the ``group_by`` fields: dicts of those fields plus
+    ``total_minor`` (int, in the target currency's minor unit), ``total``
+    (the same as a Decimal, for display) and ``count``. Without group_by,
+    a single row.
+    """
+    snapshot = snapshot or rate_snapshot()
+    base_currency = getattr(settings, 'BASE_CURRENCY', 'USD')
+    group_by = list(group_by)
+    in_target = Q(currency=target_currency)
+
+    aggregates = {
+        'same': Sum('amount_minor', filter=in_target),
+        'base': Sum('base_amount_minor', filter=~in_target),
+        'count': Count('pk'),
+    }
+    queryset = queryset.order_by()
+    rows = queryset.values(*group_by, 'expense_date').annotate(**aggregates)
+
+    totals = {}
+    if not group_by:
+        totals[()] = {'total_minor': 0, 'count': 0}
+    for row in rows:
+        key = tuple(row[field] for field in group_by)
+        group = totals.get(key)
+        if group is None:
+            group = totals[key] = {**{field: row[field] for field in group_by}, 'total_minor': 0, 'count': 0}
+        group['total_minor'] += row['same'] or 0
+        if row['base'] is not None:
+            converted = snapshot.convert(
+                from_minor(row['base'], base_currency), base_currency, target_currency, row['expense_date']
+            )
+            group['total_minor'] += to_minor(converted, target_currency)
+        group['count'] += row['count']
+
+    missing = (
+        queryset.filter(base_amount_minor__isnull=True).exclude(in_target)
+        .values_list(*group_by, 'amount', 'currency', 'expense_date')
+    )
+    for *key, amount, currency, expense_date in missing:
+        converted = snapshot.convert(amount, currency or 'USD', target_currency, expense_date)
+        totals[tuple(key)]['total_minor'] += to_minor(converted, target_currency)
+
+    for row in totals.values():
+        row['total'] = from_minor(row['total_minor'], target_currency)
+    return list(totals.values())
+
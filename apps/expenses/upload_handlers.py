@@ -0,0 +1,51 @@
+# apps/expenses/upload_handlers.py
+
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class ReceiptUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every upload to a temporary file next to MEDIA_ROOT, never to memory.
+
+    The SHA-256 and size are computed while the chunks arrive, so storing the
+    receipt afterwards is a rename on the same filesystem instead of another
+    read. Receipt fields stop being written once they pass
+    RECEIPT_MAX_UPLOAD_BYTES; the file is then flagged ``oversized`` for the
+    view to reject.
+    """
+    receipt_fields = ('receipt_file', 'receipt_files')
+
+    def new_file(self, *args, **kwargs):
+        temp_dir = getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None)
+        if temp_dir:
+            os.makedirs(temp_dir, exist_ok=True)
+
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+        self.oversized = False
+        self.max_bytes = (
+            getattr(settings, 'RECEIPT_MAX_UPLOAD_BYTES', None)
+            if self.field_name in self.receipt_fields else None
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.max_bytes and self.received > self.max_bytes:
+            # Keep reading the request body, but stop storing this file.
+            self.oversized = True
+            return None
+
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(self.file.tell())
+        uploaded.sha256 = self.sha256.hexdigest()
+        uploaded.oversized = self.oversized
+        uploaded.received_bytes = self.received
+        return uploaded
@@ -12,6 +12,10 @@ urlpatterns = [
     
     # Smart Input
     path('receipt/upload/', views.receipt_upload, name='receipt_upload'),
+    path('receipt/batch/', views.receipt_batch_upload, name='receipt_batch_upload'),
+    path('receipt/jobs/<int:pk>/status/', views.receipt_job_status, name='receipt_job_status'),
     path('voice/', views.voice_input, name='voice_input'),
     path('text/', views.text_parse, name='text_parse'),
+    path('text/preview/', views.text_parse_preview, name='text_parse_preview'),
+    path('text/bulk/', views.text_bulk_parse, name='text_bulk_parse'),
 ]
\ No newline at end of file
@@ -1,129 +1,71 @@
+import logging
 import re
-import easyocr
+import uuid
 import numpy as np
+from contextlib import ExitStack
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection, transaction
+from django.core.files.storage import default_storage
 from django.conf import settings
 
 # Project Imports
-from .models import Expense, Receipt
-from .forms import ExpenseForm
+from .models import Expense, Receipt, OCRJob
+from .forms import ExpenseForm, BulkTextEntryFormSet
+from .receipt_storage import (
+    store_receipt_file, removed_on_error, find_ocr_text, ReceiptRejected,
+    find_near_duplicate, remember_perceptual_hash,
+)
+from .image_preprocessing import perceptual_hash
+from .extraction_rules import RULES, keywords_in, scan_amounts, scan_lines
+from .extraction_trace import NO_TRACE, start_trace
+from .date_parsing import date_order_for, parse_date_match
+from . import date_parsing
+from .merchants import get_merchant_dictionary, record_merchant_edit
+from .categorizer import forget_categorizer, predict_categories, predict_category
+from . import quick_add
+from apps.categories.index import FALLBACK_CATEGORY_NAME, get_category_index
 from apps.categories.models import Category
 from apps.ai_services.models import AIExtraction
 from apps.ai_services.utils import check_budget_alerts
-from apps.core.currency_rates import convert_amount
+from apps.core.currency_rates import convert_amount, rate_snapshot
+
+logger = logging.getLogger(__name__)
 
 # ==========================================
 #  AI BRAIN: EXTRACTION LOGIC
 # ==========================================
 
-def _clean_price_token(token):
+def _limit_input(text, setting='SMART_INPUT_MAX_CHARS', default=1000):
     """
-    Cleans a single token string into a Decimal.
+    Untrusted text is only parsed up to a configured length, which keeps
+    every parser's worst case bounded (see `manage.py fuzz_parsers`).
     """
-    if not token:
-        return None
-    
-    token = token.strip()
-    token = re.sub(r'[$€£¥៛]', '', token)
-    
-    if ',' in token and '.' in token:
-        parts = token.split('.')
-        if len(parts) == 2:
-            parts[0] = parts[0].replace(',', '')
-            token = '.'.join(parts)
-    
-    pattern = r'^\d+\.\d{2}$'
-    if not re.match(pattern, token):
-        if '.' not in token:
-            token = token + '.00'
-        else:
-            parts = token.split('.')
-            if len(parts) == 2:
-                parts[1] = parts[1][:2].ljust(2, '0')
-                token = '.'.join(parts)
-    
-    try:
-        val = Decimal(token)
-        if val > 50000 or val < 0.01:
-            return None
-        if 1000 <= val <= 9999 and float(val).is_integer():
-            return None
-        if 2020 <= val <= 2030:
-            return None
-        return val
-    except:
-        return None
-
-
-def _extract_amounts_from_line(line):
-    """
-    Extract all potential amounts from a single line.
-    """
-    amounts = []
-    line = ' '.join(line.split())
-    
-    print(f"    Analyzing: '{line}'")
-    
-    # Check if this line should be excluded
-    exclusion_check = line.lower()
-    if any(exc in exclusion_check for exc in ['cash', 'change', 'payment', 'tender', 'visa', 'card']):
-        print(f"    🚫 Line excluded")
-        return []
-    
-    # Pattern 1: Dollar sign + amount
-    pattern1 = r'\$\s*(\d{1,6}\.\d{2})\b'
-    for match in re.finditer(pattern1, line):
-        amount_str = match.group(1)
-        print(f"      Pattern1: ${amount_str}")
-        val = _clean_price_token(amount_str)
-        if val:
-            amounts.append(val)
-            print(f"      ✓ ${val}")
-    
-    # Pattern 2: Standalone amounts
-    pattern2 = r'(?<![.\d])(\d{1,6}\.\d{2})(?![.\d])'
-    for match in re.finditer(pattern2, line):
-        amount_str = match.group(1)
-        start_pos = match.start()
-        
-        # Skip if already captured by pattern1
-        if start_pos > 0 and line[start_pos-1] == '$':
-            continue
-        
-        print(f"      Pattern2: {amount_str}")
-        val = _clean_price_token(amount_str)
-        if val:
-            amounts.append(val)
-            print(f"      ✓ ${val}")
-    
-    # Remove duplicates
-    seen = set()
-    unique_amounts = []
-    for amt in amounts:
-        if amt not in seen:
-            seen.add(amt)
-            unique_amounts.append(amt)
-    
-    if unique_amounts:
-        print(f"      📊 Found: {unique_amounts}")
-    else:
-        print(f"      ⚪ No amounts")
-    
-    return unique_amounts
+    return text[:getattr(settings, setting, default)]
 
 
-def _smart_extract(text, user):
+def _smart_extract(text, user, trace=NO_TRACE, date_order=None):
     """
     Advanced Extraction Algorithm for Receipt Upload.
     Smart detection with case-insensitive keyword matching.
+
+    Keyword lists, regexes and keyword automata come precompiled from
+    extraction_rules.RULES; each line is scanned once for all keywords.
+    Ambiguous numeric dates are read in ``date_order`` (the user's preferred
+    order by default, see date_parsing.py).
+    Decisions are recorded on ``trace`` (see extraction_trace.start_trace).
     """
+    rules = RULES
+    text = _limit_input(text, 'RECEIPT_TEXT_MAX_CHARS', 10000)
+    if date_order is None:
+        date_order = date_order_for(user)
     text_lower = text.lower()
     lines = [line.strip() for line in text.split('\n') if line.strip()]
     today = timezone.now().date()
@@ -135,140 +77,47 @@ def _smart_extract(text, user):
         'category': None,
         'payment_method': 'Cash',
         'notes': '',
-        'confidence': 0.0
+        'confidence': 0.0,
+        'date_found': False,
+        'merchant_source': None,
     }
 
-    print(f"\n{'='*70}")
-    print(f"EXTRACTION DEBUG - {len(lines)} lines")
-    print(f"{'='*70}")
+    trace.add('start', lines=len(lines), chars=len(text))
 
-    # EXTRACT AMOUNT with enhanced keyword detection
-    candidates = []
-    
-    # Priority keywords (case-insensitive)
-    priority_keywords = [
-        (['total amount', 'totalamount', 'amount total', 'tot amt'], 1000, 'TOTAL AMOUNT'),
-        (['grand total', 'grandtotal'], 900, 'GRAND TOTAL'),
-        (['final total', 'finaltotal', 'net total', 'nettotal'], 850, 'FINAL TOTAL'),
-        (['amount due', 'amountdue', 'due amount'], 800, 'AMOUNT DUE'),
-        (['balance due', 'balancedue', 'due balance'], 750, 'BALANCE DUE'),
-        (['total', 'tot', 'ttl'], 600, 'TOTAL'),
-        (['sub total', 'subtotal', 'sub-total', 'sub ttl'], 400, 'SUBTOTAL'),
-        (['amount', 'amt'], 300, 'AMOUNT'),
-        (['balance', 'bal'], 200, 'BALANCE'),
-    ]
-    
-    # Absolute exclusions
-    exclusion_keywords = [
-        'cash', 'change', 'change due', 'tender', 'tendered',
-        'payment', 'visa', 'card', 'mastercard', 'amex', 'credit card', 'debit card',
-        'received', 'given', 'discount', 'savings', 'you saved'
-    ]
-    
-    print("\n🔍 SMART KEYWORD SEARCH:")
-    
-    for i, line in enumerate(lines):
-        line_clean = line.lower().strip()
-        line_original = line.strip()
-        
-        # Super normalize: remove ALL spaces, dashes, underscores, colons for matching
-        line_super_normalized = re.sub(r'[\s\-_:;.,]+', '', line_clean)
-        # Also keep version with single spaces
-        line_space_normalized = re.sub(r'[\s\-_:;.,]+', ' ', line_clean).strip()
-        
-        print(f"\n📍 Line {i}: '{line_original}'")
-        print(f"   Super normalized: '{line_super_normalized}'")
-        
-        # Skip excluded lines
-        if any(exc in line_clean for exc in exclusion_keywords):
-            print(f"  🚫 EXCLUDED (contains: {[e for e in exclusion_keywords if e in line_clean]})")
-            continue
-        
-        # Find ALL matching keywords and pick the most specific
-        matching_keywords = []
-        
-        for keyword_variations, score, name in priority_keywords:
-            keyword_matched = False
-            matched_variation = ""
-            
-            for keyword in keyword_variations:
-                # Create multiple versions of the keyword to match
-                keyword_no_space = keyword.replace(' ', '').replace('-', '')
-                keyword_with_space = keyword.replace('-', ' ')
-                
-                # Check in multiple normalized versions
-                if (keyword_no_space in line_super_normalized or 
-                    keyword_with_space in line_space_normalized or
-                    keyword in line_clean):
-                    
-                    # Special handling: if line has "subtotal", don't match plain "total"
-                    if keyword in ['total', 'tot', 'ttl']:
-                        # Check if subtotal indicators exist
-                        subtotal_no_space = ['subtotal', 'subtot', 'subttl', 'sub']
-                        if any(ind in line_super_normalized for ind in subtotal_no_space):
-                            # But also check if the word "sub" appears BEFORE "total"
-                            # This prevents "TOTAL" line from being mistaken as subtotal
-                            sub_indicators_with_space = ['sub total', 'subtotal', 'sub-total', 'sub tot']
-                            if any(ind in line_space_normalized for ind in sub_indicators_with_space):
-                                print(f"  ⚠️ Skipping '{keyword}' - line has SUBTOTAL indicators")
-                                keyword_matched = False
-                                break
-                    
-                    keyword_matched = True
-                    matched_variation = keyword
-                    print(f"  ✓ Matched: '{keyword}' → {name} (score: {score})")
-                    break  # Found a match in this variation group
-            
-            if keyword_matched:
-                matching_keywords.append((matched_variation, score, name, len(matched_variation)))
-        
-        if not matching_keywords:
-            print(f"  ⚪ No keyword match")
-            continue
-        
-        # Sort by: score (highest), then keyword length (longest = most specific)
-        matching_keywords.sort(key=lambda x: (x[1], x[3]), reverse=True)
-        keyword_text, keyword_score, keyword_name, _ = matching_keywords[0]
-        
-        print(f"  🎯 BEST MATCH: '{keyword_text}' → {keyword_name} (score: {keyword_score})")
-        
-        # Extract amounts from this line
-        amounts_in_line = _extract_amounts_from_line(line_original)
-        
-        # If no amount on this line, check next line
-        if not amounts_in_line and i + 1 < len(lines):
-            next_line = lines[i + 1]
-            next_line_clean = next_line.lower().strip()
-            
-            if not any(exc in next_line_clean for exc in exclusion_keywords):
-                print(f"  📋 Checking next line: '{next_line}'")
-                amounts_in_line = _extract_amounts_from_line(next_line)
-                if amounts_in_line:
-                    print(f"  ✨ Found amount on next line!")
-        
-        if not amounts_in_line:
-            print(f"  ⚠️ No amount found")
-            continue
-        
-        # Add all amounts from this line with keyword score
-        for amount in amounts_in_line:
-            print(f"  ✅ CANDIDATE: ${amount} with {keyword_name} (score: {keyword_score})")
-            candidates.append((amount, keyword_score, i, f"{keyword_name}: {line_original}"))
+    # EXTRACT AMOUNT: every number in the text is tokenized once, then
+    # scored by the amount keyword on its line (or the line above)
+    features = scan_lines(lines, rules)
+    amounts = scan_amounts(lines, features, rules)
+    candidates = [c for c in amounts if c.score]
+    if trace.enabled:
+        trace.add(
+            'keywords',
+            lines=[
+                {'line': i, 'matches': [m[2] for m in f.matches]}
+                for i, f in enumerate(features) if f.matches
+            ],
+            excluded=[i for i, f in enumerate(features) if f.excluded],
+        )
     
     # Select best candidate
     if candidates:
-        # Sort by score (highest first), then by line position (later = better)
-        candidates.sort(key=lambda x: (x[1], x[2]), reverse=True)
+        # Highest score, then latest keyword line; first in text order on ties
+        best = max(candidates, key=lambda c: (c.score, c.anchor))
+        data['amount'] = best.amount
+        best_score = best.score
         
-        print(f"\n📊 ALL CANDIDATES:")
-        for amt, score, line_num, desc in candidates[:5]:  # Show top 5
-            print(f"   ${amt} - score {score} - {desc[:50]}")
-        
-        best_amount, best_score, line_idx, debug_info = candidates[0]
-        data['amount'] = best_amount
-        
-        print(f"\n🎯 SELECTED: ${best_amount} (score: {best_score})")
-        print(f"   From: {debug_info}")
+        if trace.enabled:
+            trace.add(
+                'amount',
+                strategy='keyword',
+                selected=data['amount'],
+                score=best_score,
+                keyword_line=best.anchor,
+                candidates=[
+                    {'amount': c.amount, 'line': c.line, 'score': c.score}
+                    for c in sorted(candidates, key=lambda c: (c.score, c.anchor), reverse=True)[:5]
+                ],
+            )
         
         # Calculate confidence based on score
         if best_score >= 800:
@@ -280,181 +129,69 @@ def _smart_extract(text, user):
         else:
             data['confidence'] += 0.60
     else:
-        # Fallback strategy
-        print("\n⚠️ NO KEYWORD MATCHES FOUND")
-        print("🔄 Using fallback: largest reasonable amount...")
+        # Fallback strategy: largest reasonable amount
+        # Skip obvious exclusions, keep reasonable amounts (0.50 - 5000)
+        reasonable = [c for c in amounts if not c.excluded and 50 <= c.cents <= 500000]
         
-        all_amounts = []
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
-            # Skip obvious exclusions
-            if any(exc in line_lower for exc in exclusion_keywords):
-                continue
-            
-            amounts = _extract_amounts_from_line(line)
-            for amt in amounts:
-                all_amounts.append((amt, i, line))
-        
-        if all_amounts:
-            # Filter reasonable amounts
-            reasonable = [(a, i, l) for a, i, l in all_amounts if 0.50 <= a <= 5000]
-            
-            if reasonable:
-                # Pick largest (likely the total)
-                reasonable.sort(key=lambda x: x[0], reverse=True)
-                fallback_amount, fallback_line_idx, fallback_line = reasonable[0]
-                
-                data['amount'] = fallback_amount
-                data['confidence'] += 0.30
-                print(f"🔄 FALLBACK: ${fallback_amount}")
-                print(f"   From line {fallback_line_idx}: {fallback_line}")
-            else:
-                data['amount'] = Decimal('0.00')
-                print("❌ NO REASONABLE AMOUNTS")
+        if reasonable:
+            # Pick largest (likely the total)
+            fallback = max(reasonable, key=lambda c: c.cents)
+            data['amount'] = fallback.amount
+            data['confidence'] += 0.30
+            trace.add('amount', strategy='largest', selected=data['amount'], line=fallback.line,
+                      candidates=len(reasonable))
         else:
             data['amount'] = Decimal('0.00')
-            print("❌ NO AMOUNTS FOUND")
+            trace.add('amount', strategy='none', numbers=len(amounts))
 
     # EXTRACT DATE with comprehensive smart detection
     date_found = False
     
-    print(f"\n📅 DATE DETECTION:")
-    
-    # Priority date keywords with ALL variations (spacing-agnostic)
-    date_keyword_groups = [
-        ['due', 'duedate', 'due date', 'due-date', 'duedt'],
-        ['receiptdate', 'receipt date', 'receipt-date'],
-        ['transactiondate', 'transaction date', 'trans date', 'transdate', 'trans-date'],
-        ['purchasedate', 'purchase date', 'purchase-date'],
-        ['saledate', 'sale date', 'sale-date'],
-        ['orderdate', 'order date', 'order-date'],
-        ['invoicedate', 'invoice date', 'invoice-date'],
-        ['date', 'dated', 'dt'],
-    ]
-    
-    # Comprehensive date patterns with more flexible text month matching
-    date_patterns = [
-        # 1. Text month formats - MORE FLEXIBLE
-        # Day Month Year (28 August 2022, 28Aug2022, 28-August-2022)
-        (r'(\d{1,2})\s*(?:st|nd|rd|th)?\s*[,\s\-]*\s*(Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|Jun(?:e)?|Jul(?:y)?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)\s*[,\s\-]*\s*(\d{2,4})', 
-         lambda m: f"{m.group(1)} {m.group(2)} {m.group(3) if len(m.group(3)) == 4 else '20' + m.group(3)}", 
-         ['%d %B %Y', '%d %b %Y'],
-         'text_day_month_year'),
-        
-        # Month Day Year (August 28 2022, Aug-28-2022)
-        (r'(Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|Jun(?:e)?|Jul(?:y)?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)\s*[,\s\-]*\s*(\d{1,2})(?:st|nd|rd|th)?\s*[,\s\-]*\s*(\d{2,4})',
-         lambda m: f"{m.group(2)} {m.group(1)} {m.group(3) if len(m.group(3)) == 4 else '20' + m.group(3)}",
-         ['%d %B %Y', '%d %b %Y'],
-         'text_month_day_year'),
-        
-        # Month Year only (August 2022, Aug-2022)
-        (r'(Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|Jun(?:e)?|Jul(?:y)?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)\s*[,\s\-]*\s*(\d{4})',
-         lambda m: f"01 {m.group(1)} {m.group(2)}",
-         ['%d %B %Y', '%d %b %Y'],
-         'text_month_year'),
-        
-        # 2. ISO format (2024-12-21, 2024/12/21, 20241221)
-        (r'(\d{4})[/\-](\d{1,2})[/\-](\d{1,2})',
-         lambda m: f"{m.group(1)}-{m.group(2)}-{m.group(3)}",
-         ['%Y-%m-%d'],
-         'iso_format'),
-        
-        (r'\b(20\d{2})(\d{2})(\d{2})\b',
-         lambda m: f"{m.group(1)}-{m.group(2)}-{m.group(3)}",
-         ['%Y-%m-%d'],
-         'compact_iso'),
-        
-        # 3. Standard formats (12/05/2024, 12-05-2024, 28 12 2025)
-        (r'\b(\d{1,2})[/\-\.](\d{1,2})[/\-\.](\d{4})\b',
-         lambda m: f"{m.group(1)}/{m.group(2)}/{m.group(3)}",
-         ['%m/%d/%Y', '%d/%m/%Y'],
-         'standard_slash_dash'),
-        
-        (r'\b(\d{1,2})\s+(\d{1,2})\s+(\d{4})\b',
-         lambda m: f"{m.group(1)}/{m.group(2)}/{m.group(3)}",
-         ['%m/%d/%Y', '%d/%m/%Y'],
-         'space_separated'),
-        
-        # 4. Short year (12/05/24, 12-05-24)
-        (r'\b(\d{1,2})[/\-\.](\d{1,2})[/\-\.](\d{2})\b',
-         lambda m: f"{m.group(1)}/{m.group(2)}/{m.group(3)}",
-         ['%m/%d/%y', '%d/%m/%y'],
-         'short_year'),
-    ]
-    
-    # Strategy 1: Search for dates WITH keywords (higher priority)
-    for keyword_group in date_keyword_groups:
-        for keyword in keyword_group:
-            # Create regex pattern that's flexible about spacing
-            # Convert "due date" to match "due[\s\-:]*date"
-            keyword_pattern = keyword.replace(' ', r'[\s\-:]*').replace('-', r'[\s\-:]*')
+    # Strategy 1: Search for dates WITH keywords (higher priority).
+    # A keyword whose leading letters aren't in the text can't match; the
+    # shortcut is only taken for ASCII text, where that is exact.
+    lines_lower = [line.lower() for line in lines]
+    ascii_text = text.isascii()
+    # Text-month patterns can't match anywhere if no month name appears at all
+    date_patterns = rules.date_patterns
+    fallback_patterns = rules.date_patterns[:3]  # Top 3 patterns
+    if not rules.month_name.search(text):
+        date_patterns = tuple(p for p in date_patterns if not p.needs_month)
+        fallback_patterns = tuple(p for p in fallback_patterns if not p.needs_month)
+    for keyword_group in rules.date_keyword_groups:
+        for date_keyword in keyword_group:
+            if ascii_text and date_keyword.literal not in text_lower:
+                continue
+            keyword_match = date_keyword.regex.search(text)
+            if not keyword_match:
+                continue
             
-            # Search for keyword in text (case-insensitive)
-            keyword_regex = re.compile(keyword_pattern, re.IGNORECASE)
-            keyword_match = keyword_regex.search(text)
+            # Get text around the keyword with much more space for dates on same line
+            # Some receipts have "DUE DATE        26/02/2019" with lots of spacing
+            start_pos = max(0, keyword_match.start() - 50)
+            end_pos = min(len(text), keyword_match.end() + 200)
+            context_text = text[start_pos:end_pos]
             
-            if keyword_match:
-                print(f"   🔑 Found keyword: '{keyword}' at position {keyword_match.start()}")
-                print(f"      Matched text: '{keyword_match.group(0)}'")
-                
-                # Get text around the keyword with much more space for dates on same line
-                # Some receipts have "DUE DATE        26/02/2019" with lots of spacing
-                start_pos = max(0, keyword_match.start() - 50)
-                end_pos = min(len(text), keyword_match.end() + 200)  # Increased from 100 to 200
-                context_text = text[start_pos:end_pos]
-                
-                # Also check the same line specifically
-                # Find which line contains the keyword
-                for line_idx, line in enumerate(lines):
-                    if keyword_match.group(0).lower() in line.lower():
-                        print(f"      Found in line {line_idx}: '{line.strip()}'")
-                        # Add this line to context
-                        context_text = line + " " + context_text
-                        break
-                
-                print(f"      Context: '{context_text[:100]}...'")
-                
-                # Try to find date patterns in this context
-                for pattern, extractor, formats, pattern_name in date_patterns:
-                    match = re.search(pattern, context_text, re.IGNORECASE)
-                    if match:
-                        try:
-                            date_str = extractor(match)
-                            print(f"      ✓ Pattern ({pattern_name}): {match.group(0)}")
-                            print(f"      ✓ Extracted: {date_str}")
-                            
-                            for fmt in formats:
-                                try:
-                                    parsed_date = datetime.strptime(date_str, fmt).date()
-                                    
-                                    # Validation
-                                    if parsed_date > today:
-                                        print(f"      ⚠️ Future date: {parsed_date}")
-                                        continue
-                                    
-                                    if parsed_date < today - timedelta(days=1095):
-                                        print(f"      ⚠️ Too old: {parsed_date}")
-                                        continue
-                                    
-                                    # Success!
-                                    data['date'] = parsed_date
-                                    data['confidence'] += 0.35
-                                    date_found = True
-                                    print(f"      ✅ DATE (with keyword): {parsed_date}")
-                                    break
-                                except ValueError as e:
-                                    print(f"      ⚠️ Parse error: {e}")
-                                    continue
-                            
-                            if date_found:
-                                break
-                                
-                        except Exception as e:
-                            print(f"      ⚠️ Error: {e}")
-                            continue
-                    
-                    if date_found:
-                        break
+            # Also check the same line specifically
+            matched_lower = keyword_match.group(0).lower()
+            for line, line_lower in zip(lines, lines_lower):
+                if matched_lower in line_lower:
+                    context_text = line + " " + context_text
+                    break
+            
+            # Try to find date patterns in this context
+            for date_pattern in date_patterns:
+                match = date_pattern.regex.search(context_text)
+                if not match:
+                    continue
+                parsed_date = parse_date_match(match, date_pattern.layout, today, date_order)
+                if parsed_date:
+                    data['date'] = parsed_date
+                    data['confidence'] += 0.35
+                    date_found = True
+                    trace.add('date', strategy='keyword', keyword=date_keyword.keyword,
+                              pattern=date_pattern.name, date=parsed_date)
+                    break
             
             if date_found:
                 break
@@ -464,198 +201,125 @@ def _smart_extract(text, user):
     
     # Strategy 2: Search entire text without keywords
     if not date_found:
-        print(f"   🔍 No keyword found, searching all text...")
-        
-        for pattern, extractor, formats, pattern_name in date_patterns:
-            matches = list(re.finditer(pattern, text, re.IGNORECASE))
-            
-            if matches:
-                print(f"      Found {len(matches)} match(es) for {pattern_name}")
-                
-                for match in matches:
-                    try:
-                        date_str = extractor(match)
-                        print(f"      ✓ Pattern: {match.group(0)}")
-                        print(f"      ✓ Extracted: {date_str}")
-                        
-                        for fmt in formats:
-                            try:
-                                parsed_date = datetime.strptime(date_str, fmt).date()
-                                
-                                if parsed_date > today:
-                                    continue
-                                
-                                if parsed_date < today - timedelta(days=1095):
-                                    continue
-                                
-                                data['date'] = parsed_date
-                                data['confidence'] += 0.25
-                                date_found = True
-                                print(f"      ✅ DATE: {parsed_date}")
-                                break
-                            except ValueError:
-                                continue
-                        
-                        if date_found:
-                            break
-                            
-                    except Exception:
-                        continue
-                
-                if date_found:
+        for date_pattern in date_patterns:
+            for match in date_pattern.regex.finditer(text):
+                parsed_date = parse_date_match(match, date_pattern.layout, today, date_order)
+                if parsed_date:
+                    data['date'] = parsed_date
+                    data['confidence'] += 0.25
+                    date_found = True
+                    trace.add('date', strategy='anywhere', pattern=date_pattern.name, date=parsed_date)
                     break
+            
+            if date_found:
+                break
     
     # Strategy 3: Fallback search in first 10 lines
     if not date_found:
-        print(f"   🔄 Fallback: first 10 lines...")
-        
         for i, line in enumerate(lines[:10]):
-            if any(x in line.lower() for x in ['total', 'amount', 'price', 'qty']):
+            if any(x in lines_lower[i] for x in rules.fallback_date_skip):
                 continue
             
-            for pattern, extractor, formats, pattern_name in date_patterns[:3]:  # Try top 3 patterns
-                match = re.search(pattern, line, re.IGNORECASE)
+            for date_pattern in fallback_patterns:
+                match = date_pattern.regex.search(line)
                 if match:
-                    try:
-                        date_str = extractor(match)
-                        for fmt in formats:
-                            try:
-                                parsed_date = datetime.strptime(date_str, fmt).date()
-                                if today - timedelta(days=1095) <= parsed_date <= today:
-                                    data['date'] = parsed_date
-                                    data['confidence'] += 0.15
-                                    date_found = True
-                                    print(f"      ✅ Fallback: {parsed_date} (line {i})")
-                                    break
-                            except:
-                                continue
-                        if date_found:
-                            break
-                    except:
-                        continue
-                if date_found:
-                    break
+                    parsed_date = parse_date_match(match, date_pattern.layout, today, date_order)
+                    if parsed_date:
+                        data['date'] = parsed_date
+                        data['confidence'] += 0.15
+                        date_found = True
+                        trace.add('date', strategy='top_lines', pattern=date_pattern.name,
+                                  line=i, date=parsed_date)
+                        break
             if date_found:
                 break
     
     if not date_found:
         data['date'] = today
-        print(f"   ⚠️ Using today: {today}")
-
-    # EXTRACT MERCHANT with enhanced detection
-    known_merchants = [
-        'Starbucks', 'Walmart', 'Wall-Mart', 'Target', 'Amazon', 'Costco',
-        'McDonald\'s', 'Burger King', 'KFC', 'Subway', 'Domino\'s', 'Pizza Hut',
-        'Shell', 'Chevron', 'Exxon', 'BP', 'Total', 'Caltex',
-        'Whole Foods', 'Trader Joe\'s', 'Safeway', 'Kroger',
-        'CVS', 'Walgreens', '7-Eleven', 'Circle K',
-        'Supermarket', 'Burger Kingdom'
-    ]
-    
-    for merchant in known_merchants:
-        if merchant.lower() in text_lower:
-            data['merchant'] = merchant
-            data['confidence'] += 0.2
-            print(f"🏪 MERCHANT: {merchant} (known brand)")
-            break
+        trace.add('date', strategy='today', date=today)
+    data['date_found'] = date_found
+
+    # Category and payment keywords occurring anywhere in the text
+    found_keywords = keywords_in(text_lower, rules)
+
+    # EXTRACT MERCHANT: the known or learned name found earliest in the text.
+    # Learned names need the user; without one only built-in brands are known.
+    merchant_match = get_merchant_dictionary(user).find(text_lower)
+    if merchant_match:
+        data['merchant'] = merchant_match.merchant
+        data['merchant_source'] = merchant_match.source
+        data['confidence'] += 0.2
+        trace.add('merchant', source=merchant_match.source, merchant=merchant_match.merchant)
     
     # If no known merchant, extract from top of receipt
     if not data['merchant']:
         for line in lines[:5]:  # Check first 5 lines
             clean = line.strip()
             # Skip header/info lines
-            if len(clean) > 2 and not any(x in clean.upper() for x in [
-                'RECEIPT', 'INVOICE', 'TEL', 'PHONE', 'FAX', 'ADDRESS', 
-                'STREET', 'CITY', 'STATE', 'ZIP', 'WWW', '.COM', 'HTTP',
-                'MANAGER', 'CASHIER', 'SERVER', 'THANK YOU'
-            ]):
+            if len(clean) > 2 and not rules.merchant_header_skip.search(clean.upper()):
                 # Skip if mostly numbers (phone, address)
                 digit_ratio = sum(c.isdigit() for c in clean) / len(clean) if len(clean) > 0 else 0
                 if digit_ratio < 0.5 and len(clean) <= 50:
                     data['merchant'] = clean.title()[:30]
-                    print(f"🏪 MERCHANT: {data['merchant']} (extracted)")
+                    data['merchant_source'] = 'header'
+                    trace.add('merchant', source='header', merchant=data['merchant'])
                     break
     
     if not data['merchant']:
         data['merchant'] = "Unknown Merchant"
-        print(f"🏪 MERCHANT: Unknown (default)")
-
-    # SMART CATEGORY DETECTION based on merchant and keywords
-    category_keywords = {
-        'Food & Dining': [
-            'restaurant', 'cafe', 'coffee', 'burger', 'pizza', 'sushi',
-            'chinese', 'thai', 'italian', 'mexican', 'fast food',
-            'starbucks', 'mcdonald', 'burger king', 'kfc', 'subway',
-            'food', 'lunch', 'dinner', 'breakfast', 'meal'
-        ],
-        'Groceries': [
-            'supermarket', 'grocery', 'market', 'walmart', 'target', 'costco',
-            'whole foods', 'trader joe', 'safeway', 'kroger',
-            'vegetables', 'fruits', 'meat', 'dairy'
-        ],
-        'Transportation': [
-            'gas', 'fuel', 'petrol', 'diesel', 'shell', 'chevron', 'exxon', 'bp',
-            'parking', 'toll', 'uber', 'lyft', 'taxi', 'transportation'
-        ],
-        'Shopping': [
-            'store', 'mall', 'shop', 'clothing', 'fashion', 'electronics',
-            'amazon', 'best buy', 'apple store'
-        ],
-    }
-    
-    for cat_name, keywords in category_keywords.items():
-        if any(keyword in text_lower for keyword in keywords):
-            cat = Category.objects.filter(
-                user=user,
-                category_name__icontains=cat_name.split()[0]
-            ).first()
-            if cat:
-                data['category'] = cat
-                data['confidence'] += 0.15
-                print(f"📁 CATEGORY: {cat_name} (keyword match)")
-                break
+        trace.add('merchant', source='default', merchant=data['merchant'])
+
+    # Keyword families that matched, in priority order. Resolving them to the
+    # user's Category rows needs the user, so without one only the names are
+    # returned (see _resolve_extracted_category).
+    data['category_matches'] = [
+        cat_name for cat_name, keywords in rules.category_keywords
+        if not found_keywords.isdisjoint(keywords)
+    ]
+    trace.add('category_matches', matches=data['category_matches'])
     
-    if not data['category']:
-        print(f"📁 CATEGORY: None (will use fallback)")
+    if user is not None:
+        _resolve_extracted_category(data, user, trace)
 
     # SMART PAYMENT DETECTION
-    payment_indicators = {
-        'Credit Card': ['visa', 'mastercard', 'amex', 'discover', 'credit', 'card'],
-        'Cash': ['cash', 'cash payment'],
-        'Bank Transfer': ['transfer', 'online payment', 'e-payment'],
-    }
-    
-    for method, indicators in payment_indicators.items():
-        if any(ind in text_lower for ind in indicators):
+    for method, indicators in rules.payment_indicators:
+        if not found_keywords.isdisjoint(indicators):
             data['payment_method'] = method
-            print(f"💳 PAYMENT: {method}")
+            trace.add('payment', method=method,
+                      indicators=sorted(found_keywords.intersection(indicators)))
             break
-    
-    if not data['payment_method']:
-        data['payment_method'] = 'Cash'
-        print(f"💳 PAYMENT: Cash (default)")
 
     # Final confidence calculation
     data['confidence'] = min(data['confidence'], 1.0)
-    
-    print(f"\n{'='*70}")
-    print(f"FINAL EXTRACTION:")
-    print(f"  Amount: ${data['amount']}")
-    print(f"  Date: {data['date']}")
-    print(f"  Merchant: {data['merchant']}")
-    print(f"  Category: {data['category'].category_name if data['category'] else 'None'}")
-    print(f"  Payment: {data['payment_method']}")
-    print(f"  Confidence: {data['confidence']:.1%}")
-    print(f"{'='*70}\n")
+    trace.add('result', confidence=data['confidence'])
     
     return data
 
 
-def _smart_amount_detect(text):
+def _resolve_extracted_category(data, user, trace=NO_TRACE):
+    """
+    Picks the user's category for the first matched keyword family
+    and updates the confidence of an extraction result.
+    """
+    index = get_category_index(user)
+    for cat_name in data.get('category_matches', []):
+        cat = index.find(cat_name.split()[0])
+        if cat:
+            data['category'] = cat
+            data['confidence'] = min(data['confidence'] + 0.15, 1.0)
+            trace.add('category', category=cat_name)
+            return cat
+    
+    trace.add('category', category=None)
+    return None
+
+
+def _smart_amount_detect(text, trace=NO_TRACE):
     """
     Smart amount detection for voice/text input.
     Handles formats like: "$50", "50 dollars", "spent 50", "cost 50.99"
     """
+    text = _limit_input(text)
     text_lower = text.lower().strip()
     
     # Pattern 1: Dollar sign formats ($50, $50.99)
@@ -664,29 +328,31 @@ def _smart_amount_detect(text):
         try:
             amount = Decimal(match.group(1))
             if 0.01 <= amount <= 50000:
-                print(f"💰 Amount detected: ${amount} (from ${match.group(0)})")
+                trace.add('amount', amount=amount, pattern='dollar_sign', match=match.group(0))
                 return amount
         except:
             pass
     
-    # Pattern 2: Number + "dollars" or "bucks" (50 dollars, 25.50 bucks)
-    match = re.search(r'(\d+(?:\.\d{2})?)\s*(?:dollars?|bucks?|usd)', text_lower)
+    # Pattern 2: Number + "dollars" or "bucks" (50 dollars, 25.50 bucks).
+    # Only numbers starting after a non-digit: a later start in the same
+    # digit run can't match either, and retrying each is quadratic.
+    match = re.search(r'(?<!\d)(\d+(?:\.\d{2})?)\s*(?:dollars?|bucks?|usd)', text_lower)
     if match:
         try:
             amount = Decimal(match.group(1))
             if 0.01 <= amount <= 50000:
-                print(f"💰 Amount detected: ${amount} (from '{match.group(0)}')")
+                trace.add('amount', amount=amount, pattern='currency_word', match=match.group(0))
                 return amount
         except:
             pass
     
     # Pattern 3: Action words + number (spent 50, cost 25.99, paid 100)
-    match = re.search(r'(?:spent|cost|paid|price|total)\s*(?:of|was|is)?\s*\$?\s*(\d+(?:\.\d{2})?)', text_lower)
+    match = re.search(r'(?:spent|cost|paid|price|total)\s*(?:(?:of|was|is)\s*)?(?:\$\s*)?(\d+(?:\.\d{2})?)', text_lower)
     if match:
         try:
             amount = Decimal(match.group(1))
             if 0.01 <= amount <= 50000:
-                print(f"💰 Amount detected: ${amount} (from '{match.group(0)}')")
+                trace.add('amount', amount=amount, pattern='action_word', match=match.group(0))
                 return amount
         except:
             pass
@@ -697,7 +363,7 @@ def _smart_amount_detect(text):
         try:
             amount = Decimal(match.group(1))
             if 0.01 <= amount <= 50000:
-                print(f"💰 Amount detected: ${amount} (standalone)")
+                trace.add('amount', amount=amount, pattern='standalone')
                 return amount
         except:
             pass
@@ -708,94 +374,95 @@ def _smart_amount_detect(text):
         try:
             amount = Decimal(match.group(1))
             if 1 <= amount <= 10000:
-                print(f"💰 Amount detected: ${amount} (whole number)")
+                trace.add('amount', amount=amount, pattern='whole_number')
                 return Decimal(f"{amount}.00")
         except:
             pass
     
-    print("⚠️ No amount detected")
+    trace.add('amount', amount=None)
     return Decimal('0.00')
 
 
-def _smart_category_detect(text, user):
+# Keyword families for voice/text input, checked in order
+SPOKEN_CATEGORY_KEYWORDS = {
+    'Food & Dining': [
+        'food', 'lunch', 'dinner', 'breakfast', 'coffee', 'cafe', 'restaurant',
+        'burger', 'pizza', 'sushi', 'chinese', 'thai', 'italian', 'mexican',
+        'starbucks', 'mcdonald', 'burger king', 'kfc', 'subway', 'domino',
+        'ate', 'meal', 'snack', 'drink', 'eat', 'dining'
+    ],
+    'Groceries': [
+        'grocery', 'groceries', 'supermarket', 'walmart', 'target', 'costco',
+        'market', 'store', 'shopping', 'bought', 'milk', 'bread', 'eggs',
+        'vegetables', 'fruits', 'meat', 'cheese'
+    ],
+    'Transportation': [
+        'gas', 'fuel', 'petrol', 'diesel', 'uber', 'lyft', 'taxi', 'grab',
+        'parking', 'toll', 'bus', 'train', 'subway', 'metro', 'ride',
+        'shell', 'chevron', 'exxon', 'bp', 'transport', 'commute'
+    ],
+    'Shopping': [
+        'clothes', 'clothing', 'shirt', 'pants', 'shoes', 'dress', 'jacket',
+        'amazon', 'online', 'bought', 'purchased', 'mall', 'store',
+        'electronics', 'phone', 'laptop', 'gadget'
+    ],
+    'Entertainment': [
+        'movie', 'cinema', 'theater', 'concert', 'show', 'game', 'sports',
+        'netflix', 'spotify', 'subscription', 'gym', 'fitness'
+    ],
+    'Bills & Utilities': [
+        'bill', 'electric', 'electricity', 'water', 'internet', 'wifi',
+        'phone bill', 'utility', 'rent', 'mortgage', 'insurance'
+    ],
+    'Healthcare': [
+        'doctor', 'hospital', 'pharmacy', 'medicine', 'medical', 'clinic',
+        'dentist', 'prescription', 'drug', 'health'
+    ],
+}
+
+
+def _smart_category_detect(text, user, trace=NO_TRACE, index=None):
     """
     Smart category detection for voice/text input.
     Detects category based on keywords and merchant names.
+    Pass ``index`` to reuse one category index over many texts.
     """
+    text = _limit_input(text)
     text_lower = text.lower().strip()
     
-    # Category keyword mapping
-    category_keywords = {
-        'Food & Dining': [
-            'food', 'lunch', 'dinner', 'breakfast', 'coffee', 'cafe', 'restaurant',
-            'burger', 'pizza', 'sushi', 'chinese', 'thai', 'italian', 'mexican',
-            'starbucks', 'mcdonald', 'burger king', 'kfc', 'subway', 'domino',
-            'ate', 'meal', 'snack', 'drink', 'eat', 'dining'
-        ],
-        'Groceries': [
-            'grocery', 'groceries', 'supermarket', 'walmart', 'target', 'costco',
-            'market', 'store', 'shopping', 'bought', 'milk', 'bread', 'eggs',
-            'vegetables', 'fruits', 'meat', 'cheese'
-        ],
-        'Transportation': [
-            'gas', 'fuel', 'petrol', 'diesel', 'uber', 'lyft', 'taxi', 'grab',
-            'parking', 'toll', 'bus', 'train', 'subway', 'metro', 'ride',
-            'shell', 'chevron', 'exxon', 'bp', 'transport', 'commute'
-        ],
-        'Shopping': [
-            'clothes', 'clothing', 'shirt', 'pants', 'shoes', 'dress', 'jacket',
-            'amazon', 'online', 'bought', 'purchased', 'mall', 'store',
-            'electronics', 'phone', 'laptop', 'gadget'
-        ],
-        'Entertainment': [
-            'movie', 'cinema', 'theater', 'concert', 'show', 'game', 'sports',
-            'netflix', 'spotify', 'subscription', 'gym', 'fitness'
-        ],
-        'Bills & Utilities': [
-            'bill', 'electric', 'electricity', 'water', 'internet', 'wifi',
-            'phone bill', 'utility', 'rent', 'mortgage', 'insurance'
-        ],
-        'Healthcare': [
-            'doctor', 'hospital', 'pharmacy', 'medicine', 'medical', 'clinic',
-            'dentist', 'prescription', 'drug', 'health'
-        ],
-    }
-    
     # Check each category
-    for category_name, keywords in category_keywords.items():
+    if index is None:
+        index = get_category_index(user)
+    for category_name, keywords in SPOKEN_CATEGORY_KEYWORDS.items():
         if any(keyword in text_lower for keyword in keywords):
-            # Try to find matching category in database
-            cat = Category.objects.filter(
-                user=user,
-                category_name__icontains=category_name.split()[0]
-            ).first()
+            # Try to find the user's matching category
+            cat = index.find(category_name.split()[0])
             
             if cat:
-                print(f"📁 Category detected: {category_name} (matched: {[k for k in keywords if k in text_lower]})")
+                if trace.enabled:
+                    trace.add('category', category=category_name,
+                              matched=[k for k in keywords if k in text_lower])
                 return cat
     
-    print("⚠️ No category detected, using fallback")
+    trace.add('category', category=None)
     return None
 
 
-def _smart_merchant_detect(text):
+def _smart_merchant_detect(text, user=None, trace=NO_TRACE, dictionary=None):
     """
     Smart merchant detection for voice/text input.
+    Pass ``dictionary`` to reuse one merchant dictionary over many texts.
     """
+    text = _limit_input(text)
     text_lower = text.lower().strip()
     
-    # Common merchant names
-    known_merchants = [
-        'Starbucks', 'Walmart', 'Target', 'Amazon', 'Costco',
-        'McDonald\'s', 'Burger King', 'KFC', 'Subway', 'Domino\'s',
-        'Shell', 'Chevron', 'Uber', 'Lyft', 'Netflix', 'Spotify',
-        'Whole Foods', 'Trader Joe\'s', 'Safeway', 'Kroger'
-    ]
-    
-    for merchant in known_merchants:
-        if merchant.lower() in text_lower:
-            print(f"🏪 Merchant detected: {merchant}")
-            return merchant
+    # Known brands and the user's own merchants, the first one mentioned
+    if dictionary is None:
+        dictionary = get_merchant_dictionary(user)
+    match = dictionary.find(text_lower, spoken=True)
+    if match:
+        trace.add('merchant', source=match.source, merchant=match.merchant)
+        return match.merchant
     
     # Try to extract "at [merchant]" or "from [merchant]"
     patterns = [
@@ -808,37 +475,49 @@ def _smart_merchant_detect(text):
         if match:
             merchant = match.group(1).strip()
             if len(merchant) > 2:
-                print(f"🏪 Merchant detected: {merchant}")
+                trace.add('merchant', source='pattern', merchant=merchant)
                 return merchant
     
-    print("⚠️ No merchant detected")
+    trace.add('merchant', source=None)
     return None
 
 
-def _smart_date_detect(text):
+# "3 days ago"; longer numbers would overflow the date arithmetic
+_DAYS_AGO = re.compile(r'(?<!\d)(\d{1,3})\s*days?\s*ago')
+
+# Explicit dates in voice/text input (12/15/2024, 2024-12-15)
+SPOKEN_DATE_PATTERNS = (
+    (re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})'), date_parsing.NUMERIC, 'numeric'),
+    (re.compile(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})'), date_parsing.YEAR_MONTH_DAY, 'iso'),
+)
+
+
+def _smart_date_detect(text, trace=NO_TRACE, date_order=date_parsing.DEFAULT_ORDER):
     """
     Smart date detection for voice/text input.
     Handles: "yesterday", "today", "last Monday", "3 days ago", "12/15/2024"
+    Ambiguous numeric dates are read in ``date_order`` first.
     """
+    text = _limit_input(text)
     text_lower = text.lower().strip()
     today = timezone.now().date()
     
     # Relative dates
     if 'today' in text_lower:
-        print(f"📅 Date detected: {today} (today)")
+        trace.add('date', date=today, source='today')
         return today
     
     if 'yesterday' in text_lower:
         date = today - timedelta(days=1)
-        print(f"📅 Date detected: {date} (yesterday)")
+        trace.add('date', date=date, source='yesterday')
         return date
     
     # "X days ago"
-    match = re.search(r'(\d+)\s*days?\s*ago', text_lower)
+    match = _DAYS_AGO.search(text_lower)
     if match:
         days_ago = int(match.group(1))
         date = today - timedelta(days=days_ago)
-        print(f"📅 Date detected: {date} ({days_ago} days ago)")
+        trace.add('date', date=date, source='days_ago')
         return date
     
     # Weekday names (last Monday, Tuesday, etc.)
@@ -851,64 +530,160 @@ def _smart_date_detect(text):
             if days_back == 0:
                 days_back = 7  # Last week's same day
             date = today - timedelta(days=days_back)
-            print(f"📅 Date detected: {date} (last {day.title()})")
+            trace.add('date', date=date, source='weekday', weekday=day)
             return date
     
     # Explicit dates (12/15/2024, 2024-12-15)
-    date_patterns = [
-        (r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', ['%m/%d/%Y', '%d/%m/%Y']),
-        (r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})', ['%Y-%m-%d']),
-    ]
-    
-    for pattern, formats in date_patterns:
-        match = re.search(pattern, text)
+    for regex, layout, name in SPOKEN_DATE_PATTERNS:
+        match = regex.search(text)
         if match:
-            date_str = match.group(0)
-            for fmt in formats:
-                try:
-                    parsed_date = datetime.strptime(date_str, fmt).date()
-                    if (today - timedelta(days=730)) <= parsed_date <= today:
-                        print(f"📅 Date detected: {parsed_date} (explicit)")
-                        return parsed_date
-                except:
-                    continue
+            parsed_date = parse_date_match(match, layout, today, date_order, max_age_days=730)
+            if parsed_date:
+                trace.add('date', date=parsed_date, source='explicit', pattern=name)
+                return parsed_date
     
-    print(f"📅 Date defaulted to today: {today}")
+    trace.add('date', date=today, source='default')
     return today
 
 
-def _smart_payment_detect(text):
+def _smart_payment_detect(text, trace=NO_TRACE):
     """
     Smart payment method detection for voice/text input.
     """
+    text = _limit_input(text)
     text_lower = text.lower().strip()
     
     if any(word in text_lower for word in ['cash', 'paid cash']):
-        print("💳 Payment: Cash")
+        trace.add('payment', method='Cash')
         return 'Cash'
     
     if any(word in text_lower for word in ['card', 'credit', 'debit', 'visa', 'mastercard']):
-        print("💳 Payment: Credit Card")
+        trace.add('payment', method='Credit Card')
         return 'Credit Card'
     
     if any(word in text_lower for word in ['bank', 'transfer', 'online', 'paypal', 'venmo']):
-        print("💳 Payment: Bank Transfer")
+        trace.add('payment', method='Bank Transfer')
         return 'Bank Transfer'
     
-    print("💳 Payment: Cash (default)")
+    trace.add('payment', method='Cash', source='default')
     return 'Cash'
 
 
+def _learned_category(user, merchant, description, trace=NO_TRACE):
+    """
+    Category guessed from the user's own expenses (see categorizer.py), for
+    input no keyword family matched. None when there is no confident guess.
+    """
+    guess = predict_category(user.pk, merchant, description)
+    if guess is None:
+        return None
+    category = get_category_index(user).get(guess[0])
+    if category is not None:
+        trace.add('category', source='learned', category=category.category_name, probability=guess[1])
+    return category
+
+
+def _quick_add_parse(text, user, trace=NO_TRACE):
+    """
+    Run the voice/text detectors on a phrase (whitespace-normalized, see
+    quick_add.normalize_phrase). Phrases the user has entered before come
+    from their quick-add cache, except for the date, which is worked out
+    again every time; traced parses always run in full.
+
+    Returns a dict of amount, category (keyword match or None), merchant
+    (or None), date, payment_method and whether the parse was ``cached``.
+    """
+    phrase = quick_add.normalize_phrase(text)
+    version, parse = quick_add.lookup(user.pk, phrase)
+    cached = parse is not None and not trace.enabled
+
+    if cached:
+        category = get_category_index(user).get(parse.category_id) if parse.category_id else None
+    else:
+        amount = _smart_amount_detect(phrase, trace)
+        category = _smart_category_detect(phrase, user, trace)
+        merchant = _smart_merchant_detect(phrase, user, trace)
+        parse = quick_add.QuickAddParse(
+            amount=amount,
+            merchant=merchant,
+            category_id=category.pk if category else None,
+            payment_method=_smart_payment_detect(phrase, trace),
+        )
+        quick_add.store(user.pk, version, phrase, parse)
+
+    return {
+        'amount': parse.amount,
+        'category': category,
+        'merchant': parse.merchant,
+        'date': _smart_date_detect(phrase, trace, date_order_for(user)),
+        'payment_method': parse.payment_method,
+        'cached': cached,
+    }
+
+
 def _get_fallback_category(user):
     """Get or create Uncategorized category"""
-    cat, _ = Category.objects.get_or_create(
-        user=user, 
-        category_name='Uncategorized', 
-        defaults={'icon': '❓', 'color': '#6c757d'}
-    )
+    cat = get_category_index(user).fallback
+    if cat is None:
+        cat, _ = Category.objects.get_or_create(
+            user=user, 
+            category_name=FALLBACK_CATEGORY_NAME, 
+            defaults={'icon': '❓', 'color': '#6c757d'}
+        )
     return cat
 
 
+# Leading "-", "*", "•" or "1." / "1)" of pasted list items
+_BULK_BULLET = re.compile(r'^\s*(?:[-*\u2022]|\d{1,3}[.)])\s+')
+
+
+def _split_bulk_entries(text):
+    """One entry per non-blank line of pasted text, without list bullets."""
+    entries = []
+    for line in text.splitlines():
+        line = _BULK_BULLET.sub('', line).strip()
+        if line:
+            entries.append(line)
+    return entries
+
+
+def _smart_parse_entries(lines, user):
+    """
+    Run the voice/text detectors over many one-line entries. The category
+    index and merchant dictionary are looked up once, and learned categories
+    for lines no keyword family matched are predicted in one pass.
+    Returns the review grid's initial data, one dict per line.
+    """
+    fallback = _get_fallback_category(user)
+    index = get_category_index(user)
+    dictionary = get_merchant_dictionary(user)
+    date_order = date_order_for(user)
+
+    entries = []
+    for line in lines:
+        amount = _smart_amount_detect(line)
+        entries.append({
+            'include': amount > 0,
+            'source_text': line,
+            'amount': amount,
+            'category': _smart_category_detect(line, user, index=index),
+            'merchant_name': _smart_merchant_detect(line, user, dictionary=dictionary) or "Quick Add",
+            'expense_date': _smart_date_detect(line, date_order=date_order),
+            'payment_method': _smart_payment_detect(line),
+        })
+
+    missing = [entry for entry in entries if entry['category'] is None]
+    guesses = predict_categories(
+        user.pk, [(entry['merchant_name'], f"Text: {entry['source_text']}") for entry in missing]
+    )
+    for entry, guess in zip(missing, guesses):
+        entry['category'] = (guess and index.get(guess[0])) or fallback
+
+    for entry in entries:
+        entry['category'] = entry['category'].pk
+    return entries
+
+
 # ==========================================
 #  VIEWS
 # ==========================================
@@ -939,17 +714,21 @@ def expense_update(request, pk):
     user_curr = request.user.preferences.currency if hasattr(request.user, 'preferences') else 'USD'
     
     if request.method == 'POST':
+        old_merchant = expense.merchant_name
         form = ExpenseForm(request.POST, instance=expense)
         if form.is_valid():
             obj = form.save(commit=False)
             obj.currency = user_curr
-            obj.save()
+            with transaction.atomic():
+                obj.save()
+                # The user checked this name (and maybe fixed a misread one)
+                record_merchant_edit(request.user, old_merchant, obj.merchant_name)
             messages.success(request, 'Expense updated!')
             return redirect('expenses:list')
     else:
         initial = {}
         if expense.currency and expense.currency != user_curr:
-            converted = convert_amount(expense.amount, expense.currency, user_curr)
+            converted = convert_amount(expense.amount, expense.currency, user_curr, on=expense.expense_date)
             initial['amount'] = round(converted, 2)
         form = ExpenseForm(instance=expense, initial=initial)
     return render(request, 'expenses/expense_form.html', {'form': form, 'title': 'Edit Expense'})
@@ -968,65 +747,211 @@ def expense_detail(request, pk):
     expense = get_object_or_404(Expense, pk=pk, user=request.user)
     return render(request, 'expenses/expense_detail.html', {'expense': expense})
 
+def _receipt_perceptual_hash(file_name):
+    """Perceptual hash of a stored receipt image, or None when it can't be read."""
+    try:
+        with default_storage.open(file_name, 'rb') as fh:
+            return perceptual_hash(fh)
+    except Exception:
+        logger.warning("Perceptual hash failed for %s", file_name, exc_info=True)
+        return None
+
+def _warn_near_duplicate(request, phash, label=''):
+    """
+    A re-photographed or re-saved copy of a recent receipt only gets a warning:
+    different receipts can hash a few bits apart, so its OCR text isn't reused.
+    """
+    duplicate = find_near_duplicate(request.user, phash) if phash is not None else None
+    if not duplicate:
+        return
+    prefix = f"{label}: " if label else ""
+    if duplicate.expense:
+        messages.warning(
+            request,
+            f"⚠️ {prefix}This looks like a receipt you already uploaded on "
+            f"{duplicate.uploaded_at:%Y-%m-%d} ({duplicate.expense.merchant_name}, "
+            f"{duplicate.expense.amount}). Check you're not adding it twice."
+        )
+    else:
+        messages.warning(request, f"⚠️ {prefix}This looks like a receipt you uploaded recently.")
+
 @login_required
 def receipt_upload(request):
+    """
+    Stores the receipt and queues it for OCR.
+    The heavy work runs in `manage.py ocr_worker`; this page then polls
+    `receipt_job_status` and redirects to the edit page when it is done.
+    """
     if request.method == 'POST' and request.FILES.get('receipt_file'):
         uploaded_file = request.FILES['receipt_file']
-        
+
         try:
-            reader = easyocr.Reader(['en'], gpu=False)
-            file_bytes = uploaded_file.read()
-            result_list = reader.readtext(file_bytes, detail=0)
-            ocr_text = "\n".join(result_list)
-            print(f"\n{'='*70}")
-            print(f"OCR OUTPUT:")
-            print(ocr_text)
-            print(f"{'='*70}\n")
-        except Exception as e:
-            print(f"OCR Failed: {e}")
-            messages.error(request, "Failed to read image.")
+            file_name, content_hash = store_receipt_file(uploaded_file)
+        except ReceiptRejected as e:
+            messages.error(request, str(e))
             return redirect('expenses:receipt_upload')
 
-        extracted = _smart_extract(ocr_text, request.user)
-        
-        amount = extracted['amount'] or Decimal('0.00')
-        merchant = extracted['merchant'] or "Scanned Receipt"
-        category = extracted['category'] or _get_fallback_category(request.user)
-        user_curr = request.user.preferences.currency if hasattr(request.user, 'preferences') else 'USD'
+        # Same image uploaded before: reuse its OCR text instead of reading it again
+        ocr_text = find_ocr_text(content_hash)
+        phash = _receipt_perceptual_hash(file_name)
+        _warn_near_duplicate(request, phash)
 
-        with transaction.atomic():
-            expense = Expense.objects.create(
-                user=request.user,
-                category=category,
-                amount=amount,
-                currency=user_curr,
-                expense_date=extracted['date'],
-                merchant_name=merchant,
-                description=f"Scanned: {ocr_text[:100]}...",
-                payment_method=extracted['payment_method'],
-                entry_method='receipt_scan'
-            )
-            
-            uploaded_file.seek(0)
-            Receipt.objects.create(expense=expense, file=uploaded_file, ocr_text=ocr_text)
-            
-            AIExtraction.objects.create(
-                expense=expense,
-                raw_data={"text": ocr_text, "extracted": str(extracted)},
-                confidence_score=extracted['confidence'],
-                extraction_method='ocr_easyocr'
+        with removed_on_error(file_name), transaction.atomic():
+            receipt = Receipt.objects.create(
+                file=file_name,
+                file_type=(uploaded_file.content_type or '')[:50],
+                content_hash=content_hash,
+                perceptual_hash=f"{phash:016x}" if phash is not None else '',
+                ocr_text=ocr_text
             )
-            
-            check_budget_alerts(request.user)
+            job = OCRJob.objects.create(user=request.user, receipt=receipt)
 
-        if amount > 0:
-            messages.success(request, f"✅ Found ${amount} at {merchant}")
+        if phash is not None:
+            remember_perceptual_hash(request.user, phash, receipt.pk)
+
+        return redirect(f"{reverse('expenses:receipt_upload')}?job={job.pk}")
+
+    job = None
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        job = OCRJob.objects.filter(pk=job_id, user=request.user).first()
+
+    return render(request, 'expenses/receipt_upload.html', {'job': job})
+
+@login_required
+def receipt_job_status(request, pk):
+    """JSON status of a queued receipt, polled by the upload page."""
+    job = get_object_or_404(OCRJob.objects.select_related('receipt__expense'), pk=pk, user=request.user)
+    expense = job.receipt.expense
+
+    data = {
+        'id': job.pk,
+        'status': job.status,
+        'expense_id': expense.pk if expense else None,
+        'redirect_url': None,
+        'error': job.error if job.status == OCRJob.STATUS_FAILED else '',
+    }
+
+    if job.status == OCRJob.STATUS_DONE and expense:
+        data['redirect_url'] = reverse('expenses:update', kwargs={'pk': expense.pk})
+        if expense.amount > 0:
+            messages.success(request, f"✅ Found ${expense.amount} at {expense.merchant_name}")
         else:
             messages.warning(request, "⚠️ Could not find amount. Please verify.")
-            
-        return redirect('expenses:update', pk=expense.pk)
+    elif job.status == OCRJob.STATUS_FAILED:
+        messages.error(request, "Failed to read image.")
+
+    return JsonResponse(data)
+
+def _bulk_create_expenses(user, expenses, rates):
+    """
+    Insert a list of the user's expenses and make sure they have pks. MySQL
+    can't return ids from a multi-row INSERT, and reading them back would
+    race with other inserts, so there the rows are saved one by one.
+    Must run inside a transaction; ``rates`` is a rate snapshot taken
+    before it (see Expense.set_minor_amounts).
+    """
+    # bulk_create skips save(), and save() would fetch rates in the transaction
+    for expense in expenses:
+        expense.set_minor_amounts(rates)
+
+    if not connection.features.can_return_rows_from_bulk_insert:
+        for expense in expenses:
+            expense.save()
+        return expenses
+
+    created = Expense.objects.bulk_create(expenses)
+    if created:
+        # bulk_create sends no post_save, so the category model isn't updated
+        transaction.on_commit(lambda: forget_categorizer(user.pk))
+    return created
+
+@login_required
+def receipt_batch_upload(request):
+    """
+    Upload many receipts at once. Each one is stored, checked for near
+    duplicates and queued as an OCRJob, like a single upload, and read by
+    `manage.py ocr_worker`. The jobs share a batch id: the last one to
+    finish creates all of their expenses at once (see ocr_jobs.py). The
+    review page (``?jobs=...``) reloads itself until they are there.
+    """
+    if request.method != 'POST':
+        job_ids = [int(pk) for pk in request.GET.get('jobs', '').split(',') if pk.isdigit()]
+        if not job_ids:
+            return render(request, 'expenses/receipt_batch_upload.html')
+        return _receipt_batch_review(request, job_ids)
+
+    files = request.FILES.getlist('receipt_files')
+    max_files = getattr(settings, 'RECEIPT_BATCH_MAX_FILES', 25)
+    if not files:
+        messages.error(request, "Please choose at least one receipt.")
+        return redirect('expenses:receipt_batch_upload')
+    if len(files) > max_files:
+        messages.error(request, f"You can upload up to {max_files} receipts at a time.")
+        return redirect('expenses:receipt_batch_upload')
+
+    stored = []
+    for uploaded_file in files:
+        try:
+            file_name, content_hash = store_receipt_file(uploaded_file)
+        except ReceiptRejected as e:
+            messages.warning(request, f"{uploaded_file.name}: {e}")
+            continue
+
+        phash = _receipt_perceptual_hash(file_name)
+        _warn_near_duplicate(request, phash, uploaded_file.name)
+        stored.append((uploaded_file, file_name, content_hash, phash))
+
+    # All jobs are queued together, so no worker can finish the batch before
+    # its last receipt is in it
+    batch_id = uuid.uuid4()
+    receipts = []
+    job_ids = []
+    with ExitStack() as stack:
+        for _, file_name, _, _ in stored:
+            stack.enter_context(removed_on_error(file_name))
+        stack.enter_context(transaction.atomic())
+        for uploaded_file, file_name, content_hash, phash in stored:
+            receipt = Receipt.objects.create(
+                file=file_name,
+                file_type=(uploaded_file.content_type or '')[:50],
+                content_hash=content_hash,
+                perceptual_hash=f"{phash:016x}" if phash is not None else '',
+                ocr_text=find_ocr_text(content_hash)
+            )
+            receipts.append((receipt, phash))
+            job_ids.append(OCRJob.objects.create(user=request.user, receipt=receipt, batch_id=batch_id).pk)
+
+    for receipt, phash in receipts:
+        if phash is not None:
+            remember_perceptual_hash(request.user, phash, receipt.pk)
+
+    if not job_ids:
+        return redirect('expenses:receipt_batch_upload')
+    return redirect(f"{reverse('expenses:receipt_batch_upload')}?jobs={','.join(map(str, job_ids))}")
+
+def _receipt_batch_review(request, job_ids):
+    jobs = (
+        OCRJob.objects
+        .filter(user=request.user, pk__in=job_ids[:getattr(settings, 'RECEIPT_BATCH_MAX_FILES', 25)])
+        .select_related('receipt__expense__category')
+        .order_by('pk')
+    )
+    expenses = []
+    pending = failed = 0
+    for job in jobs:
+        if job.status == OCRJob.STATUS_FAILED:
+            failed += 1
+        elif job.status == OCRJob.STATUS_DONE and job.receipt.expense:
+            expenses.append(job.receipt.expense)
+        else:
+            pending += 1
 
-    return render(request, 'expenses/receipt_upload.html')
+    return render(request, 'expenses/receipt_batch_review.html', {
+        'expenses': expenses,
+        'pending': pending,
+        'failed': failed,
+    })
 
 @login_required
 def voice_input(request):
@@ -1041,24 +966,26 @@ def voice_input(request):
             messages.error(request, "Please provide voice input text.")
             return redirect('expenses:voice_input')
         
-        print(f"\n{'='*70}")
-        print(f"VOICE INPUT: {text}")
-        print(f"{'='*70}")
+        trace = start_trace('voice_input')
         
-        # Smart extraction
-        amount = _smart_amount_detect(text)
-        category = _smart_category_detect(text, request.user)
-        merchant = _smart_merchant_detect(text)
-        date = _smart_date_detect(text)
-        payment_method = _smart_payment_detect(text)
+        # Smart extraction (repeated phrases come from the quick-add cache)
+        parsed = _quick_add_parse(text, request.user, trace)
+        amount = parsed['amount']
+        category = parsed['category']
+        merchant = parsed['merchant']
+        date = parsed['date']
+        payment_method = parsed['payment_method']
         
         # Fallbacks
-        if not category:
-            category = _get_fallback_category(request.user)
-        
         if not merchant:
             merchant = "Voice Entry"
         
+        if not category:
+            category = (
+                _learned_category(request.user, merchant, f"Voice: {text}", trace)
+                or _get_fallback_category(request.user)
+            )
+        
         user_curr = request.user.preferences.currency if hasattr(request.user, 'preferences') else 'USD'
         
         with transaction.atomic():
@@ -1073,7 +1000,16 @@ def voice_input(request):
                 payment_method=payment_method,
                 entry_method='voice_input'
             )
+            if trace.enabled:
+                # Voice entries only get an AIExtraction row when traced
+                AIExtraction.objects.create(
+                    expense=expense,
+                    raw_data={"text": text},
+                    extraction_method='nlp_voice_processing',
+                    trace=trace.as_dict(),
+                )
             check_budget_alerts(request.user)
+        trace.emit()
         
         if amount > 0:
             messages.success(
@@ -1103,24 +1039,26 @@ def text_parse(request):
             messages.error(request, "Please provide text input.")
             return redirect('expenses:text_parse')
         
-        print(f"\n{'='*70}")
-        print(f"TEXT INPUT: {text}")
-        print(f"{'='*70}")
+        trace = start_trace('text_parse')
         
-        # Smart extraction
-        amount = _smart_amount_detect(text)
-        category = _smart_category_detect(text, request.user)
-        merchant = _smart_merchant_detect(text)
-        date = _smart_date_detect(text)
-        payment_method = _smart_payment_detect(text)
+        # Smart extraction (repeated phrases come from the quick-add cache)
+        parsed = _quick_add_parse(text, request.user, trace)
+        amount = parsed['amount']
+        category = parsed['category']
+        merchant = parsed['merchant']
+        date = parsed['date']
+        payment_method = parsed['payment_method']
         
         # Fallbacks
-        if not category:
-            category = _get_fallback_category(request.user)
-        
         if not merchant:
             merchant = "Quick Add"
         
+        if not category:
+            category = (
+                _learned_category(request.user, merchant, f"Text: {text}", trace)
+                or _get_fallback_category(request.user)
+            )
+        
         user_curr = request.user.preferences.currency if hasattr(request.user, 'preferences') else 'USD'
         
         with transaction.atomic():
@@ -1135,7 +1073,16 @@ def text_parse(request):
                 payment_method=payment_method,
                 entry_method='text_parsing'
             )
+            if trace.enabled:
+                # Text entries only get an AIExtraction row when traced
+                AIExtraction.objects.create(
+                    expense=expense,
+                    raw_data={"text": text},
+                    extraction_method='nlp_text_parsing',
+                    trace=trace.as_dict(),
+                )
             check_budget_alerts(request.user)
+        trace.emit()
         
         if amount > 0:
             messages.success(
@@ -1150,4 +1097,88 @@ def text_parse(request):
         
         return redirect('expenses:update', pk=expense.pk)
     
-    return render(request, 'expenses/text_parse.html')
\ No newline at end of file
+    return render(request, 'expenses/text_parse.html')
+
+@login_required
+def text_parse_preview(request):
+    """
+    What text_parse would save for ``?text=``, as JSON, for the live preview
+    while the user types. Uses the quick-add cache; nothing is saved.
+    """
+    text = request.GET.get('text', '').strip()
+    if not text:
+        return JsonResponse({'found': False})
+
+    parsed = _quick_add_parse(text, request.user)
+    merchant = parsed['merchant'] or "Quick Add"
+    category = (
+        parsed['category']
+        or _learned_category(request.user, merchant, f"Text: {text}")
+        or get_category_index(request.user).fallback
+    )
+
+    return JsonResponse({
+        'found': parsed['amount'] > 0,
+        'amount': str(parsed['amount']),
+        'merchant': merchant,
+        'category': f"{category.icon} {category.category_name}" if category else FALLBACK_CATEGORY_NAME,
+        'date': parsed['date'].isoformat(),
+        'payment_method': parsed['payment_method'],
+        'cached': parsed['cached'],
+    })
+
+@login_required
+def text_bulk_parse(request):
+    """
+    Bulk text parsing: paste many expenses, one per line (notes, a bank
+    statement). The lines are parsed together and shown in a review grid;
+    the ticked rows are saved with one bulk insert and one budget check.
+    """
+    if request.method != 'POST':
+        return render(request, 'expenses/text_bulk_parse.html')
+
+    if request.POST.get('action') == 'save':
+        formset = BulkTextEntryFormSet(request.POST, form_kwargs={'index': get_category_index(request.user)})
+        if formset.is_valid():
+            accepted = [form.cleaned_data for form in formset if form.cleaned_data.get('include')]
+            if not accepted:
+                messages.warning(request, "No rows were selected.")
+                return render(request, 'expenses/text_bulk_review.html', {'formset': formset})
+
+            user_curr = request.user.preferences.currency if hasattr(request.user, 'preferences') else 'USD'
+            rates = rate_snapshot(request)
+            with transaction.atomic():
+                expenses = _bulk_create_expenses(request.user, [
+                    Expense(
+                        user=request.user,
+                        category=data['category'],
+                        amount=data['amount'],
+                        currency=user_curr,
+                        expense_date=data['expense_date'],
+                        merchant_name=data['merchant_name'] or "Quick Add",
+                        description=f"Text: {data['source_text']}",
+                        payment_method=data['payment_method'],
+                        entry_method='text_parsing'
+                    )
+                    for data in accepted
+                ], rates)
+                check_budget_alerts(request.user)
+
+            messages.success(request, f"✅ Added {len(expenses)} expenses from text.")
+            return redirect('expenses:list')
+
+        messages.error(request, "Please fix the highlighted rows.")
+        return render(request, 'expenses/text_bulk_review.html', {'formset': formset})
+
+    lines = _split_bulk_entries(request.POST.get('raw_text', ''))
+    max_entries = getattr(settings, 'BULK_TEXT_MAX_ENTRIES', 100)
+    if not lines:
+        messages.error(request, "Please paste at least one expense.")
+        return redirect('expenses:text_bulk_parse')
+    if len(lines) > max_entries:
+        messages.error(request, f"You can add up to {max_entries} expenses at a time.")
+        return redirect('expenses:text_bulk_parse')
+
+    entries = _smart_parse_entries(lines, request.user)
+    formset = BulkTextEntryFormSet(initial=entries, form_kwargs={'index': get_category_index(request.user)})
+    return render(request, 'expenses/text_bulk_review.html', {'formset': formset})
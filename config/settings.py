@@ -73,6 +73,138 @@ LOGOUT_REDIRECT_URL = 'core:home'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are streamed to disk in chunks (hashed on the way) instead of being
+# held in memory. Keep the temp dir on the same filesystem as MEDIA_ROOT so
+# storing a receipt is a rename, but outside it: MEDIA_ROOT is served, and
+# half-uploaded, unvalidated files must not be.
+FILE_UPLOAD_HANDLERS = ['apps.expenses.upload_handlers.ReceiptUploadHandler']
+FILE_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'upload_tmp')
+RECEIPT_MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+RECEIPT_MAX_PIXELS = 40_000_000
+
+# Receipt OCR
+# Readers are loaded once per OCR worker process (`manage.py ocr_worker`) and
+# shared between jobs; web workers don't load them. Each worker runs
+# OCR_MAX_CONCURRENCY jobs at once unless started with --concurrency.
+OCR_LANGUAGES = ['en']
+OCR_USE_GPU = False
+OCR_READER_POOL_SIZE = int(os.environ.get('OCR_READER_POOL_SIZE', 1))
+OCR_MAX_CONCURRENCY = int(os.environ.get('OCR_MAX_CONCURRENCY', OCR_READER_POOL_SIZE))
+OCR_PREWARM_READERS = True
+
+# Engines are tried in order; the next one runs when an engine fails, times
+# out, or returns fewer than OCR_MIN_TEXT_CHARS letters and digits.
+OCR_ENGINES = os.environ.get('OCR_ENGINES', 'easyocr').split(',')
+OCR_ENGINE_TIMEOUTS = {'easyocr': 60, 'tesseract': 20}  # Seconds per call
+OCR_MIN_TEXT_CHARS = 10
+TESSERACT_CMD = os.environ.get('TESSERACT_CMD')  # None: use tesseract from PATH
+
+# Uploaded receipts are queued and processed by `manage.py ocr_worker`.
+OCR_JOB_TIMEOUT = 300        # Seconds before a 'processing' job is considered abandoned
+OCR_JOB_MAX_ATTEMPTS = 3
+
+# Image clean-up before OCR (see `manage.py benchmark_preprocessing`).
+OCR_PREPROCESS = True
+OCR_MAX_LONG_EDGE = 1600     # Pixels; None keeps the original resolution
+OCR_CONTRAST_NORMALIZE = True
+OCR_DESKEW = False
+OCR_AUTO_CROP = False
+
+# Fast path (EasyOCR only): detect all text, but recognize just the top and
+# bottom lines plus lines next to total/date keywords. Everything is read
+# when the amount or date is missing or confidence is below these values;
+# otherwise the full text is filled in later by a background job.
+OCR_ROI_FAST_PATH = True
+OCR_ROI_TOP_LINES = 4
+OCR_ROI_BOTTOM_LINES = 10
+OCR_ROI_MIN_CONFIDENCE = 0.9
+OCR_ROI_MIN_TEXT_CONFIDENCE = 0.5
+
+# Batch receipt upload: each file is queued as its own OCR job.
+RECEIPT_BATCH_MAX_FILES = 25
+
+# Near-duplicate receipts: uploads whose perceptual hash is within this many
+# bits of one of the user's recent receipts get a "possible duplicate"
+# warning. Only an exact content match reuses OCR text; different receipts
+# of the same layout can be as few as 4 bits apart, so keep this below that.
+RECEIPT_PHASH_MAX_DISTANCE = 2
+RECEIPT_PHASH_INDEX_SIZE = 50          # Recent hashes kept per user (least recently used go first)
+RECEIPT_PHASH_INDEX_TTL = 7 * 86400    # Seconds
+
+# Category lookups during smart input use a per-process copy of each user's
+# categories, invalidated through the cache when a category changes.
+CATEGORY_INDEX_LOCAL_SIZE = 256         # Users whose index is kept per process
+CATEGORY_INDEX_VERSION_TTL = 5          # Seconds between checks of a user's version in the cache
+
+# Merchant dictionary (built-in brands + merchants learned from manual entries
+# and edits). New entries reach other processes through a per-user log in the
+# cache; the log is rebuilt from the database when it expires or grows past
+# MERCHANT_DICTIONARY_MAX_LOG entries.
+MERCHANT_DICTIONARY_TTL = 7 * 86400     # Seconds
+MERCHANT_DICTIONARY_MAX_LOG = 2000
+MERCHANT_DICTIONARY_LOCAL_SIZE = 256    # Users whose trie is kept per process
+
+# Learned categories: when no keyword family matches, a per-user naive Bayes
+# over merchant and description words picks the category if it is at least
+# this sure and the user has enough categorized expenses.
+CATEGORIZER_MIN_EXAMPLES = 10
+CATEGORIZER_MIN_PROBABILITY = 0.6
+CATEGORIZER_TTL = 7 * 86400             # Seconds the word counts stay cached
+CATEGORIZER_MAX_DELTAS = 1000           # New expenses added to a model before it is retrained
+CATEGORIZER_LOCAL_SIZE = 256            # Users whose model is kept per process
+
+# Quick add: parsed voice/text phrases kept per process, per user, for
+# this many users; dropped when the user's categories or merchants change.
+QUICK_ADD_CACHE_USERS = 256
+QUICK_ADD_CACHE_PHRASES = 128
+
+# Bulk text parsing: most lines (expenses) accepted from one paste.
+BULK_TEXT_MAX_ENTRIES = 100
+
+# Smart input parsers only read this much of their (untrusted) input;
+# `manage.py fuzz_parsers` checks their latency up to these sizes.
+SMART_INPUT_MAX_CHARS = 1000       # Voice / text entries
+RECEIPT_TEXT_MAX_CHARS = 10000     # OCR text of one receipt
+
+# Extraction traces (amount candidates, matched keywords, date pattern, ...).
+# Every extraction is traced while EXTRACTION_LOG_LEVEL is DEBUG; otherwise
+# this fraction of them is, and their trace is kept on AIExtraction.trace.
+EXTRACTION_TRACE_SAMPLE_RATE = float(os.environ.get('EXTRACTION_TRACE_SAMPLE_RATE', 0))
+
+# Expense.base_amount is stored in this currency; changing it needs
+# `manage.py backfill_base_amounts --all`.
+BASE_CURRENCY = 'USD'
+
+# Exchange rates (apps/core/currency_rates.py). Rates older than MAX_AGE
+# are still served while one process refreshes them in the background;
+# run `manage.py refresh_currency_rates` from cron to refresh them ahead of
+# time (and set BACKGROUND_REFRESH off to leave it to cron). The source is
+# a dotted path to a function returning {currency: units per USD};
+# 'apps.core.currency_rates.static_rates' keeps tests and development offline.
+CURRENCY_RATES_SOURCE = os.environ.get('CURRENCY_RATES_SOURCE', 'apps.core.currency_rates.fetch_api_rates')
+CURRENCY_RATES_MAX_AGE = 86400
+CURRENCY_RATES_STALE_TTL = 7 * 86400
+CURRENCY_RATES_RETRY_AFTER = 300   # After a failed refresh
+CURRENCY_RATES_FETCH_TIMEOUT = 5
+CURRENCY_RATES_BACKGROUND_REFRESH = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'apps': {
+            'handlers': ['console'],
+            'level': os.environ.get('APP_LOG_LEVEL', 'INFO'),
+        },
+        'apps.expenses.extraction': {
+            'level': os.environ.get('EXTRACTION_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -116,6 +248,35 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# Must be shared by every process: web workers and `manage.py ocr_worker`.
+# The per-user version tokens that invalidate each process's in-memory copies
+# (category index, merchant dictionary, categorizer, quick-add parses, rate
+# history), the near-duplicate receipt index and the exchange-rate refresh
+# lock all live here, so a per-process cache would leave other processes
+# stale. Those tokens are read on every smart-input parse, so it should be
+# an in-memory one: set REDIS_URL to use Redis (needs the `redis` package).
+# Without it, Django's per-process LocMemCache is used, which only suits a
+# single development server: `manage.py check` warns about it, and
+# `manage.py check --deploy` fails (see apps/core/checks.py).
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 